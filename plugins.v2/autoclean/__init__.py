@@ -1,22 +1,28 @@
+import threading
 import time
 from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 from typing import Any, List, Dict, Tuple, Optional
 
 import pytz
 from apscheduler.schedulers.background import BackgroundScheduler
 from apscheduler.triggers.cron import CronTrigger
+from sqlalchemy.orm import Session
 
 from app import schemas
 from app.chain.storage import StorageChain
 from app.core.config import settings
 from app.core.event import eventmanager
+from app.db import db_query
 from app.db.downloadhistory_oper import DownloadHistoryOper
+from app.db.models.transferhistory import TransferHistory
 from app.db.transferhistory_oper import TransferHistoryOper
 from app.log import logger
 from app.plugins import _PluginBase
 from app.schemas import NotificationType, DownloadHistory
 from app.schemas.types import EventType
+from app.utils.string import StringUtils
 
 
 class AutoClean(_PluginBase):
@@ -49,6 +55,12 @@ class AutoClean(_PluginBase):
     _cleantype = None
     _cleandate = None
     _cleanuser = None
+    _dryrun = False
+    # 删除文件的线程数
+    _delete_workers = 8
+    # 每种存储同时删除文件的数量
+    _storage_limits = {"local": 4}
+    _default_storage_limit = 2
 
     # 定时器
     _scheduler: Optional[BackgroundScheduler] = None
@@ -65,6 +77,7 @@ class AutoClean(_PluginBase):
             self._cleantype = config.get("cleantype")
             self._cleandate = config.get("cleandate")
             self._cleanuser = config.get("cleanuser")
+            self._dryrun = config.get("dryrun")
 
             # 加载模块
         if self._enabled:
@@ -85,6 +98,7 @@ class AutoClean(_PluginBase):
                     "enabled": self._enabled,
                     "cleanuser": self._cleanuser,
                     "notify": self._notify,
+                    "dryrun": self._dryrun,
                 })
 
                 # 启动任务
@@ -177,72 +191,132 @@ class AutoClean(_PluginBase):
             # 将DownloadHistory对象添加到对应分组的列表中
             downloadhis_grouped_dict[(dtype, tmdbid)].append(downloadhis)
 
-        # 输出分组结果
+        # 一次性查询所有hash对应的转移记录
+        transferhis_dict = self.__list_transferhis_by_hashes(
+            list({downloadhis.download_hash for downloadhis in downloadhis_list if downloadhis.download_hash}))
+
+        # 汇总待清理的转移记录及文件
+        clean_groups: List[Tuple[tuple, List[DownloadHistory], List[TransferHistory]]] = []
+        dest_fileitems: Dict[int, schemas.FileItem] = {}
+        src_fileitems: Dict[int, schemas.FileItem] = {}
         for key, downloadhis_list in downloadhis_grouped_dict.items():
-            logger.info(f"开始清理 {key}")
-            del_transferhis_cnt = 0
-            del_media_name = downloadhis_list[0].title
-            del_media_user = downloadhis_list[0].username
-            del_media_type = downloadhis_list[0].type
-            del_media_year = downloadhis_list[0].year
-            del_media_season = downloadhis_list[0].seasons
-            del_media_episode = downloadhis_list[0].episodes
-            del_image = downloadhis_list[0].image
+            transferhis_list: Dict[int, TransferHistory] = {}
             for downloadhis in downloadhis_list:
                 if not downloadhis.download_hash:
                     logger.debug(f'下载历史 {downloadhis.id} {downloadhis.title} 未获取到download_hash，跳过处理')
                     continue
                 # 根据hash获取转移记录
-                transferhis_list = _transferhis.list_by_hash(download_hash=downloadhis.download_hash)
-                if not transferhis_list:
+                hash_transferhis = transferhis_dict.get(downloadhis.download_hash)
+                if not hash_transferhis:
                     logger.warn(f"下载历史 {downloadhis.download_hash} 未查询到转移记录，跳过处理")
                     continue
+                for history in hash_transferhis:
+                    transferhis_list[history.id] = history
+            for history in transferhis_list.values():
+                if clean_type in ["dest", "all"] and history.dest_fileitem:
+                    dest_fileitems[history.id] = schemas.FileItem(**history.dest_fileitem)
+                if clean_type in ["src", "all"] and history.src_fileitem:
+                    src_fileitems[history.id] = schemas.FileItem(**history.src_fileitem)
+            clean_groups.append((key, downloadhis_list, list(transferhis_list.values())))
+
+        # 清理前输出汇总
+        total_size = sum(fileitem.size or 0 for fileitem in [*dest_fileitems.values(), *src_fileitems.values()])
+        logger.info(f"日期 {date} 之前待清理：媒体 {len([g for g in clean_groups if g[2]])} 个，"
+                    f"转移记录 {sum(len(g[2]) for g in clean_groups)} 条，"
+                    f"媒体库文件 {len(dest_fileitems)} 个，源文件 {len(src_fileitems)} 个，"
+                    f"共 {StringUtils.str_filesize(total_size)}")
+        if self._dryrun:
+            logger.info("预览模式，不执行清理")
+            return
 
-                for history in transferhis_list:
-                    # 册除媒体库文件
-                    if clean_type in ["dest", "all"]:
-                        dest_fileitem = schemas.FileItem(**history.dest_fileitem)
-                        StorageChain().delete_file(dest_fileitem)
-                        # 删除记录
-                        _transferhis.delete(history.id)
-                    # 删除源文件
-                    if clean_type in ["src", "all"]:
-                        src_fileitem = schemas.FileItem(**history.src_fileitem)
-                        StorageChain().delete_file(src_fileitem)
-                        # 发送事件
-                        eventmanager.send_event(
-                            EventType.DownloadFileDeleted,
-                            {
-                                "src": history.src
-                            }
-                        )
-
-                # 累加删除数量
-                del_transferhis_cnt += len(transferhis_list)
-
-            if del_transferhis_cnt:
-                # 发送消息
-                if self._notify:
-                    self.post_message(
-                        mtype=NotificationType.MediaServer,
-                        title="【定时清理媒体库任务完成】",
-                        text=f"清理媒体名称 {del_media_name}\n"
-                             f"下载媒体用户 {del_media_user}\n"
-                             f"删除历史记录 {del_transferhis_cnt}")
-
-                pulgin_history.append({
-                    "type": del_media_type,
-                    "title": del_media_name,
-                    "year": del_media_year,
-                    "season": del_media_season,
-                    "episode": del_media_episode,
-                    "image": del_image,
-                    "del_time": time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(time.time()))
-                })
+        # 并发删除文件
+        self.__delete_fileitems([*dest_fileitems.values(), *src_fileitems.values()])
+
+        # 输出分组结果
+        for key, downloadhis_list, transferhis_list in clean_groups:
+            if not transferhis_list:
+                continue
+            logger.info(f"开始清理 {key}")
+            del_media_name = downloadhis_list[0].title
+            del_media_user = downloadhis_list[0].username
+            del_media_type = downloadhis_list[0].type
+            del_media_year = downloadhis_list[0].year
+            del_media_season = downloadhis_list[0].seasons
+            del_media_episode = downloadhis_list[0].episodes
+            del_image = downloadhis_list[0].image
+            for history in transferhis_list:
+                # 删除记录
+                if clean_type in ["dest", "all"]:
+                    _transferhis.delete(history.id)
+                # 发送事件
+                if clean_type in ["src", "all"]:
+                    eventmanager.send_event(
+                        EventType.DownloadFileDeleted,
+                        {
+                            "src": history.src
+                        }
+                    )
+            # 累加删除数量
+            del_transferhis_cnt = len(transferhis_list)
+
+            # 发送消息
+            if self._notify:
+                self.post_message(
+                    mtype=NotificationType.MediaServer,
+                    title="【定时清理媒体库任务完成】",
+                    text=f"清理媒体名称 {del_media_name}\n"
+                         f"下载媒体用户 {del_media_user}\n"
+                         f"删除历史记录 {del_transferhis_cnt}")
+
+            pulgin_history.append({
+                "type": del_media_type,
+                "title": del_media_name,
+                "year": del_media_year,
+                "season": del_media_season,
+                "episode": del_media_episode,
+                "image": del_image,
+                "del_time": time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(time.time()))
+            })
 
         # 保存历史
         self.save_data("history", pulgin_history)
 
+    @staticmethod
+    @db_query
+    def __list_transferhis_by_hashes(hashes: List[str], db: Session = None) -> Dict[str, List[TransferHistory]]:
+        """
+        批量查询下载hash对应的转移记录
+        """
+        result: Dict[str, List[TransferHistory]] = defaultdict(list)
+        for i in range(0, len(hashes), 500):
+            chunk = hashes[i:i + 500]
+            for history in db.query(TransferHistory).filter(TransferHistory.download_hash.in_(chunk)).all():
+                result[history.download_hash].append(history)
+        return result
+
+    def __delete_fileitems(self, fileitems: List[schemas.FileItem]):
+        """
+        并发删除文件，按存储类型限制同时删除的数量
+        """
+        if not fileitems:
+            return
+        storagechain = StorageChain()
+        semaphores = {
+            storage: threading.BoundedSemaphore(self._storage_limits.get(storage, self._default_storage_limit))
+            for storage in {fileitem.storage for fileitem in fileitems}
+        }
+
+        def delete_file(fileitem: schemas.FileItem):
+            with semaphores[fileitem.storage]:
+                try:
+                    return storagechain.delete_file(fileitem)
+                except Exception as e:
+                    logger.error(f"删除文件 {fileitem.path} 失败：{str(e)}")
+                    return False
+
+        with ThreadPoolExecutor(max_workers=self._delete_workers) as executor:
+            list(executor.map(delete_file, fileitems))
+
     def get_state(self) -> bool:
         return self._enabled
 
@@ -290,7 +364,7 @@ class AutoClean(_PluginBase):
                                 'component': 'VCol',
                                 'props': {
                                     'cols': 12,
-                                    'md': 4
+                                    'md': 3
                                 },
                                 'content': [
                                     {
@@ -306,7 +380,7 @@ class AutoClean(_PluginBase):
                                 'component': 'VCol',
                                 'props': {
                                     'cols': 12,
-                                    'md': 4
+                                    'md': 3
                                 },
                                 'content': [
                                     {
@@ -322,7 +396,7 @@ class AutoClean(_PluginBase):
                                 'component': 'VCol',
                                 'props': {
                                     'cols': 12,
-                                    'md': 4
+                                    'md': 3
                                 },
                                 'content': [
                                     {
@@ -333,6 +407,22 @@ class AutoClean(_PluginBase):
                                         }
                                     }
                                 ]
+                            },
+                            {
+                                'component': 'VCol',
+                                'props': {
+                                    'cols': 12,
+                                    'md': 3
+                                },
+                                'content': [
+                                    {
+                                        'component': 'VSwitch',
+                                        'props': {
+                                            'model': 'dryrun',
+                                            'label': '仅预览不删除',
+                                        }
+                                    }
+                                ]
                             }
                         ]
                     },
@@ -429,6 +519,7 @@ class AutoClean(_PluginBase):
             "enabled": False,
             "onlyonce": False,
             "notify": False,
+            "dryrun": False,
             "cleantype": "dest",
             "cron": "",
             "cleanuser": "",
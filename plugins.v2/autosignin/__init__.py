@@ -1,6 +1,8 @@
 import re
 import traceback
 from datetime import datetime, timedelta
+from functools import partial
+from pathlib import Path
 from multiprocessing.dummy import Pool as ThreadPool
 from multiprocessing.pool import ThreadPool
 from typing import Any, List, Dict, Tuple, Optional
@@ -17,10 +19,11 @@ from app.core.event import eventmanager, Event
 from app.db.site_oper import SiteOper
 from app.helper.browser import PlaywrightHelper
 from app.helper.cloudflare import under_challenge
-from app.helper.module import ModuleHelper
 from app.helper.sites import SitesHelper
 from app.log import logger
 from app.plugins import _PluginBase
+from app.plugins.autosignin.schema_registry import SiteSchemaRegistry
+from app.plugins.autosignin.session_pool import SessionPool
 from app.schemas.types import EventType, NotificationType
 from app.utils.http import RequestUtils
 from app.utils.site import SiteUtils
@@ -50,8 +53,8 @@ class AutoSignIn(_PluginBase):
 
     # 定时器
     _scheduler: Optional[BackgroundScheduler] = None
-    # 加载的模块
-    _site_schema: list = []
+    # 站点签到模块注册表
+    _site_registry: Optional[SiteSchemaRegistry] = None
 
     # 配置属性
     _enabled: bool = False
@@ -66,6 +69,8 @@ class AutoSignIn(_PluginBase):
     _start_time: int = None
     _end_time: int = None
     _auto_cf: int = 0
+    # 仿真站点共用浏览器的上下文上限
+    _browser_contexts: int = 3
 
     def init_plugin(self, config: dict = None):
 
@@ -96,8 +101,8 @@ class AutoSignIn(_PluginBase):
         # 加载模块
         if self._enabled or self._onlyonce:
 
-            self._site_schema = ModuleHelper.load('app.plugins.autosignin.sites',
-                                                  filter_func=lambda _, obj: hasattr(obj, 'match'))
+            self._site_registry = SiteSchemaRegistry(package='app.plugins.autosignin.sites',
+                                                     path=Path(__file__).parent / "sites")
 
             # 立即运行一次
             if self._onlyonce:
@@ -1347,14 +1352,24 @@ class AutoSignIn(_PluginBase):
             logger.info(f"没有需要{type_str}的站点")
             return
 
+        # 历史耗时长的站点优先执行
+        site_timing = self.get_data("site_timing") or {}
+        do_sites = sorted(do_sites, key=lambda x: site_timing.get(str(x.get("id")), 0), reverse=True)
+
         # 执行签到
         logger.info(f"开始执行{type_str}任务 ...")
-        if type_str == "签到":
-            with ThreadPool(min(len(do_sites), int(self._queue_cnt))) as p:
-                status = p.map(self.signin_site, do_sites)
-        else:
+        timing = {}
+        session_pool = SessionPool(browser_size=min(int(self._queue_cnt), self._browser_contexts))
+        try:
+            func = self.signin_site if type_str == "签到" else self.login_site
             with ThreadPool(min(len(do_sites), int(self._queue_cnt))) as p:
-                status = p.map(self.login_site, do_sites)
+                status = p.map(partial(func, session_pool=session_pool, timing=timing), do_sites, chunksize=1)
+        finally:
+            session_pool.close()
+        # 记录站点耗时
+        if timing:
+            site_timing.update(timing)
+            self.save_data("site_timing", site_timing)
 
         if status:
             logger.info(f"站点{type_str}任务完成！")
@@ -1476,13 +1491,9 @@ class AutoSignIn(_PluginBase):
         self.__update_config()
 
     def __build_class(self, url) -> Any:
-        for site_schema in self._site_schema:
-            try:
-                if site_schema.match(url):
-                    return site_schema
-            except Exception as e:
-                logger.error("站点模块加载失败：%s" % str(e))
-        return None
+        if not self._site_registry:
+            return None
+        return self._site_registry.get(url)
 
     def signin_by_domain(self, url: str, apikey: str) -> schemas.Response:
         """
@@ -1505,7 +1516,8 @@ class AutoSignIn(_PluginBase):
                 message=f"站点【{site_name}】{message or '签到成功'}"
             )
 
-    def signin_site(self, site_info: CommentedMap) -> Tuple[str, str]:
+    def signin_site(self, site_info: CommentedMap, session_pool: SessionPool = None,
+                    timing: dict = None) -> Tuple[str, str]:
         """
         签到一个站点
         """
@@ -1519,9 +1531,11 @@ class AutoSignIn(_PluginBase):
                 traceback.print_exc()
                 state, message = False, f"签到失败：{str(e)}"
         else:
-            state, message = self.__signin_base(site_info)
+            state, message = self.__signin_base(site_info, session_pool)
         # 统计
         seconds = (datetime.now() - start_time).seconds
+        if timing is not None and site_info.get("id"):
+            timing[str(site_info.get("id"))] = round((datetime.now() - start_time).total_seconds(), 2)
         domain = StringUtils.get_url_domain(site_info.get('url'))
         if state:
             SiteOper().success(domain=domain, seconds=seconds)
@@ -1530,10 +1544,11 @@ class AutoSignIn(_PluginBase):
         return site_info.get("name"), message
 
     @staticmethod
-    def __signin_base(site_info: CommentedMap) -> Tuple[bool, str]:
+    def __signin_base(site_info: CommentedMap, session_pool: SessionPool = None) -> Tuple[bool, str]:
         """
         通用签到处理
         :param site_info: 站点信息
+        :param session_pool: 本次任务的会话池，为空时每次新建浏览器和连接
         :return: 签到结果信息
         """
         if not site_info:
@@ -1557,10 +1572,11 @@ class AutoSignIn(_PluginBase):
                 checkin_url = urljoin(site_url, "attendance.php")
             logger.info(f"开始站点签到：{site}，地址：{checkin_url}...")
             if render:
-                page_source = PlaywrightHelper().get_page_source(url=checkin_url,
-                                                                 cookies=site_cookie,
-                                                                 ua=ua,
-                                                                 proxies=proxy_server)
+                browser = session_pool.browser if session_pool else PlaywrightHelper()
+                page_source = browser.get_page_source(url=checkin_url,
+                                                      cookies=site_cookie,
+                                                      ua=ua,
+                                                      proxies=proxy_server)
                 if not SiteUtils.is_logged_in(page_source):
                     if under_challenge(page_source):
                         return False, f"无法通过Cloudflare！"
@@ -1572,16 +1588,14 @@ class AutoSignIn(_PluginBase):
                         return True, f"签到成功"
                     return True, "仿真签到成功"
             else:
-                res = RequestUtils(cookies=site_cookie,
-                                   ua=ua,
-                                   proxies=proxies
-                                   ).get_res(url=checkin_url)
+                if session_pool:
+                    request = session_pool.request(url=site_url, cookies=site_cookie, ua=ua, proxies=proxies)
+                else:
+                    request = RequestUtils(cookies=site_cookie, ua=ua, proxies=proxies)
+                res = request.get_res(url=checkin_url)
                 if not res and site_url != checkin_url:
                     logger.info(f"开始站点模拟登录：{site}，地址：{site_url}...")
-                    res = RequestUtils(cookies=site_cookie,
-                                       ua=ua,
-                                       proxies=proxies
-                                       ).get_res(url=site_url)
+                    res = request.get_res(url=site_url)
                 # 判断登录状态
                 if res and res.status_code in [200, 500, 403]:
                     if not SiteUtils.is_logged_in(res.text):
@@ -1607,7 +1621,8 @@ class AutoSignIn(_PluginBase):
             traceback.print_exc()
             return False, f"签到失败：{str(e)}！"
 
-    def login_site(self, site_info: CommentedMap) -> Tuple[str, str]:
+    def login_site(self, site_info: CommentedMap, session_pool: SessionPool = None,
+                   timing: dict = None) -> Tuple[str, str]:
         """
         模拟登录一个站点
         """
@@ -1621,9 +1636,11 @@ class AutoSignIn(_PluginBase):
                 traceback.print_exc()
                 state, message = False, f"模拟登录失败：{str(e)}"
         else:
-            state, message = self.__login_base(site_info)
+            state, message = self.__login_base(site_info, session_pool)
         # 统计
         seconds = (datetime.now() - start_time).seconds
+        if timing is not None and site_info.get("id"):
+            timing[str(site_info.get("id"))] = round((datetime.now() - start_time).total_seconds(), 2)
         domain = StringUtils.get_url_domain(site_info.get('url'))
         if state:
             SiteOper().success(domain=domain, seconds=seconds)
@@ -1632,10 +1649,11 @@ class AutoSignIn(_PluginBase):
         return site_info.get("name"), message
 
     @staticmethod
-    def __login_base(site_info: CommentedMap) -> Tuple[bool, str]:
+    def __login_base(site_info: CommentedMap, session_pool: SessionPool = None) -> Tuple[bool, str]:
         """
         模拟登录通用处理
         :param site_info: 站点信息
+        :param session_pool: 本次任务的会话池，为空时每次新建浏览器和连接
         :return: 签到结果信息
         """
         if not site_info:
@@ -1656,10 +1674,11 @@ class AutoSignIn(_PluginBase):
             site_url = str(site_url).replace("attendance.php", "")
             logger.info(f"开始站点模拟登录：{site}，地址：{site_url}...")
             if render:
-                page_source = PlaywrightHelper().get_page_source(url=site_url,
-                                                                 cookies=site_cookie,
-                                                                 ua=ua,
-                                                                 proxies=proxy_server)
+                browser = session_pool.browser if session_pool else PlaywrightHelper()
+                page_source = browser.get_page_source(url=site_url,
+                                                      cookies=site_cookie,
+                                                      ua=ua,
+                                                      proxies=proxy_server)
                 if not SiteUtils.is_logged_in(page_source):
                     if under_challenge(page_source):
                         return False, f"无法通过Cloudflare！"
@@ -1667,10 +1686,11 @@ class AutoSignIn(_PluginBase):
                 else:
                     return True, "模拟登录成功"
             else:
-                res = RequestUtils(cookies=site_cookie,
-                                   ua=ua,
-                                   proxies=proxies
-                                   ).get_res(url=site_url)
+                if session_pool:
+                    request = session_pool.request(url=site_url, cookies=site_cookie, ua=ua, proxies=proxies)
+                else:
+                    request = RequestUtils(cookies=site_cookie, ua=ua, proxies=proxies)
+                res = request.get_res(url=site_url)
                 # 判断登录状态
                 if res and res.status_code in [200, 500, 403]:
                     if not SiteUtils.is_logged_in(res.text):
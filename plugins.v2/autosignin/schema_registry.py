@@ -0,0 +1,122 @@
+import ast
+import importlib
+import threading
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+from urllib.parse import urlparse
+
+from app.log import logger
+
+
+class SiteSchemaRegistry:
+    """
+    站点签到模块注册表
+    通过静态解析sites目录下各模块声明的site_url建立域名索引，只在站点首次命中时才导入对应模块
+    无法静态解析site_url的模块会在首次查询时全部导入，按原有方式逐个调用match
+    """
+
+    def __init__(self, package: str, path: Path):
+        self._package = package
+        self._path = path
+        self._lock = threading.RLock()
+        # site_url -> 模块名
+        self._index: Dict[str, List[str]] = {}
+        # 未声明字面量site_url的模块名
+        self._dynamic: List[str] = []
+        # 模块名 -> 签到类列表
+        self._loaded: Dict[str, List[Any]] = {}
+        # url -> 签到类
+        self._resolved: Dict[str, Any] = {}
+        self.__scan()
+
+    def __scan(self):
+        """
+        解析模块源码，读取类属性site_url
+        """
+        for file in sorted(self._path.glob("*.py")):
+            name = file.stem
+            if name.startswith("_"):
+                continue
+            try:
+                tree = ast.parse(file.read_text(encoding="utf-8"))
+            except Exception as e:
+                logger.error(f"站点模块 {name} 解析失败：{str(e)}")
+                continue
+            site_urls = []
+            for node in tree.body:
+                if not isinstance(node, ast.ClassDef) or node.name.startswith("_"):
+                    continue
+                for stmt in node.body:
+                    if isinstance(stmt, ast.Assign) \
+                            and any(isinstance(t, ast.Name) and t.id == "site_url" for t in stmt.targets) \
+                            and isinstance(stmt.value, ast.Constant) and isinstance(stmt.value.value, str):
+                        site_urls.append(self.__normalize(stmt.value.value))
+            if site_urls:
+                for site_url in site_urls:
+                    self._index.setdefault(site_url, []).append(name)
+            else:
+                self._dynamic.append(name)
+
+    @staticmethod
+    def __normalize(url: str) -> str:
+        if url.startswith("http"):
+            url = urlparse(url).netloc
+        # 去除端口
+        url = url.split(":")[0]
+        return url.replace("www.", "").strip("/").lower()
+
+    def __load(self, name: str) -> List[Any]:
+        """
+        导入模块并返回其中的签到类
+        """
+        if name in self._loaded:
+            return self._loaded[name]
+        schemas = []
+        try:
+            module = importlib.import_module(f"{self._package}.{name}")
+            for attr, obj in module.__dict__.items():
+                if attr.startswith("_") or not isinstance(obj, type):
+                    continue
+                if obj.__module__ == module.__name__ and hasattr(obj, "match"):
+                    schemas.append(obj)
+        except Exception as e:
+            logger.error(f"站点模块 {name} 加载失败：{str(e)}")
+        self._loaded[name] = schemas
+        return schemas
+
+    def __candidates(self, url: str) -> List[str]:
+        """
+        按完整域名、各级上级域名及域名各段查找候选模块
+        """
+        host = self.__normalize(url)
+        labels = host.split(".")
+        keys = [".".join(labels[i:]) for i in range(len(labels))] + labels
+        names = []
+        for key in keys:
+            for name in self._index.get(key, []):
+                if name not in names:
+                    names.append(name)
+        return names + self._dynamic
+
+    def get(self, url: str) -> Optional[Any]:
+        """
+        获取站点对应的签到类，不存在时返回None
+        """
+        if not url:
+            return None
+        with self._lock:
+            if url in self._resolved:
+                return self._resolved[url]
+            site_schema = None
+            for name in self.__candidates(url):
+                for schema in self.__load(name):
+                    try:
+                        if schema.match(url):
+                            site_schema = schema
+                            break
+                    except Exception as e:
+                        logger.error("站点模块加载失败：%s" % str(e))
+                if site_schema:
+                    break
+            self._resolved[url] = site_schema
+            return site_schema
@@ -0,0 +1,183 @@
+import asyncio
+import threading
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+from cf_clearance import async_cf_retry, async_stealth
+from playwright.async_api import async_playwright, Browser, BrowserContext, Playwright
+from requests import Session
+
+from app.log import logger
+from app.utils.http import RequestUtils
+from app.utils.string import StringUtils
+
+
+class BrowserPool:
+    """
+    共享浏览器池，一次签到任务内只启动一个浏览器，按UA和代理复用有限数量的上下文
+    Playwright同步接口不能跨线程使用，因此浏览器运行在独立的事件循环线程中，签到线程通过该循环提交任务
+    """
+
+    def __init__(self, size: int = 3, browser_type: str = "chromium", headless: bool = False, timeout: int = 20):
+        self._size = max(int(size), 1)
+        self._browser_type = browser_type
+        self._headless = headless
+        self._timeout = timeout
+        self._lock = threading.Lock()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._playwright: Optional[Playwright] = None
+        self._browser: Optional[Browser] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        # (ua, proxy) -> [上下文, 使用中的页面数]
+        self._contexts: "OrderedDict[Tuple[str, str], list]" = OrderedDict()
+
+    def __start(self):
+        """
+        首次使用时启动事件循环线程和浏览器
+        """
+        with self._lock:
+            if self._loop:
+                return
+            loop = asyncio.new_event_loop()
+            thread = threading.Thread(target=loop.run_forever, name="autosignin-browser", daemon=True)
+            thread.start()
+            try:
+                asyncio.run_coroutine_threadsafe(self.__launch(), loop).result()
+            except Exception:
+                loop.call_soon_threadsafe(loop.stop)
+                thread.join(timeout=5)
+                loop.close()
+                raise
+            self._loop = loop
+            self._thread = thread
+
+    async def __launch(self):
+        self._semaphore = asyncio.Semaphore(self._size)
+        self._playwright = await async_playwright().start()
+        self._browser = await self._playwright[self._browser_type].launch(headless=self._headless)
+        logger.info(f"签到浏览器池已启动，上下文上限：{self._size}")
+
+    async def __acquire_context(self, ua: str, proxies: dict) -> Tuple[Tuple[str, str], BrowserContext]:
+        key = (ua or "", (proxies or {}).get("server") or "")
+        item = self._contexts.get(key)
+        if not item:
+            context = await self._browser.new_context(user_agent=ua, proxy=proxies)
+            item = [context, 0]
+            self._contexts[key] = item
+        self._contexts.move_to_end(key)
+        item[1] += 1
+        return key, item[0]
+
+    async def __release_context(self, key: Tuple[str, str]):
+        item = self._contexts.get(key)
+        if item:
+            item[1] -= 1
+        # 超出上限时关闭最久未使用且空闲的上下文
+        for old_key in list(self._contexts.keys()):
+            if len(self._contexts) <= self._size:
+                break
+            context, in_use = self._contexts[old_key]
+            if in_use > 0:
+                continue
+            self._contexts.pop(old_key)
+            await context.close()
+
+    async def __get_page_source(self, url: str, cookies: str, ua: str, proxies: dict) -> str:
+        async with self._semaphore:
+            key, context = await self.__acquire_context(ua, proxies)
+            page = None
+            try:
+                page = await context.new_page()
+                if cookies:
+                    await page.set_extra_http_headers({"cookie": cookies})
+                await async_stealth(page, pure=True)
+                await page.goto(url)
+                if not (await async_cf_retry(page))[0]:
+                    logger.warn("cloudflare challenge fail！")
+                await page.wait_for_load_state("networkidle", timeout=self._timeout * 1000)
+                return await page.content()
+            finally:
+                if page:
+                    await page.close()
+                await self.__release_context(key)
+
+    def get_page_source(self, url: str, cookies: str = None, ua: str = None, proxies: dict = None) -> str:
+        """
+        获取网页源码，与PlaywrightHelper().get_page_source保持一致
+        """
+        try:
+            self.__start()
+            future = asyncio.run_coroutine_threadsafe(
+                self.__get_page_source(url=url, cookies=cookies, ua=ua, proxies=proxies), self._loop)
+            return future.result()
+        except Exception as e:
+            logger.error(f"获取网页源码失败: {str(e)}")
+        return ""
+
+    async def __shutdown(self):
+        for context, _ in self._contexts.values():
+            try:
+                await context.close()
+            except Exception as e:
+                logger.debug(f"关闭浏览器上下文失败：{str(e)}")
+        self._contexts.clear()
+        if self._browser:
+            await self._browser.close()
+        if self._playwright:
+            await self._playwright.stop()
+
+    def close(self):
+        """
+        关闭浏览器和事件循环线程
+        """
+        with self._lock:
+            if not self._loop:
+                return
+            try:
+                asyncio.run_coroutine_threadsafe(self.__shutdown(), self._loop).result(timeout=30)
+            except Exception as e:
+                logger.error(f"关闭签到浏览器池失败：{str(e)}")
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join(timeout=5)
+            self._loop.close()
+            self._loop = None
+            self._thread = None
+            self._browser = None
+            self._playwright = None
+
+
+class SessionPool:
+    """
+    签到任务会话池：仿真站点共用一个浏览器池，普通站点按域名复用保持连接的HTTP会话
+    """
+
+    def __init__(self, browser_size: int = 3):
+        self.browser = BrowserPool(size=browser_size)
+        self._sessions: Dict[str, Session] = {}
+        self._lock = threading.Lock()
+
+    def __session(self, url: str) -> Session:
+        domain = StringUtils.get_url_domain(url)
+        with self._lock:
+            session = self._sessions.get(domain)
+            if not session:
+                session = Session()
+                self._sessions[domain] = session
+            return session
+
+    def request(self, url: str, cookies: str = None, ua: str = None, proxies: dict = None) -> RequestUtils:
+        """
+        获取绑定站点会话的RequestUtils
+        """
+        return RequestUtils(cookies=cookies,
+                            ua=ua,
+                            proxies=proxies,
+                            session=self.__session(url))
+
+    def close(self):
+        self.browser.close()
+        with self._lock:
+            for session in self._sessions.values():
+                session.close()
+            self._sessions.clear()
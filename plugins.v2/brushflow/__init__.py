@@ -4,8 +4,10 @@ import random
 import re
 import threading
 import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 from datetime import datetime, timedelta
-from typing import Any, List, Dict, Tuple, Optional, Union, Set
+from typing import Any, Callable, List, Dict, Tuple, Optional, Union, Set
 from urllib.parse import urlparse, parse_qs, unquote, parse_qsl, urlencode, urlunparse
 
 import pytz
@@ -33,6 +35,141 @@ from app.utils.string import StringUtils
 lock = threading.Lock()
 
 
+class BrushTaskIndex:
+    """
+    刷流任务索引，用于在刷流过程中以O(1)的方式判断重复种子
+    """
+
+    def __init__(self, torrent_tasks: Dict[str, dict] = None):
+        # (站点名称, 标题)
+        self.site_titles: Set[Tuple[Any, Any]] = set()
+        # (站点名称, 详情地址)
+        self.site_page_urls: Set[Tuple[Any, Any]] = set()
+        # 标题 -> 存在尚未做种任务的站点名称
+        self.pending_titles: Dict[Any, Set[Any]] = {}
+        for task in (torrent_tasks or {}).values():
+            self.add(task)
+
+    def add(self, task: dict):
+        """
+        新增任务到索引
+        """
+        site_name = task.get("site_name")
+        title = task.get("title")
+        self.site_titles.add((site_name, title))
+        self.site_page_urls.add((site_name, task.get("page_url")))
+        if not task.get("seed_time"):
+            self.pending_titles.setdefault(title, set()).add(site_name)
+
+    def contains_title(self, site_name: str, title: str) -> bool:
+        """
+        同一站点是否存在相同标题的任务
+        """
+        return (site_name, title) in self.site_titles
+
+    def contains_page_url(self, site_name: str, page_url: str) -> bool:
+        """
+        同一站点是否存在相同详情地址的任务
+        """
+        return (site_name, page_url) in self.site_page_urls
+
+    def has_pending_in_other_site(self, site_name: str, title: str) -> bool:
+        """
+        其他站点是否存在尚未下载完成的相同标题任务
+        """
+        sites = self.pending_titles.get(title)
+        return bool(sites) and any(name != site_name for name in sites)
+
+
+class BandwidthSampler:
+    """
+    后台带宽采样器，持续采样下载器的上传和下载速度并保存在固定大小的环形缓冲区中
+    """
+
+    def __init__(self, fetch_info: Callable[[], Optional[schemas.DownloaderInfo]],
+                 interval: float = 3.0, sample_count: int = 5, alpha: float = 0.5):
+        self._fetch_info = fetch_info
+        self._interval = interval
+        self._alpha = alpha
+        self._samples: deque = deque(maxlen=sample_count)
+        self._ewma: Optional[Tuple[float, float]] = None
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def running(self) -> bool:
+        return bool(self._thread and self._thread.is_alive())
+
+    def start(self):
+        """
+        启动采样线程
+        """
+        if self.running:
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self.__run, name="BrushFlowBandwidthSampler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """
+        停止采样线程并清空采样数据
+        """
+        self._stop_event.set()
+        if self._thread:
+            self._thread.join(timeout=self._interval + 1)
+            self._thread = None
+        with self._lock:
+            self._samples.clear()
+            self._ewma = None
+
+    def __run(self):
+        while not self._stop_event.is_set():
+            try:
+                info = self._fetch_info()
+                if info:
+                    self.__add_sample(upload_speed=info.upload_speed or 0, download_speed=info.download_speed or 0)
+            except Exception as e:
+                logger.debug(f"带宽采样失败：{e}")
+            self._stop_event.wait(self._interval)
+
+    def __add_sample(self, upload_speed: float, download_speed: float):
+        with self._lock:
+            self._samples.append((upload_speed, download_speed))
+            if self._ewma is None:
+                self._ewma = (upload_speed, download_speed)
+            else:
+                self._ewma = (self._alpha * upload_speed + (1 - self._alpha) * self._ewma[0],
+                              self._alpha * download_speed + (1 - self._alpha) * self._ewma[1])
+
+    def get_samples(self) -> List[Tuple[float, float]]:
+        """
+        获取当前缓冲区内的全部采样数据，按时间正序
+        """
+        with self._lock:
+            return list(self._samples)
+
+    def get_average(self) -> Tuple[Optional[float], Optional[float]]:
+        """
+        获取缓冲区内的平均上传和下载带宽
+        """
+        with self._lock:
+            if not self._samples:
+                return None, None
+            count = len(self._samples)
+            return (sum(sample[0] for sample in self._samples) / count,
+                    sum(sample[1] for sample in self._samples) / count)
+
+    def get_ewma(self) -> Tuple[Optional[float], Optional[float]]:
+        """
+        获取指数加权移动平均的上传和下载带宽
+        """
+        with self._lock:
+            if self._ewma is None:
+                return None, None
+            return self._ewma
+
+
 class BrushConfig:
     """
     刷流配置
@@ -284,6 +421,12 @@ class BrushFlow(_PluginBase):
     # 退出事件
     _event = threading.Event()
     _scheduler = None
+    # 带宽采样器
+    _bandwidth_sampler: Optional[BandwidthSampler] = None
+    # 并发获取站点种子的最大线程数
+    _fetch_workers = 5
+    # 单个站点获取种子的超时时间（秒）
+    _fetch_timeout = 120
     # tabs
     _tabs = None
 
@@ -350,6 +493,12 @@ class BrushFlow(_PluginBase):
         if not self.service_info:
             return
 
+        # 配置了带宽相关的前置条件时，启动后台带宽采样，刷流时直接读取采样结果，避免阻塞等待
+        if self._task_brush_enable and (brush_config.maxupspeed or brush_config.maxdlspeed):
+            self._bandwidth_sampler = BandwidthSampler(
+                fetch_info=lambda: self.__get_downloader_info(check_downloader=False))
+            self._bandwidth_sampler.start()
+
         # 检查是否启用了一次性任务
         if brush_config.onlyonce:
             self._scheduler = BackgroundScheduler(timezone=settings.TZ)
@@ -1911,6 +2060,9 @@ class BrushFlow(_PluginBase):
         退出插件
         """
         try:
+            if self._bandwidth_sampler:
+                self._bandwidth_sampler.stop()
+                self._bandwidth_sampler = None
             if self._scheduler:
                 self._scheduler.remove_all_jobs()
                 if self._scheduler.running:
@@ -1974,16 +2126,16 @@ class BrushFlow(_PluginBase):
             # 获取订阅标题
             subscribe_titles = self.__get_subscribe_titles()
 
-            # 处理所有站点
-            for site in site_infos:
-                # 如果站点刷流没有正确响应，说明没有通过前置条件，其他站点也不需要继续刷流了
-                if not self.__brush_site_torrents(siteid=site.id, torrent_tasks=torrent_tasks,
-                                                  statistic_info=statistic_info,
-                                                  subscribe_titles=subscribe_titles):
-                    logger.info(f"站点 {site.name} 刷流中途结束，停止后续刷流")
-                    break
-                else:
-                    logger.info(f"站点 {site.name} 刷流完成")
+            # 构建刷流任务索引，用于快速排除重复种子
+            task_index = BrushTaskIndex(torrent_tasks=torrent_tasks)
+
+            # 并发获取所有站点的种子，并合并为统一的候选种子列表
+            candidates = self.__fetch_brush_candidates(site_infos=site_infos, subscribe_titles=subscribe_titles)
+
+            # 如果刷流没有正确响应，说明没有通过前置条件，后续种子也不需要继续刷流了
+            if not self.__brush_torrents(candidates=candidates, torrent_tasks=torrent_tasks,
+                                         statistic_info=statistic_info, task_index=task_index):
+                logger.info("刷流中途结束，停止后续刷流")
 
             # 保存数据
             self.save_data("torrents", torrent_tasks)
@@ -1991,21 +2143,15 @@ class BrushFlow(_PluginBase):
             self.save_data("statistic", statistic_info)
             logger.info(f"刷流任务执行完成")
 
-    def __brush_site_torrents(self, siteid, torrent_tasks: Dict[str, dict], statistic_info: Dict[str, int],
-                              subscribe_titles: Set[str]) -> bool:
+    def __fetch_site_torrents(self, siteinfo: Any, subscribe_titles: Set[str]) -> List[TorrentInfo]:
         """
-        针对站点进行刷流
+        获取站点的新种子
         """
-        siteinfo = SiteOper().get(siteid)
-        if not siteinfo:
-            logger.warning(f"站点不存在：{siteid}")
-            return True
-
         logger.info(f"开始获取站点 {siteinfo.name} 的新种子 ...")
         torrents = TorrentsChain().browse(domain=siteinfo.domain)
         if not torrents:
             logger.info(f"站点 {siteinfo.name} 没有获取到种子")
-            return True
+            return []
 
         brush_config = self.__get_brush_config(sitename=siteinfo.name)
 
@@ -2016,15 +2162,92 @@ class BrushFlow(_PluginBase):
         if brush_config.except_subscribe:
             torrents = self.__filter_torrents_contains_subscribe(torrents=torrents, subscribe_titles=subscribe_titles)
 
-        # 按发布日期降序排列
-        torrents.sort(key=lambda x: x.pubdate or '', reverse=True)
+        logger.info(f"站点 {siteinfo.name} 获取到种子数量 {len(torrents)}")
+        return torrents
+
+    def __fetch_brush_candidates(self, site_infos: List[Any], subscribe_titles: Set[str]) \
+            -> List[Tuple[Any, TorrentInfo]]:
+        """
+        并发获取所有站点的种子，合并后按发布时间排序
+        开启顺序刷流时，按站点顺序排列，站点内按发布时间降序；否则所有站点的种子统一按发布时间降序排列
+        """
+        if not site_infos:
+            return []
+
+        site_torrents: Dict[int, List[TorrentInfo]] = {}
+        # 各站点开始获取种子的时间，每个站点单独计算超时
+        started: Dict[int, float] = {}
+
+        def fetch(siteinfo: Any) -> List[TorrentInfo]:
+            started[siteinfo.id] = time.monotonic()
+            return self.__fetch_site_torrents(siteinfo, subscribe_titles)
+
+        def deadline(siteinfo: Any) -> float:
+            # 仍在排队的站点从提交时开始计时，避免前面的站点卡住时无限等待
+            return started.get(siteinfo.id, submitted) + self._fetch_timeout
+
+        executor = ThreadPoolExecutor(max_workers=min(self._fetch_workers, len(site_infos)))
+        try:
+            submitted = time.monotonic()
+            pending = {executor.submit(fetch, siteinfo): siteinfo for siteinfo in site_infos}
+            while pending:
+                timeout = max(0.0, min(deadline(siteinfo) for siteinfo in pending.values()) - time.monotonic())
+                done, _ = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+                for future in done:
+                    siteinfo = pending.pop(future)
+                    try:
+                        site_torrents[siteinfo.id] = future.result() or []
+                    except Exception as e:
+                        logger.error(f"站点 {siteinfo.name} 获取种子失败：{str(e)}")
+                now = time.monotonic()
+                for future, siteinfo in list(pending.items()):
+                    if deadline(siteinfo) <= now:
+                        pending.pop(future)
+                        future.cancel()
+                        logger.warning(f"站点 {siteinfo.name} 获取种子超时，跳过")
+        finally:
+            # 不等待超时的站点线程结束，避免阻塞刷流
+            executor.shutdown(wait=False)
+
+        def pub_minutes(item: Tuple[Any, TorrentInfo]) -> float:
+            siteinfo, torrent = item
+            # 发布时间缺失或无法解析的种子排在最后
+            minutes = self.__get_pubminutes(torrent.pubdate, default=float("inf"))
+            if minutes == float("inf"):
+                return minutes
+            minutes -= self.__get_brush_config(sitename=siteinfo.name).timezone_offset
+            return self.__adjust_site_pubminutes(minutes, torrent)
+
+        brush_config = self.__get_brush_config()
+        candidates = []
+        for siteinfo in site_infos:
+            site_candidates = [(siteinfo, torrent) for torrent in site_torrents.get(siteinfo.id) or []]
+            if brush_config.brush_sequential:
+                site_candidates.sort(key=pub_minutes)
+            candidates.extend(site_candidates)
+
+        if not brush_config.brush_sequential:
+            candidates.sort(key=pub_minutes)
+
+        return candidates
+
+    def __brush_torrents(self, candidates: List[Tuple[Any, TorrentInfo]], torrent_tasks: Dict[str, dict],
+                         statistic_info: Dict[str, int], task_index: BrushTaskIndex) -> bool:
+        """
+        针对候选种子进行刷流
+        """
+        if not candidates:
+            logger.info("没有获取到任何候选种子")
+            return True
 
         torrents_size = self.__calculate_seeding_torrents_size(torrent_tasks=torrent_tasks)
 
-        logger.info(f"正在准备种子刷流，数量 {len(torrents)}")
+        logger.info(f"正在准备种子刷流，数量 {len(candidates)}")
 
         # 过滤种子
-        for torrent in torrents:
+        for siteinfo, torrent in candidates:
+            brush_config = self.__get_brush_config(sitename=siteinfo.name)
+
             # 判断能否通过刷流前置条件
             pre_condition_passed, reason = self.__evaluate_pre_conditions_for_brush(include_network_conditions=False)
             self.__log_brush_conditions(passed=pre_condition_passed, reason=reason)
@@ -2042,7 +2265,7 @@ class BrushFlow(_PluginBase):
 
             # 判断能否通过刷流条件
             condition_passed, reason = self.__evaluate_conditions_for_brush(torrent=torrent,
-                                                                            torrent_tasks=torrent_tasks)
+                                                                            task_index=task_index)
             self.__log_brush_conditions(passed=condition_passed, reason=reason, torrent=torrent)
             if not condition_passed:
                 continue
@@ -2097,6 +2320,7 @@ class BrushFlow(_PluginBase):
                 "downloader": self.service_info.name
             })
             torrent_tasks[hash_string] = torrent_task
+            task_index.add(torrent_task)
 
             # 统计数据
             torrents_size += torrent.size
@@ -2183,7 +2407,7 @@ class BrushFlow(_PluginBase):
 
         return True, None
 
-    def __evaluate_conditions_for_brush(self, torrent, torrent_tasks) -> Tuple[bool, Optional[str]]:
+    def __evaluate_conditions_for_brush(self, torrent, task_index: BrushTaskIndex) -> Tuple[bool, Optional[str]]:
         """
         过滤不符合条件的种子
         """
@@ -2191,22 +2415,18 @@ class BrushFlow(_PluginBase):
 
         # 排除重复种子
         # 默认根据标题和站点名称进行排除
-        task_key = f"{torrent.site_name}{torrent.title}"
-        if any(task_key == f"{task.get('site_name')}{task.get('title')}" for task in torrent_tasks.values()):
+        if task_index.contains_title(site_name=torrent.site_name, title=torrent.title):
             return False, "重复种子"
 
         # 部分站点标题会上新时携带后缀，这里进一步根据种子详情地址进行排除
-        if torrent.page_url:
-            task_page_url = f"{torrent.site_name}{torrent.page_url}"
-            if any(task_page_url == f"{task.get('site_name')}{task.get('page_url')}" for task in
-                   torrent_tasks.values()):
-                return False, "重复种子"
+        if torrent.page_url and task_index.contains_page_url(site_name=torrent.site_name,
+                                                             page_url=torrent.page_url):
+            return False, "重复种子"
 
         # 不同站点如果遇到相同种子，判断前一个种子是否已经在做种，否则排除处理
-        if torrent.title:
-            if any(torrent.site_name != f"{task.get('site_name')}" and torrent.title == f"{task.get('title')}"
-                   and not task.get("seed_time") for task in torrent_tasks.values()):
-                return False, "其他站点存在尚未下载完成的相同种子"
+        if torrent.title and task_index.has_pending_in_other_site(site_name=torrent.site_name,
+                                                                  title=torrent.title):
+            return False, "其他站点存在尚未下载完成的相同种子"
 
         # 促销条件
         if brush_config.freeleech and torrent.downloadvolumefactor != 0:
@@ -2325,11 +2545,15 @@ class BrushFlow(_PluginBase):
             # 获取到当前所有做种数据中需要被检查的种子数据
             check_torrents = [seeding_torrents_dict[th] for th in torrent_check_hashes if th in seeding_torrents_dict]
 
+            # 一次性获取所有待检查种子的信息快照，后续的状态更新以及删种条件均基于该快照进行计算
+            torrent_info_map = self.__get_torrent_info_map(torrents=check_torrents)
+
             # 先更新刷流任务的最新状态，上下传，分享率
-            self.__update_torrent_tasks_state(torrents=check_torrents, torrent_tasks=torrent_tasks)
+            self.__update_torrent_tasks_state(torrent_info_map=torrent_info_map, torrent_tasks=torrent_tasks)
 
             # 更新刷流任务列表中在下载器中删除的种子为删除状态
-            self.__update_undeleted_torrents_missing_in_downloader(torrent_tasks, torrent_check_hashes, check_torrents)
+            self.__update_undeleted_torrents_missing_in_downloader(torrent_tasks, torrent_check_hashes,
+                                                                   torrent_info_map.keys())
 
             # 根据配置的标签进行种子排除
             if check_torrents:
@@ -2357,18 +2581,21 @@ class BrushFlow(_PluginBase):
                 logger.info("没有需要检查的任务，跳过")
             else:
                 need_delete_hashes = []
+                check_torrent_infos = [torrent_info_map[torrent_hash] for torrent_hash in
+                                       (self.__get_hash(torrent) for torrent in check_torrents)
+                                       if torrent_hash in torrent_info_map]
 
                 # 如果配置了动态删除以及删种阈值，则根据动态删种进行分组处理
                 if brush_config.proxy_delete and brush_config.delete_size_range:
                     logger.info("已开启动态删种，按系统默认动态删种条件开始检查任务")
-                    proxy_delete_hashes = self.__delete_torrent_for_proxy(torrents=check_torrents,
+                    proxy_delete_hashes = self.__delete_torrent_for_proxy(torrent_infos=check_torrent_infos,
                                                                           torrent_tasks=torrent_tasks) or []
                     need_delete_hashes.extend(proxy_delete_hashes)
                 # 否则均认为是没有开启动态删种
                 else:
                     logger.info("没有开启动态删种，按用户设置删种条件开始检查任务")
-                    not_proxy_delete_hashes = self.__delete_torrent_for_evaluate_conditions(torrents=check_torrents,
-                                                                                            torrent_tasks=torrent_tasks) or []
+                    not_proxy_delete_hashes = self.__delete_torrent_for_evaluate_conditions(
+                        torrent_infos=check_torrent_infos, torrent_tasks=torrent_tasks) or []
                     need_delete_hashes.extend(not_proxy_delete_hashes)
 
                 if need_delete_hashes:
@@ -2390,19 +2617,17 @@ class BrushFlow(_PluginBase):
 
             logger.info("刷流下载任务检查完成")
 
-    def __update_torrent_tasks_state(self, torrents: List[Any], torrent_tasks: Dict[str, dict]):
+    @staticmethod
+    def __update_torrent_tasks_state(torrent_info_map: Dict[str, dict], torrent_tasks: Dict[str, dict]):
         """
         更新刷流任务的最新状态，上下传，分享率
         """
-        for torrent in torrents:
-            torrent_hash = self.__get_hash(torrent)
+        for torrent_hash, torrent_info in torrent_info_map.items():
             torrent_task = torrent_tasks.get(torrent_hash, None)
             # 如果找不到种子任务，说明不在管理的种子范围内，直接跳过
             if not torrent_task:
                 continue
 
-            torrent_info = self.__get_torrent_info(torrent)
-
             # 更新上传量、下载量
             torrent_task.update({
                 "downloaded": torrent_info.get("downloaded"),
@@ -2479,16 +2704,15 @@ class BrushFlow(_PluginBase):
                                                             reason="在下载器中找到已标记删除的刷流任务对应的种子信息",
                                                             torrent_tasks=reset_tasks)
 
-    def __group_torrents_by_proxy_delete(self, torrents: List[Any], torrent_tasks: Dict[str, dict]):
+    def __group_torrents_by_proxy_delete(self, torrent_infos: List[dict], torrent_tasks: Dict[str, dict]):
         """
         根据是否启用动态删种进行分组
         """
         proxy_delete_torrents = []
         not_proxy_delete_torrents = []
 
-        for torrent in torrents:
-            torrent_hash = self.__get_hash(torrent)
-            torrent_task = torrent_tasks.get(torrent_hash, None)
+        for torrent_info in torrent_infos:
+            torrent_task = torrent_tasks.get(torrent_info.get("hash"), None)
 
             # 如果找不到种子任务，说明不在管理的种子范围内，直接跳过
             if not torrent_task:
@@ -2498,9 +2722,9 @@ class BrushFlow(_PluginBase):
 
             brush_config = self.__get_brush_config(site_name)
             if brush_config.proxy_delete:
-                proxy_delete_torrents.append(torrent)
+                proxy_delete_torrents.append(torrent_info)
             else:
-                not_proxy_delete_torrents.append(torrent)
+                not_proxy_delete_torrents.append(torrent_info)
 
         return proxy_delete_torrents, not_proxy_delete_torrents
 
@@ -2604,15 +2828,15 @@ class BrushFlow(_PluginBase):
 
         return True, reason
 
-    def __delete_torrent_for_evaluate_conditions(self, torrents: List[Any], torrent_tasks: Dict[str, dict],
+    def __delete_torrent_for_evaluate_conditions(self, torrent_infos: List[dict], torrent_tasks: Dict[str, dict],
                                                  proxy_delete: bool = False) -> List:
         """
         根据条件删除种子并获取已删除列表
         """
         delete_hashes = []
 
-        for torrent in torrents:
-            torrent_hash = self.__get_hash(torrent)
+        for torrent_info in torrent_infos:
+            torrent_hash = torrent_info.get("hash")
             torrent_task = torrent_tasks.get(torrent_hash, None)
             # 如果找不到种子任务，说明不在管理的种子范围内，直接跳过
             if not torrent_task:
@@ -2621,8 +2845,6 @@ class BrushFlow(_PluginBase):
             torrent_title = torrent_task.get("title", "")
             torrent_desc = torrent_task.get("description", "")
 
-            torrent_info = self.__get_torrent_info(torrent)
-
             # 删除种子的具体实现可能会根据实际情况略有不同
             should_delete, reason = self.__evaluate_conditions_for_delete(site_name=site_name,
                                                                           torrent_info=torrent_info,
@@ -2638,15 +2860,15 @@ class BrushFlow(_PluginBase):
 
         return delete_hashes
 
-    def __delete_torrent_for_evaluate_proxy_pre_conditions(self, torrents: List[Any],
+    def __delete_torrent_for_evaluate_proxy_pre_conditions(self, torrent_infos: List[dict],
                                                            torrent_tasks: Dict[str, dict]) -> List:
         """
         根据动态删除前置条件排除H&R种子后删除种子并获取已删除列表
         """
         delete_hashes = []
 
-        for torrent in torrents:
-            torrent_hash = self.__get_hash(torrent)
+        for torrent_info in torrent_infos:
+            torrent_hash = torrent_info.get("hash")
             torrent_task = torrent_tasks.get(torrent_hash, None)
             # 如果找不到种子任务，说明不在管理的种子范围内，直接跳过
             if not torrent_task:
@@ -2660,8 +2882,6 @@ class BrushFlow(_PluginBase):
             torrent_title = torrent_task.get("title", "")
             torrent_desc = torrent_task.get("description", "")
 
-            torrent_info = self.__get_torrent_info(torrent)
-
             # 删除种子的具体实现可能会根据实际情况略有不同
             should_delete, reason = self.__evaluate_proxy_pre_conditions_for_delete(site_name=site_name,
                                                                                     torrent_info=torrent_info,
@@ -2676,7 +2896,7 @@ class BrushFlow(_PluginBase):
 
         return delete_hashes
 
-    def __delete_torrent_for_proxy(self, torrents: List[Any], torrent_tasks: Dict[str, dict]) -> List:
+    def __delete_torrent_for_proxy(self, torrent_infos: List[dict], torrent_tasks: Dict[str, dict]) -> List:
         """
         动态删除种子，删除规则如下；
         - 不管做种体积是否超过设定的动态删除阈值，默认优先执行排除H&R种子后满足「下载超时时间」的种子
@@ -2693,7 +2913,7 @@ class BrushFlow(_PluginBase):
             return []
 
         # 获取种子信息Map
-        torrent_info_map = {self.__get_hash(torrent): self.__get_torrent_info(torrent=torrent) for torrent in torrents}
+        torrent_info_map = {torrent_info.get("hash"): torrent_info for torrent_info in torrent_infos}
 
         # 计算当前总做种体积
         total_torrent_size = self.__calculate_seeding_torrents_size(torrent_tasks=torrent_tasks)
@@ -2702,15 +2922,15 @@ class BrushFlow(_PluginBase):
             f"当前做种体积 {self.__bytes_to_gb(total_torrent_size):.1f} GB，正在准备计算满足动态前置删除条件的种子")
 
         # 执行排除H&R种子后满足前置删除条件的种子
-        pre_delete_hashes = self.__delete_torrent_for_evaluate_proxy_pre_conditions(torrents=torrents,
+        pre_delete_hashes = self.__delete_torrent_for_evaluate_proxy_pre_conditions(torrent_infos=torrent_infos,
                                                                                     torrent_tasks=torrent_tasks) or []
 
         # 如果存在前置删除种子，这里进行额外判断，总做种体积排除前置删除种子的体积
         if pre_delete_hashes:
-            pre_delete_total_size = sum(torrent_info_map[self.__get_hash(torrent)].get("total_size", 0)
-                                        for torrent in torrents if self.__get_hash(torrent) in pre_delete_hashes)
+            pre_delete_hash_set = set(pre_delete_hashes)
+            pre_delete_total_size = sum(torrent_info_map[_hash].get("total_size", 0) for _hash in pre_delete_hash_set)
             total_torrent_size = total_torrent_size - pre_delete_total_size
-            torrents = [torrent for torrent in torrents if self.__get_hash(torrent) not in pre_delete_hashes]
+            torrent_infos = [info for info in torrent_infos if info.get("hash") not in pre_delete_hash_set]
             logger.info(
                 f"满足动态删除前置条件的种子共 {len(pre_delete_hashes)} 个，体积 {self.__bytes_to_gb(pre_delete_total_size):.1f} GB，"
                 f"删除种子后，当前做种体积 {self.__bytes_to_gb(total_torrent_size):.1f} GB")
@@ -2740,32 +2960,30 @@ class BrushFlow(_PluginBase):
         need_delete_hashes.extend(pre_delete_hashes)
 
         # 即使开了动态删除，但是也有可能部分站点单独设置了关闭，这里根据种子托管进行分组，先处理不需要托管的种子，按设置的规则进行删除
-        proxy_delete_torrents, not_proxy_delete_torrents = self.__group_torrents_by_proxy_delete(torrents=torrents,
-                                                                                                 torrent_tasks=torrent_tasks)
+        proxy_delete_torrents, not_proxy_delete_torrents = self.__group_torrents_by_proxy_delete(
+            torrent_infos=torrent_infos, torrent_tasks=torrent_tasks)
         logger.info(f"托管种子数 {len(proxy_delete_torrents)}，未托管种子数 {len(not_proxy_delete_torrents)}")
         if not_proxy_delete_torrents:
-            not_proxy_delete_hashes = self.__delete_torrent_for_evaluate_conditions(torrents=not_proxy_delete_torrents,
-                                                                                    torrent_tasks=torrent_tasks) or []
+            not_proxy_delete_hashes = self.__delete_torrent_for_evaluate_conditions(
+                torrent_infos=not_proxy_delete_torrents, torrent_tasks=torrent_tasks) or []
             need_delete_hashes.extend(not_proxy_delete_hashes)
-            total_torrent_size -= sum(
-                torrent_info_map[self.__get_hash(torrent)].get("total_size", 0) for torrent in not_proxy_delete_torrents
-                if self.__get_hash(torrent) in not_proxy_delete_hashes)
+            total_torrent_size -= sum(torrent_info_map[_hash].get("total_size", 0)
+                                      for _hash in set(not_proxy_delete_hashes))
 
         # 如果删除非托管种子后仍未达到最小体积要求，则处理托管种子
         if total_torrent_size > min_size and proxy_delete_torrents:
-            proxy_delete_hashes = self.__delete_torrent_for_evaluate_conditions(torrents=proxy_delete_torrents,
+            proxy_delete_hashes = self.__delete_torrent_for_evaluate_conditions(torrent_infos=proxy_delete_torrents,
                                                                                 torrent_tasks=torrent_tasks,
                                                                                 proxy_delete=True) or []
             need_delete_hashes.extend(proxy_delete_hashes)
-            total_torrent_size -= sum(
-                torrent_info_map[self.__get_hash(torrent)].get("total_size", 0) for torrent in proxy_delete_torrents if
-                self.__get_hash(torrent) in proxy_delete_hashes)
+            total_torrent_size -= sum(torrent_info_map[_hash].get("total_size", 0)
+                                      for _hash in set(proxy_delete_hashes))
 
         # 在完成初始删除步骤后，如果总体积仍然超过最小阈值，则进一步找到已完成种子并排除HR种子后按做种时间正序进行删除
         if total_torrent_size > min_size:
             # 重新计算当前的种子列表，排除已删除的种子
             remaining_hashes = list(
-                {self.__get_hash(torrent) for torrent in proxy_delete_torrents} - set(need_delete_hashes))
+                {info.get("hash") for info in proxy_delete_torrents} - set(need_delete_hashes))
             # 这里根据排除后的种子列表，再次从下载器中找到已完成的任务
             downloader = self.downloader
             completed_torrents = downloader.get_completed_torrents(ids=remaining_hashes)
@@ -2816,12 +3034,12 @@ class BrushFlow(_PluginBase):
         # 返回所有需要删除的种子的哈希列表
         return need_delete_hashes
 
-    def __update_undeleted_torrents_missing_in_downloader(self, torrent_tasks, torrent_check_hashes, torrents):
+    def __update_undeleted_torrents_missing_in_downloader(self, torrent_tasks, torrent_check_hashes, torrent_hashes):
         """
         处理已经被删除，但是任务记录中还没有被标记删除的种子
         """
         # 先通过获取的全量种子，判断已经被删除，但是任务记录中还没有被标记删除的种子
-        torrent_all_hashes = self.__get_all_hashes(torrents)
+        torrent_all_hashes = set(torrent_hashes)
         missing_hashes = [hash_value for hash_value in torrent_check_hashes if hash_value not in torrent_all_hashes]
         undeleted_hashes = [hash_value for hash_value in missing_hashes if not torrent_tasks[hash_value].get("deleted")]
 
@@ -3273,27 +3491,6 @@ class BrushFlow(_PluginBase):
             print(str(e))
             return ""
 
-    def __get_all_hashes(self, torrents):
-        """
-        获取torrents列表中所有种子的Hash值
-
-        :param torrents: 包含种子信息的列表
-        :return: 包含所有Hash值的列表
-        """
-        try:
-            all_hashes = []
-            for torrent in torrents:
-                # 根据下载器类型获取Hash值
-                hash_value = torrent.get("hash") if DownloaderHelper().is_downloader("qbittorrent",
-                                                                                     service=self.service_info) \
-                    else torrent.hashString
-                if hash_value:
-                    all_hashes.append(hash_value)
-            return all_hashes
-        except Exception as e:
-            print(str(e))
-            return []
-
     def __get_label(self, torrent: Any):
         """
         获取种子标签
@@ -3306,6 +3503,17 @@ class BrushFlow(_PluginBase):
             print(str(e))
             return []
 
+    def __get_torrent_info_map(self, torrents: List[Any]) -> Dict[str, dict]:
+        """
+        获取种子信息快照，以种子Hash为键
+        """
+        torrent_info_map = {}
+        for torrent in torrents:
+            torrent_info = self.__get_torrent_info(torrent)
+            if torrent_info.get("hash"):
+                torrent_info_map[torrent_info.get("hash")] = torrent_info
+        return torrent_info_map
+
     def __get_torrent_info(self, torrent: Any) -> dict:
         """
         获取种子信息
@@ -3580,8 +3788,19 @@ class BrushFlow(_PluginBase):
     def __get_average_bandwidth(self, sample_count: int = 5, interval: float = 3.0) \
             -> Tuple[Optional[float], Optional[float]]:
         """
-        多次采样上传和下载带宽，取平均值
+        多次采样上传和下载带宽，取平均值，如后台采样器已有数据，则直接读取采样结果
         """
+        if self._bandwidth_sampler and self._bandwidth_sampler.running:
+            avg_upload_speed, avg_download_speed = self._bandwidth_sampler.get_average()
+            if avg_upload_speed is not None and avg_download_speed is not None:
+                ewma_upload_speed, ewma_download_speed = self._bandwidth_sampler.get_ewma()
+                logger.debug(f"平均上传带宽 {StringUtils.str_filesize(avg_upload_speed)}, "
+                             f"平均下载带宽 {StringUtils.str_filesize(avg_download_speed)}, "
+                             f"加权上传带宽 {StringUtils.str_filesize(ewma_upload_speed)}, "
+                             f"加权下载带宽 {StringUtils.str_filesize(ewma_download_speed)}, "
+                             f"采样次数={len(self._bandwidth_sampler.get_samples())}")
+                return avg_upload_speed, avg_download_speed
+
         upload_speeds = []
         download_speeds = []
         start_time = time.time()
@@ -3603,14 +3822,14 @@ class BrushFlow(_PluginBase):
                      f"采样次数={sample_count}, 时长={total_duration:.2f} 秒")
         return avg_upload_speed, avg_download_speed
 
-    def __get_downloader_info(self) -> schemas.DownloaderInfo:
+    def __get_downloader_info(self, check_downloader: bool = True) -> schemas.DownloaderInfo:
         """
         获取下载器实时信息（所有下载器）
+        :param check_downloader: 是否先检查下载器连接状态，后台采样时不检查，避免连接异常时频繁发送通知
         """
         ret_info = schemas.DownloaderInfo()
 
-        downloader = self.downloader
-        if not downloader:
+        if check_downloader and not self.downloader:
             return ret_info
 
         transfer_infos = self.chain.run_module("downloader_info")
@@ -3644,20 +3863,21 @@ class BrushFlow(_PluginBase):
             return 0
 
     @staticmethod
-    def __get_pubminutes(pubdate: str) -> float:
+    def __get_pubminutes(pubdate: str, default: float = 0) -> float:
         """
         将字符串转换为时间，并计算与当前时间差）（分钟）
+        发布时间缺失或无法解析时返回 default
         """
         try:
             if not pubdate:
-                return 0
+                return default
             pubdate = pubdate.replace("T", " ").replace("Z", "")
             pubdate = datetime.strptime(pubdate, "%Y-%m-%d %H:%M:%S")
             now = datetime.now()
             return (now - pubdate).total_seconds() // 60
         except Exception as e:
             logger.error(f"发布时间 {pubdate} 获取分钟失败，错误详情: {e}")
-            return 0
+            return default
 
     @staticmethod
     def __adjust_site_pubminutes(pub_minutes: float, torrent: TorrentInfo) -> float:
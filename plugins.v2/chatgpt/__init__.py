@@ -1,10 +1,13 @@
-from typing import Any, List, Dict, Tuple
+import os
+from typing import Any, Callable, List, Dict, Optional, Tuple
 
 from app.core.config import settings
 from app.core.event import eventmanager, Event
 from app.log import logger
 from app.plugins import _PluginBase
+from app.plugins.chatgpt.key_pool import KeyPool
 from app.plugins.chatgpt.openai import OpenAi
+from app.plugins.chatgpt.recognizer import RecognizeBatcher, RecognizeCache
 from app.schemas.types import EventType, ChainEventType
 from app.schemas import NotificationType
 
@@ -30,7 +33,6 @@ class ChatGPT(_PluginBase):
     auth_level = 1
 
     # 私有属性
-    openai = None
     _enabled = False
     _proxy = False
     _compatible = False
@@ -40,16 +42,33 @@ class ChatGPT(_PluginBase):
     _model = None
     # 存储多个API密钥
     _api_keys = []
-    # 当前使用的密钥索引
-    _current_key_index = 0
-    # 密钥失效状态
-    _key_status = {}
+    # 密钥 -> 客户端
+    _clients: Dict[str, OpenAi] = {}
+    # 密钥池
+    _key_pool: Optional[KeyPool] = None
+    # 单个密钥每分钟请求数上限，0为不限制
+    _key_rpm = 0
+    # 单个会话的Token上限，0为不限制
+    _session_tokens = 4000
+    # 是否将较早的对话压缩为摘要
+    _session_summary = False
     # 是否发送通知
     _notify = False
+    # 是否合并识别请求
+    _batch_recognize = False
+    # 合并识别的最大标题数及等待时间（秒）
+    _batch_size = 8
+    _batch_window = 0.5
+    # 识别结果缓存
+    _recognize_cache: Optional[RecognizeCache] = None
+    _batcher: Optional[RecognizeBatcher] = None
     # 自定义提示词
     _customize_prompt = '接下来我会给你一个电影或电视剧的文件名，你需要识别文件名中的名称、版本、分段、年份、分瓣率、季集等信息，并按以下JSON格式返回：{"name":string,"version":string,"part":string,"year":string,"resolution":string,"season":number|null,"episode":number|null}，特别注意返回结果需要严格附合JSON格式，不需要有任何其它的字符。如果中文电影或电视剧的文件名中存在谐音字或字母替代的情况，请还原最有可能的结果。'
 
     def init_plugin(self, config: dict = None):
+        # 停止现有任务
+        self.stop_service()
+
         if config:
             self._enabled = config.get("enabled")
             self._proxy = config.get("proxy")
@@ -60,58 +79,93 @@ class ChatGPT(_PluginBase):
             self._model = config.get("model")
             self._notify = config.get("notify")
             self._customize_prompt = config.get("customize_prompt")
+            self._batch_recognize = config.get("batch_recognize")
+            try:
+                self._key_rpm = int(config.get("key_rpm") or 0)
+            except ValueError:
+                self._key_rpm = 0
+            try:
+                self._session_tokens = int(config.get("session_tokens") or 0)
+            except ValueError:
+                self._session_tokens = 4000
+            self._session_summary = config.get("session_summary")
             # 处理多个API密钥
+            self._api_keys = []
             if self._openai_key:
                 self._api_keys = [key.strip() for key in self._openai_key.split(',') if key.strip()]
-                # 初始化密钥状态
-                self._key_status = {key: True for key in self._api_keys}
                 logger.info(f"ChatGPT插件加载了 {len(self._api_keys)} 个API密钥")
 
+            self._clients = {}
+            self._key_pool = None
             if self._openai_url and self._api_keys:
-                # 使用第一个密钥初始化
-                self._current_key_index = 0
-                self.init_openai(self._api_keys[self._current_key_index])
+                for api_key in self._api_keys:
+                    self.init_openai(api_key)
+                self._key_pool = KeyPool(keys=self._api_keys, rpm=self._key_rpm)
+
+        if self._enabled and self._recognize and self._clients:
+            self._recognize_cache = RecognizeCache(os.path.join(self.get_data_path(), "recognize_cache.db"))
+            if self._batch_recognize:
+                self._batcher = RecognizeBatcher(handler=self.__recognize_batch,
+                                                 batch_size=self._batch_size,
+                                                 window=self._batch_window)
 
     def init_openai(self, api_key):
         """
         初始化OpenAI客户端
         """
         if self._openai_url and api_key:
-            self.openai = OpenAi(api_key=api_key, api_url=self._openai_url,
-                                 proxy=settings.PROXY if self._proxy else None,
-                                 model=self._model, compatible=bool(self._compatible), customize_prompt=self._customize_prompt)
+            self._clients[api_key] = OpenAi(api_key=api_key, api_url=self._openai_url,
+                                            proxy=settings.PROXY if self._proxy else None,
+                                            model=self._model, compatible=bool(self._compatible),
+                                            customize_prompt=self._customize_prompt,
+                                            session_tokens=self._session_tokens,
+                                            session_summary=bool(self._session_summary))
             logger.info(f"ChatGPT插件初始化API客户端成功")
             return True
         return False
 
-    def switch_to_next_key(self, failed_key):
+    def __request(self, call: Callable[[OpenAi], Any], check: Callable[[Any], Tuple[bool, str]] = None,
+                  channel: str = None, userid: str = None) -> Optional[Any]:
         """
-        切换到下一个可用的API密钥
-        :return: (is_switched, error_message) 元组，表示是否切换成功及错误信息
+        从密钥池取用密钥发起请求，失败时换用其它密钥重试
+        :param call: 使用客户端发起请求
+        :param check: 额外的结果校验，返回 (is_error, error_message)
+        :param channel: 消息渠道，为空时通过系统通知发送密钥失效消息
+        :param userid: 用户ID
+        :return: 请求结果，全部失败时返回None
         """
-        # 标记当前密钥为失效
-        self._key_status[failed_key] = False
-
-        # 寻找下一个可用的密钥
-        original_index = self._current_key_index
-        while True:
-            self._current_key_index = (self._current_key_index + 1) % len(self._api_keys)
-            next_key = self._api_keys[self._current_key_index]
-
-            # 如果密钥标记为可用或者已经尝试了所有密钥，则使用该密钥
-            if self._key_status.get(next_key, True) or self._current_key_index == original_index:
+        if not self._key_pool:
+            return None
+        for _ in range(len(self._key_pool)):
+            api_key = self._key_pool.acquire()
+            if not api_key:
                 break
-
-        # 检查是否所有密钥都失效
-        if all(not status for status in self._key_status.values()):
+            try:
+                response = call(self._clients[api_key])
+            except Exception as e:
+                response = {"errorMsg": str(e)}
+            # 判断响应是否正常
+            is_error, error_msg = self.is_api_error(response)
+            if not is_error and check:
+                is_error, error_msg = check(response)
+            self._key_pool.release(api_key, success=not is_error)
+            if not is_error:
+                return response
+            logger.warn(f"API密钥 {api_key} 调用失败: {error_msg}")
+            # 发送密钥失效通知
+            if self._notify:
+                message = f"API密钥 {api_key} 调用失败: {error_msg}"
+                if channel:
+                    self.post_message(channel=channel, title=message, userid=userid)
+                else:
+                    self.post_message(mtype=NotificationType.Plugin, title="ChatGpt", text=message)
+        if self._key_pool.all_disabled():
             logger.error("所有API密钥均已失效")
-            return False, "所有API密钥均已失效，请检查配置"
-
-        # 使用新密钥重新初始化客户端
-        next_key = self._api_keys[self._current_key_index]
-        logger.info(f"切换到下一个API密钥 {next_key}")
-        success = self.init_openai(next_key)
-        return success, ""
+            # 如果所有密钥都失效，发送额外通知
+            if self._notify:
+                self.post_message(mtype=NotificationType.Plugin, title="ChatGpt",
+                                  text="所有API密钥均已失效，请检查配置")
+        return None
 
     def get_state(self) -> bool:
         return self._enabled
@@ -138,7 +192,7 @@ class ChatGPT(_PluginBase):
                                 'component': 'VCol',
                                 'props': {
                                     'cols': 12,
-                                    'md': 4
+                                    'md': 3
                                 },
                                 'content': [
                                     {
@@ -154,7 +208,7 @@ class ChatGPT(_PluginBase):
                                 'component': 'VCol',
                                 'props': {
                                     'cols': 12,
-                                    'md': 4
+                                    'md': 3
                                 },
                                 'content': [
                                     {
@@ -170,7 +224,7 @@ class ChatGPT(_PluginBase):
                                 'component': 'VCol',
                                 'props': {
                                     'cols': 12,
-                                    'md': 4
+                                    'md': 3
                                 },
                                 'content': [
                                     {
@@ -186,7 +240,7 @@ class ChatGPT(_PluginBase):
                                 'component': 'VCol',
                                 'props': {
                                     'cols': 12,
-                                    'md': 4
+                                    'md': 3
                                 },
                                 'content': [
                                     {
@@ -202,7 +256,7 @@ class ChatGPT(_PluginBase):
                                 'component': 'VCol',
                                 'props': {
                                     'cols': 12,
-                                    'md': 4
+                                    'md': 3
                                 },
                                 'content': [
                                     {
@@ -213,6 +267,38 @@ class ChatGPT(_PluginBase):
                                         }
                                     }
                                 ]
+                            },
+                            {
+                                'component': 'VCol',
+                                'props': {
+                                    'cols': 12,
+                                    'md': 3
+                                },
+                                'content': [
+                                    {
+                                        'component': 'VSwitch',
+                                        'props': {
+                                            'model': 'batch_recognize',
+                                            'label': '合并识别请求',
+                                        }
+                                    }
+                                ]
+                            },
+                            {
+                                'component': 'VCol',
+                                'props': {
+                                    'cols': 12,
+                                    'md': 3
+                                },
+                                'content': [
+                                    {
+                                        'component': 'VSwitch',
+                                        'props': {
+                                            'model': 'session_summary',
+                                            'label': '压缩历史对话',
+                                        }
+                                    }
+                                ]
                             }
                         ]
                     },
@@ -272,6 +358,45 @@ class ChatGPT(_PluginBase):
                             }
                         ]
                     },
+                    {
+                        'component': 'VRow',
+                        'content': [
+                            {
+                                'component': 'VCol',
+                                'props': {
+                                    'cols': 12,
+                                    'md': 4
+                                },
+                                'content': [
+                                    {
+                                        'component': 'VTextField',
+                                        'props': {
+                                            'model': 'key_rpm',
+                                            'label': '单密钥每分钟请求数',
+                                            'placeholder': '0为不限制',
+                                        }
+                                    }
+                                ]
+                            },
+                            {
+                                'component': 'VCol',
+                                'props': {
+                                    'cols': 12,
+                                    'md': 4
+                                },
+                                'content': [
+                                    {
+                                        'component': 'VTextField',
+                                        'props': {
+                                            'model': 'session_tokens',
+                                            'label': '会话Token上限',
+                                            'placeholder': '0为不限制',
+                                        }
+                                    }
+                                ]
+                            }
+                        ]
+                    },
                     {
                         'component': 'VRow',
                         'content': [
@@ -313,6 +438,8 @@ class ChatGPT(_PluginBase):
                                                     '开启辅助识别后，内置识别功能无法正常识别种子/文件名称时，将使用ChatGTP进行AI辅助识别，可以提升动漫等非规范命名的识别成功率。'
                                                     '支持输入多个API密钥（以逗号分隔），在密钥调用失败时将自动切换到下一个可用密钥。'
                                                     '开启通知选项后，将在API密钥调用失败时发送系统通知。'
+                                                    '辅助识别结果会按文件名缓存，开启合并识别请求后，短时间内的多个识别请求将合并为一次调用。'
+                                                    '对话历史超过会话Token上限时将移除较早的对话，开启压缩历史对话后会将其压缩为摘要保留。'
                                         }
                                     }
                                 ]
@@ -327,6 +454,10 @@ class ChatGPT(_PluginBase):
             "compatible": False,
             "recognize": False,
             "notify": False,
+            "batch_recognize": False,
+            "key_rpm": 0,
+            "session_tokens": 4000,
+            "session_summary": False,
             "openai_url": "https://api.openai.com",
             "openai_key": "",
             "model": "gpt-3.5-turbo",
@@ -363,7 +494,7 @@ class ChatGPT(_PluginBase):
         """
         if not self._enabled:
             return
-        if not self.openai:
+        if not self._clients:
             return
         text = event.event_data.get("text")
         userid = event.event_data.get("userid")
@@ -373,40 +504,14 @@ class ChatGPT(_PluginBase):
         if text.startswith("http") or text.startswith("magnet") or text.startswith("ftp"):
             return
 
-        # 尝试获取响应，失败时切换API密钥
-        retry_count = 0
-        max_retries = len(self._api_keys)
-
-        while retry_count < max_retries:
-            response = self.openai.get_response(text=text, userid=userid)
-
-            # 判断响应是否正常
-            is_error, error_msg = self.is_api_error(response)
-            logger.info(f"ChatGPT返回结果：{response}")
-
-            if is_error:
-                current_key = self._api_keys[self._current_key_index]
-                switched, switch_error = self.switch_to_next_key(current_key)
-
-                # 发送密钥失效通知
-                if self._notify:
-                    message = f"API密钥 {current_key} 调用失败: {error_msg}"
-                    self.post_message(channel=channel, title=message, userid=userid)
-
-                    # 如果所有密钥都失效，发送额外通知
-                    if not switched:
-                        message = switch_error
-                        self.post_message(mtype=NotificationType.Plugin, title="ChatGpt", text=message)
-
-                if not switched:
-                    # 所有密钥都失效，发送消息并退出
-                    return
-
-                retry_count += 1
-            else:
-                # 成功获取响应
-                self.post_message(channel=channel, title=response, userid=userid)
-                return
+        # 尝试获取响应，失败时换用其它API密钥
+        response = self.__request(lambda client: client.get_response(text=text, userid=userid),
+                                  channel=channel, userid=userid)
+        logger.info(f"ChatGPT返回结果：{response}")
+        if response is not None:
+            # 成功获取响应
+            self.post_message(channel=channel, title=response, userid=userid)
+            return
 
         # 所有重试都失败
         if self._notify:
@@ -414,12 +519,42 @@ class ChatGPT(_PluginBase):
                               title="无法获取ChatGPT响应，所有API密钥都已失效",
                               userid=userid)
 
+    @staticmethod
+    def __check_media_name(response) -> Tuple[bool, str]:
+        """
+        返回字典中没有name字段，也视为错误
+        """
+        if isinstance(response, dict) and not response.get("name"):
+            return True, "未返回有效识别结果"
+        return False, ""
+
+    def __recognize_one(self, title: str) -> Optional[dict]:
+        """
+        识别单个标题，失败时换用其它API密钥
+        """
+        return self.__request(lambda client: client.get_media_name(filename=title),
+                              check=self.__check_media_name)
+
+    def __recognize_batch(self, titles: List[str]) -> List[Optional[dict]]:
+        """
+        合并识别多个标题，批量结果中缺失的标题再单独识别
+        """
+        if len(titles) == 1:
+            return [self.__recognize_one(titles[0])]
+        results = self.__request(lambda client: client.get_media_names(filenames=titles))
+        if not isinstance(results, list):
+            results = [None] * len(titles)
+        logger.info(f"ChatGPT合并识别 {len(titles)} 个标题，"
+                    f"成功 {len([r for r in results if r and r.get('name')])} 个")
+        return [result if result and result.get("name") else self.__recognize_one(title)
+                for title, result in zip(titles, results)]
+
     @eventmanager.register(ChainEventType.NameRecognize)
     def recognize(self, event: Event):
         """
         监听识别事件，使用ChatGPT辅助识别名称
         """
-        if not self.openai:
+        if not self._clients:
             return
         if not self._recognize:
             return
@@ -429,52 +564,31 @@ class ChatGPT(_PluginBase):
         if not title:
             return
 
-        # 尝试获取媒体名称，失败时切换API密钥
-        retry_count = 0
-        max_retries = len(self._api_keys)
-
-        while retry_count < max_retries:
-            response = self.openai.get_media_name(filename=title)
-            logger.info(f"ChatGPT返回结果：{response}")
-
-            # 判断响应是否正常
-            is_error, error_msg = self.is_api_error(response)
-
-            # 如果不是错误但返回字典中没有name字段，也视为错误
-            if not is_error and isinstance(response, dict) and not response.get("name"):
-                is_error = True
-                error_msg = "未返回有效识别结果"
-
-            if is_error:
-                # 发生错误，尝试切换密钥
-                current_key = self._api_keys[self._current_key_index]
-                switched, switch_error = self.switch_to_next_key(current_key)
-
-                # 发送密钥失效通知 (通过系统通知，因为这里没有用户交互)
-                if self._notify:
-                    message = f"API密钥 {current_key} 调用失败: {error_msg}"
-                    self.post_message(mtype=NotificationType.Plugin, title="ChatGpt", text=message)
-
-                    # 如果所有密钥都失效，发送额外通知
-                    if not switched:
-                        message = switch_error
-                        self.post_message(mtype=NotificationType.Plugin, title="ChatGpt", text=message)
-
-                if not switched:
-                    # 所有密钥都失效
-                    return
-
-                retry_count += 1
+        # 优先使用缓存的识别结果
+        version = next(iter(self._clients.values())).prompt_version
+        response = self._recognize_cache.get(version, title) if self._recognize_cache else None
+        if response:
+            logger.info(f"ChatGPT识别命中缓存：{title}")
+        else:
+            # 尝试获取媒体名称，失败时换用其它API密钥
+            if self._batcher:
+                response = self._batcher.submit(title)
             else:
-                # 成功获取结果
-                event.event_data = {
-                    'title': title,
-                    'name': response.get("name"),
-                    'year': response.get("year"),
-                    'season': response.get("season"),
-                    'episode': response.get("episode")
-                }
-                return
+                response = self.__recognize_one(title)
+            logger.info(f"ChatGPT返回结果：{response}")
+            if response and response.get("name") and self._recognize_cache:
+                self._recognize_cache.put(version, title, response)
+
+        if response and response.get("name"):
+            # 成功获取结果
+            event.event_data = {
+                'title': title,
+                'name': response.get("name"),
+                'year': response.get("year"),
+                'season': response.get("season"),
+                'episode': response.get("episode")
+            }
+            return
 
         # 所有重试都失败
         if self._notify:
@@ -487,4 +601,6 @@ class ChatGPT(_PluginBase):
         """
         退出插件
         """
-        pass
+        if self._batcher:
+            self._batcher.flush()
+            self._batcher = None
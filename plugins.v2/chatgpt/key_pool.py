@@ -0,0 +1,97 @@
+import threading
+import time
+from collections import deque
+from typing import Dict, List, Optional
+
+
+class KeyPool:
+    """
+    API密钥池，多个线程可同时取用密钥
+    按每个密钥近一分钟的请求数和进行中的请求数选择负载最低的密钥，调用失败的密钥按失败次数指数退避冷却
+    """
+
+    def __init__(self, keys: List[str], rpm: int = 0, cooldown: int = 300, max_cooldown: int = 3600):
+        self._keys = list(dict.fromkeys(keys))
+        self._rpm = max(int(rpm or 0), 0)
+        self._cooldown = cooldown
+        self._max_cooldown = max_cooldown
+        self._cond = threading.Condition()
+        self._stats: Dict[str, dict] = {
+            key: {
+                "inflight": 0,
+                "success": 0,
+                "failures": 0,
+                "disabled_until": 0.0,
+                "recent": deque()
+            } for key in self._keys
+        }
+
+    def __len__(self):
+        return len(self._keys)
+
+    def acquire(self) -> Optional[str]:
+        """
+        取用一个密钥，全部密钥处于冷却时返回None，达到每分钟请求上限时等待
+        """
+        with self._cond:
+            while True:
+                now = time.time()
+                alive = [key for key in self._keys if self._stats[key]["disabled_until"] <= now]
+                if not alive:
+                    return None
+                for key in alive:
+                    recent = self._stats[key]["recent"]
+                    while recent and now - recent[0] >= 60:
+                        recent.popleft()
+                available = [key for key in alive
+                             if not self._rpm or len(self._stats[key]["recent"]) < self._rpm]
+                if available:
+                    key = min(available,
+                              key=lambda k: (self._stats[k]["inflight"], len(self._stats[k]["recent"])))
+                    stat = self._stats[key]
+                    stat["inflight"] += 1
+                    stat["recent"].append(now)
+                    return key
+                # 等待最早的请求移出统计窗口
+                wait = min(60 - (now - self._stats[key]["recent"][0]) for key in alive)
+                self._cond.wait(max(wait, 0.1))
+
+    def release(self, key: str, success: bool):
+        """
+        归还密钥并记录调用结果
+        """
+        with self._cond:
+            stat = self._stats.get(key)
+            if not stat:
+                return
+            stat["inflight"] = max(stat["inflight"] - 1, 0)
+            if success:
+                stat["success"] += 1
+                stat["failures"] = 0
+                stat["disabled_until"] = 0.0
+            else:
+                stat["failures"] += 1
+                stat["disabled_until"] = time.time() + min(self._cooldown * 2 ** (stat["failures"] - 1),
+                                                           self._max_cooldown)
+            self._cond.notify_all()
+
+    def all_disabled(self) -> bool:
+        with self._cond:
+            now = time.time()
+            return all(stat["disabled_until"] > now for stat in self._stats.values())
+
+    def stats(self) -> Dict[str, dict]:
+        """
+        各密钥的调用统计
+        """
+        with self._cond:
+            now = time.time()
+            return {
+                key: {
+                    "inflight": stat["inflight"],
+                    "success": stat["success"],
+                    "failures": stat["failures"],
+                    "rpm": sum(1 for t in stat["recent"] if now - t < 60),
+                    "disabled": stat["disabled_until"] > now
+                } for key, stat in self._stats.items()
+            }
@@ -1,79 +1,192 @@
+import hashlib
 import json
+import math
 import re
+import threading
 import time
-from typing import List, Union
+from typing import List, Optional, Tuple, Union
 
 import openai
 from cacheout import Cache
 
-OpenAISessionCache = Cache(maxsize=100, ttl=3600, timer=time.time, default=None)
+from app.log import logger
+
+OpenAISessionCache = Cache(maxsize=1000, ttl=3600, timer=time.time, default=None)
+
+# 中日韩字符，大约每个字符一个Token
+CJK_PATTERN = re.compile(r'[\u3000-\u303f\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uff00-\uffef]')
+
+
+class ChatSession:
+    """
+    对话会话，只保存历史摘要和 (角色, 内容, Token数) 元组，系统提示词由所有会话共用
+    """
+    __slots__ = ("summary", "summary_tokens", "turns", "tokens", "pending", "summarizing", "lock")
+
+    def __init__(self):
+        self.summary: str = ""
+        self.summary_tokens: int = 0
+        self.turns: List[Tuple[str, str, int]] = []
+        # 历史对话的Token数，不含系统提示词和摘要
+        self.tokens: int = 0
+        # 已移除、待压缩为摘要的对话
+        self.pending: List[Tuple[str, str, int]] = []
+        self.summarizing: bool = False
+        self.lock = threading.Lock()
+
+    def append(self, role: str, content: str):
+        tokens = OpenAi.estimate_tokens(content)
+        self.turns.append((role, content, tokens))
+        self.tokens += tokens
+
+    def pop_oldest(self) -> List[Tuple[str, str, int]]:
+        """
+        移除最早的一轮对话（一问一答）
+        """
+        count = 2 if len(self.turns) > 1 and self.turns[0][0] == "user" and self.turns[1][0] == "assistant" else 1
+        dropped, self.turns = self.turns[:count], self.turns[count:]
+        self.tokens -= sum(turn[2] for turn in dropped)
+        return dropped
 
 
 class OpenAi:
     _api_key: str = None
     _api_url: str = None
+    _api_base: str = None
     _model: str = "gpt-3.5-turbo"
     _prompt: str = '接下来我会给你一个电影或电视剧的文件名，你需要识别文件名中的名称、版本、分段、年份、分瓣率、季集等信息，并按以下JSON格式返回：{"name":string,"version":string,"part":string,"year":string,"resolution":string,"season":number|null,"episode":number|null}，特别注意返回结果需要严格附合JSON格式，不需要有任何其它的字符。如果中文电影或电视剧的文件名中存在谐音字或字母替代的情况，请还原最有可能的结果。'
+    _session_prompt: str = "请在接下来的对话中请使用中文回复，并且内容尽可能详细。"
+    _summary_prompt: str = "请将以下对话内容压缩为简洁的摘要，保留关键事实、用户偏好和未完成的问题，摘要不超过200字，直接输出摘要内容。"
+    # 单个会话的Token上限，0为不限制
+    _session_tokens: int = 0
+    # 超出上限时是否将较早的对话压缩为摘要
+    _session_summary: bool = False
+    _batch_prompt: str = '接下来我会给你一个JSON数组，数组中的每个元素是一个文件名，请对每个文件名按上述要求识别，并按输入顺序返回由识别结果组成的JSON数组，数组长度必须与输入一致，不需要有任何其它的字符。'
 
     def __init__(self, api_key: str = None, api_url: str = None, proxy: dict = None, model: str = None, compatible:
-    bool = False, customize_prompt: str = None):
+    bool = False, customize_prompt: str = None, session_tokens: int = 0, session_summary: bool = False):
         self._api_key = api_key
         self._api_url = api_url
+        # 多个密钥的客户端同时使用，地址和密钥随请求传递，不修改全局配置
         if compatible:
-            openai.api_base = self._api_url
+            self._api_base = self._api_url
         else:
-            openai.api_base = self._api_url + "/v1"
-        openai.api_key = self._api_key
+            self._api_base = self._api_url + "/v1"
         if proxy and proxy.get("https"):
             openai.proxy = proxy.get("https")
         if model:
             self._model = model
         if customize_prompt:
             self._prompt = customize_prompt
+        self._session_tokens = max(int(session_tokens or 0), 0)
+        self._session_summary = bool(session_summary)
+
     def get_state(self) -> bool:
         return True if self._api_key else False
 
+    @property
+    def prompt_version(self) -> str:
+        """
+        识别提示词版本，模型或提示词变化后识别缓存失效
+        """
+        return hashlib.sha1(f"{self._model}\n{self._prompt}".encode("utf-8")).hexdigest()[:16]
+
     @staticmethod
-    def __save_session(session_id: str, message: str):
+    def estimate_tokens(text: str) -> int:
+        """
+        估算文本的Token数，中日韩字符按每字一个计算，其它字符按每4个一个计算，另加消息格式开销
+        """
+        if not text:
+            return 4
+        cjk = len(CJK_PATTERN.findall(text))
+        return cjk + math.ceil((len(text) - cjk) / 4) + 4
+
+    def __save_session(self, session_id: str, message: str):
         """
         保存会话
         :param session_id: 会话ID
         :param message: 消息
         :return:
         """
-        seasion = OpenAISessionCache.get(session_id)
+        seasion: ChatSession = OpenAISessionCache.get(session_id)
         if seasion:
-            seasion.append({
-                "role": "assistant",
-                "content": message
-            })
+            with seasion.lock:
+                seasion.append("assistant", message)
             OpenAISessionCache.set(session_id, seasion)
 
-    @staticmethod
-    def __get_session(session_id: str, message: str) -> List[dict]:
+    def __get_session(self, session_id: str, message: str) -> List[dict]:
         """
         获取会话
         :param session_id: 会话ID
         :return: 会话上下文
         """
-        seasion = OpenAISessionCache.get(session_id)
-        if seasion:
-            seasion.append({
-                "role": "user",
-                "content": message
-            })
-        else:
-            seasion = [
-                {
-                    "role": "system",
-                    "content": "请在接下来的对话中请使用中文回复，并且内容尽可能详细。"
-                },
-                {
-                    "role": "user",
-                    "content": message
-                }]
+        seasion: ChatSession = OpenAISessionCache.get(session_id)
+        if not seasion:
+            seasion = ChatSession()
             OpenAISessionCache.set(session_id, seasion)
-        return seasion
+        with seasion.lock:
+            # 换用其它密钥重试时不重复记录同一条消息
+            if not seasion.turns or seasion.turns[-1][:2] != ("user", message):
+                seasion.append("user", message)
+            self.__trim_session(seasion)
+            system_prompt = self._session_prompt
+            if seasion.summary:
+                system_prompt = f"{system_prompt}\n以下是之前对话的摘要：\n{seasion.summary}"
+            return [{"role": "system", "content": system_prompt}] + [
+                {"role": role, "content": content} for role, content, _ in seasion.turns
+            ]
+
+    def __trim_session(self, seasion: ChatSession):
+        """
+        会话超出Token上限时移除较早的对话，保留最新的用户消息
+        超出后裁剪到上限的3/4，避免每轮都触发裁剪和摘要
+        """
+        if not self._session_tokens:
+            return
+        fixed_tokens = self.estimate_tokens(self._session_prompt) + seasion.summary_tokens
+        if fixed_tokens + seasion.tokens <= self._session_tokens:
+            return
+        target = self._session_tokens * 3 // 4
+        dropped = []
+        while len(seasion.turns) > 1 and fixed_tokens + seasion.tokens > target:
+            dropped.extend(seasion.pop_oldest())
+        if dropped and self._session_summary:
+            seasion.pending.extend(dropped)
+
+    def __update_summary(self, session_id: str):
+        """
+        将待压缩的对话合并到会话摘要，在回复后调用，请求摘要期间不持有会话锁
+        """
+        if not self._session_summary:
+            return
+        seasion: ChatSession = OpenAISessionCache.get(session_id)
+        if not seasion:
+            return
+        with seasion.lock:
+            if seasion.summarizing or not seasion.pending:
+                return
+            seasion.summarizing = True
+            summary, turns, seasion.pending = seasion.summary, seasion.pending, []
+        new_summary = self.__summarize(summary, turns)
+        with seasion.lock:
+            seasion.summarizing = False
+            if new_summary:
+                seasion.summary = new_summary
+                seasion.summary_tokens = self.estimate_tokens(new_summary)
+
+    def __summarize(self, summary: str, turns: List[Tuple[str, str, int]]) -> Optional[str]:
+        """
+        将已有摘要和移除的对话压缩为新的摘要
+        """
+        history = "\n".join(f"{'用户' if role == 'user' else '助手'}：{content}" for role, content, _ in turns)
+        if summary:
+            history = f"之前的摘要：{summary}\n{history}"
+        try:
+            completion = self.__get_model(prompt=self._summary_prompt, message=history, temperature=0)
+            return completion.choices[0].message.content.strip()
+        except Exception as e:
+            logger.warn(f"压缩会话失败：{str(e)}")
+            return None
 
     def __get_model(self, message: Union[str, List[dict]],
                     prompt: str = None,
@@ -104,6 +217,8 @@ class OpenAi:
         return openai.ChatCompletion.create(
             model=self._model,
             user=user,
+            api_key=self._api_key,
+            api_base=self._api_base,
             messages=message,
             **kwargs
         )
@@ -131,21 +246,55 @@ class OpenAi:
             _filename_prompt = self._prompt
             completion = self.__get_model(prompt=_filename_prompt, message=filename)
             result = completion.choices[0].message.content
-            # 有些模型返回json数据时会使用 ```json ``` 包裹json对象 所以需要进行提取
-            # 定义正则表达式模式，匹配```json开头和```结尾的内容
-            pattern = r'^```json\s*([\s\S]*?)\s*```$'
-            # 使用正则表达式进行匹配
-            match = re.match(pattern, result.strip())
-            if match:
-                # 提取中间的JSON部分
-                result = match.group(1)
-            return json.loads(result)
+            return self.__parse_json(result)
         except Exception as e:
             return {
                 "content": result,
                 "errorMsg": str(e)
             }
 
+    def get_media_names(self, filenames: List[str]) -> Union[List[Optional[dict]], dict]:
+        """
+        一次请求识别多个文件名
+        :param filenames: 文件名列表
+        :return: 与输入顺序一致的识别结果列表，无法对应的位置为None；请求失败时返回错误信息
+        """
+        if not self.get_state():
+            return None
+        result = ""
+        try:
+            completion = self.__get_model(prompt=f"{self._prompt}\n{self._batch_prompt}",
+                                          message=json.dumps(filenames, ensure_ascii=False))
+            result = completion.choices[0].message.content
+        except Exception as e:
+            return {
+                "content": result,
+                "errorMsg": str(e)
+            }
+        try:
+            items = self.__parse_json(result)
+        except Exception as e:
+            logger.warn(f"解析批量识别结果失败：{str(e)}：{result}")
+            return [None] * len(filenames)
+        if not isinstance(items, list) or len(items) != len(filenames):
+            return [None] * len(filenames)
+        return [item if isinstance(item, dict) else None for item in items]
+
+    @staticmethod
+    def __parse_json(result: str):
+        """
+        解析模型返回的JSON
+        """
+        # 有些模型返回json数据时会使用 ```json ``` 包裹json对象 所以需要进行提取
+        # 定义正则表达式模式，匹配```json开头和```结尾的内容
+        pattern = r'^```json\s*([\s\S]*?)\s*```$'
+        # 使用正则表达式进行匹配
+        match = re.match(pattern, result.strip())
+        if match:
+            # 提取中间的JSON部分
+            result = match.group(1)
+        return json.loads(result)
+
     def get_response(self, text: str, userid: str):
         """
         聊天对话，获取答案
@@ -168,7 +317,9 @@ class OpenAi:
             completion = self.__get_model(message=messages, user=userid)
             result = completion.choices[0].message.content
             if result:
-                self.__save_session(userid, text)
+                self.__save_session(userid, result)
+                # 使用本次请求的密钥压缩被裁剪的历史对话
+                self.__update_summary(userid)
             return result
         except openai.error.RateLimitError as e:
             return f"请求被ChatGPT拒绝了，{str(e)}"
@@ -0,0 +1,157 @@
+import json
+import re
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future
+from typing import Callable, Dict, List, Optional, Tuple
+
+from app.log import logger
+
+# 集数匹配规则，命中后替换为占位符，使同一发布组的不同集共用一条缓存
+EPISODE_PATTERNS = [
+    re.compile(r"(?<=s\d\d)e(\d{1,4})", re.IGNORECASE),
+    re.compile(r"(?<=s\d)e(\d{1,4})", re.IGNORECASE),
+    re.compile(r"第\s*(\d{1,4})\s*[集话話]"),
+    re.compile(r"(?<=\s-\s)(\d{1,4})(?:v\d)?(?=[\s\[(.]|$)"),
+    re.compile(r"(?<=\[)(\d{1,3})(?=(?:v\d)?])"),
+    re.compile(r"(?<=\s)ep?(\d{1,4})(?=[\s\[(.]|$)", re.IGNORECASE),
+]
+# 年份及常见分辨率，不作为集数
+NOT_EPISODE_PATTERN = re.compile(r"^(?:19\d\d|20\d\d|480|540|576|720|1080|1440|2160|4320)$")
+
+
+class RecognizeCache:
+    """
+    识别结果缓存，以 (提示词版本, 归一化文件名) 为键，按过期时间和最近访问时间淘汰
+    """
+
+    def __init__(self, db_path: str, ttl: int = 30 * 24 * 3600, maxsize: int = 5000):
+        self._db_path = db_path
+        self._ttl = ttl
+        self._maxsize = maxsize
+        self._lock = threading.Lock()
+        with self.__connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS recognize ("
+                "version TEXT, pattern TEXT, result TEXT, created_at REAL, accessed_at REAL, "
+                "PRIMARY KEY (version, pattern))"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_recognize_accessed ON recognize (accessed_at)")
+
+    def __connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self._db_path)
+
+    @staticmethod
+    def normalize(title: str) -> Tuple[str, Optional[int]]:
+        """
+        归一化文件名，返回 (匹配模式, 集数)
+        """
+        title = " ".join(title.strip().lower().split())
+        for pattern in EPISODE_PATTERNS:
+            for match in pattern.finditer(title):
+                if NOT_EPISODE_PATTERN.match(match.group(1)):
+                    continue
+                return title[:match.start(1)] + "{ep}" + title[match.end(1):], int(match.group(1))
+        return title, None
+
+    def get(self, version: str, title: str) -> Optional[dict]:
+        """
+        查询缓存，命中时按当前文件名回填集数
+        """
+        pattern, episode = self.normalize(title)
+        now = time.time()
+        with self._lock, self.__connect() as conn:
+            row = conn.execute("SELECT result, created_at FROM recognize WHERE version = ? AND pattern = ?",
+                               (version, pattern)).fetchone()
+            if not row:
+                return None
+            if now - row[1] > self._ttl:
+                conn.execute("DELETE FROM recognize WHERE version = ? AND pattern = ?", (version, pattern))
+                return None
+            conn.execute("UPDATE recognize SET accessed_at = ? WHERE version = ? AND pattern = ?",
+                         (now, version, pattern))
+        result = json.loads(row[0])
+        # 缓存结果本身有集数时才按当前文件名回填
+        if episode is not None and result.get("episode") is not None:
+            result["episode"] = episode
+        return result
+
+    def put(self, version: str, title: str, result: dict):
+        """
+        写入缓存，超出容量时删除最久未访问的记录
+        """
+        pattern, _ = self.normalize(title)
+        now = time.time()
+        with self._lock, self.__connect() as conn:
+            conn.execute("INSERT OR REPLACE INTO recognize VALUES (?, ?, ?, ?, ?)",
+                         (version, pattern, json.dumps(result, ensure_ascii=False), now, now))
+            conn.execute("DELETE FROM recognize WHERE created_at < ?", (now - self._ttl,))
+            count = conn.execute("SELECT COUNT(*) FROM recognize").fetchone()[0]
+            if count > self._maxsize:
+                conn.execute("DELETE FROM recognize WHERE rowid IN "
+                             "(SELECT rowid FROM recognize ORDER BY accessed_at, rowid LIMIT ?)",
+                             (count - self._maxsize,))
+
+
+class RecognizeBatcher:
+    """
+    识别请求合并，在时间窗口内收集待识别标题，合并为一次请求后将结果分发给各等待线程
+    """
+
+    def __init__(self, handler: Callable[[List[str]], List[Optional[dict]]],
+                 batch_size: int = 8, window: float = 0.5, timeout: int = 120):
+        self._handler = handler
+        self._batch_size = max(int(batch_size), 1)
+        self._window = window
+        self._timeout = timeout
+        self._lock = threading.Lock()
+        # 标题 -> 等待该标题结果的Future列表
+        self._pending: Dict[str, List[Future]] = {}
+        self._timer: Optional[threading.Timer] = None
+
+    def submit(self, title: str) -> Optional[dict]:
+        """
+        提交标题并等待识别结果
+        """
+        future = Future()
+        flush_now = False
+        with self._lock:
+            self._pending.setdefault(title, []).append(future)
+            if len(self._pending) >= self._batch_size:
+                flush_now = True
+            elif not self._timer:
+                self._timer = threading.Timer(self._window, self.flush)
+                self._timer.daemon = True
+                self._timer.start()
+        if flush_now:
+            self.flush()
+        try:
+            return future.result(timeout=self._timeout)
+        except Exception as e:
+            logger.error(f"ChatGPT批量识别等待结果失败：{str(e)}")
+            return None
+
+    def flush(self):
+        """
+        立即处理等待中的标题
+        """
+        while True:
+            with self._lock:
+                if self._timer:
+                    self._timer.cancel()
+                    self._timer = None
+                if not self._pending:
+                    return
+                titles = list(self._pending.keys())[:self._batch_size]
+                batch = {title: self._pending.pop(title) for title in titles}
+            results = []
+            try:
+                results = self._handler(titles)
+            except Exception as e:
+                logger.error(f"ChatGPT批量识别失败：{str(e)}")
+            for index, title in enumerate(titles):
+                result = results[index] if index < len(results) else None
+                for future in batch[title]:
+                    if not future.done():
+                        future.set_result(result)
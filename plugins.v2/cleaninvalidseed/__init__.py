@@ -1,4 +1,7 @@
+import bisect
+import os
 import shutil
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 from pathlib import Path
 from typing import Any, List, Dict, Tuple, Optional
@@ -64,6 +67,10 @@ class CleanInvalidSeed(_PluginBase):
         "err torrent banned",
     ]
     _custom_error_msg = ""
+    # 统计文件大小的并发线程数
+    _size_workers = 8
+    # 单条通知消息中最多包含的无效源文件数量
+    _message_chunk_size = 100
 
     def init_plugin(self, config: dict = None):
 
@@ -571,7 +578,6 @@ class CleanInvalidSeed(_PluginBase):
         source_path_map = {}
         source_paths = []
         total_size = 0
-        deleted_file_cnt = 0
         exclude_key_words = (
             self._exclude_keywords.split("\n") if self._exclude_keywords else []
         )
@@ -587,12 +593,10 @@ class CleanInvalidSeed(_PluginBase):
             mp_path, qb_path = path.split(":")
             source_path_map[mp_path] = qb_path
             source_paths.append(mp_path)
-        # 所有做种源文件路径
-        content_path_set = set()
-        for torrent in all_torrents:
-            content_path_set.add(torrent.content_path)
+        # 所有做种源文件路径，排序后通过二分查找判断是否存在以指定路径为前缀的做种路径
+        content_paths = sorted({torrent.content_path for torrent in all_torrents if torrent.content_path})
 
-        message = "检测未做种无效源文件：\n"
+        invalid_files = []
         for source_path_str in source_paths:
             source_path = Path(source_path_str)
             # 判断source_path是否存在
@@ -604,11 +608,8 @@ class CleanInvalidSeed(_PluginBase):
                     text=f"{source_path} 不存在，无法检测未做种无效源文件",
                 )
                 continue
-            source_files = []
             # 获取source_path下的所有文件包括文件夹
-            for file in source_path.iterdir():
-                source_files.append(file)
-            for source_file in source_files:
+            for source_file in source_path.iterdir():
                 skip = False
                 for key_word in exclude_key_words:
                     if key_word in source_file.name:
@@ -621,23 +622,31 @@ class CleanInvalidSeed(_PluginBase):
                 qb_path = (str(source_file)).replace(
                     source_path_str, source_path_map[source_path_str]
                 )
-                # todo: 优化性能
-                is_exist = False
-                for content_path in content_path_set:
-                    if qb_path in content_path:
-                        is_exist = True
-                        break
+                if not self.has_prefix(content_paths, qb_path):
+                    invalid_files.append(source_file)
+
+        # 并发统计无效源文件大小
+        with ThreadPoolExecutor(max_workers=self._size_workers) as executor:
+            sizes = executor.map(self.get_size, invalid_files)
 
-                if not is_exist:
-                    deleted_file_cnt += 1
-                    message += f"{deleted_file_cnt}. {str(source_file)}\n"
-                    total_size += self.get_size(source_file)
-                    if self._delete_invalid_files:
-                        if source_file.is_file():
-                            source_file.unlink()
-                        elif source_file.is_dir():
-                            shutil.rmtree(source_file)
+            # 逐个输出检测结果，消息按数量分段发送
+            message_lines = []
+            for index, (source_file, file_size) in enumerate(zip(invalid_files, sizes), start=1):
+                total_size += file_size
+                line = f"{index}. {str(source_file)}"
+                logger.info(f"检测到未做种的无效源文件 {line}，大小 {StringUtils.str_filesize(file_size)}")
+                message_lines.append(line)
+                if self._delete_invalid_files:
+                    if source_file.is_file():
+                        source_file.unlink()
+                    elif source_file.is_dir():
+                        shutil.rmtree(source_file)
+                if len(message_lines) >= self._message_chunk_size:
+                    self.__post_invalid_files_message(message_lines)
+                    message_lines = []
 
+        deleted_file_cnt = len(invalid_files)
+        message = "\n".join(message_lines) + "\n" if message_lines else ""
         message += f"检测到{deleted_file_cnt}个未做种的无效源文件，共占用{StringUtils.str_filesize(total_size)}空间。\n"
         if self._delete_invalid_files:
             message += f"***已删除无效源文件，释放{StringUtils.str_filesize(total_size)}空间!***\n"
@@ -647,19 +656,54 @@ class CleanInvalidSeed(_PluginBase):
             self.post_message(
                 mtype=NotificationType.SiteMessage,
                 title=f"【清理无效做种】",
-                text=message,
+                text="检测未做种无效源文件：\n" + message,
             )
         logger.info("检测无效源文件任务结束")
 
+    def __post_invalid_files_message(self, message_lines: List[str]):
+        """
+        分段发送检测到的无效源文件
+        """
+        if not self._notify:
+            return
+        message = "\n".join(message_lines).replace("_", "\\_")
+        self.post_message(
+            mtype=NotificationType.SiteMessage,
+            title="【清理无效做种】",
+            text="检测未做种无效源文件：\n" + message,
+        )
+
     @staticmethod
-    def get_size(path: Path):
+    def has_prefix(sorted_paths: List[str], prefix: str) -> bool:
+        """
+        判断已排序的路径列表中是否存在以prefix开头的路径
+        """
+        index = bisect.bisect_left(sorted_paths, prefix)
+        return index < len(sorted_paths) and sorted_paths[index].startswith(prefix)
+
+    @staticmethod
+    def get_size(path: Path) -> int:
+        """
+        统计文件或文件夹大小，使用os.scandir遍历以减少stat调用
+        """
+        try:
+            if path.is_file():
+                return path.stat().st_size
+        except OSError:
+            return 0
         total_size = 0
-        if path.is_file():
-            return path.stat().st_size
-        # rglob 方法用于递归遍历所有文件和目录
-        for entry in path.rglob("*"):
-            if entry.is_file():
-                total_size += entry.stat().st_size
+        stack = [str(path)]
+        while stack:
+            current = stack.pop()
+            try:
+                with os.scandir(current) as entries:
+                    for entry in entries:
+                        if entry.is_dir(follow_symlinks=False):
+                            stack.append(entry.path)
+                        elif entry.is_file(follow_symlinks=False):
+                            total_size += entry.stat(follow_symlinks=False).st_size
+            except OSError as e:
+                logger.warning(f"统计 {current} 大小失败：{e}")
         return total_size
 
     def get_form(self) -> Tuple[List[dict], Dict[str, Any]]:
@@ -1,11 +1,14 @@
 import hashlib
+import multiprocessing
 import os
+import queue
 import re
-import time
+import sqlite3
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from datetime import datetime, timedelta
 from pathlib import Path
 from threading import Event
-from typing import Any, Dict, List, Optional, Tuple, Union
+from typing import Any, Dict, List, Optional, Set, Tuple, Union
 
 import pytz
 import requests
@@ -116,8 +119,166 @@ class TorInfo:
         return f"{self.site_name}:{self.pieces_hash}"
 
 
+class TorInfoCache:
+    """
+    本地种子文件解析缓存，以种子路径+修改时间+文件大小为键，只有新增或变更的种子文件才需要重新解析
+    """
+    # 单条SQL中的参数数量上限
+    _chunk_size = 500
+
+    def __init__(self, db_path: str):
+        self._db_path = db_path
+        with self.__connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS torrent_info ("
+                "path TEXT PRIMARY KEY, mtime INTEGER, size INTEGER, "
+                "info_hash TEXT, pieces_hash TEXT, announce TEXT)"
+            )
+
+    def __connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self._db_path)
+
+    def get_many(self, stats: Dict[str, os.stat_result]) -> Dict[str, TorInfo]:
+        """
+        批量获取未发生变更的种子信息
+        """
+        result = {}
+        if not stats:
+            return result
+        rows = []
+        paths = list(stats.keys())
+        with self.__connect() as conn:
+            for i in range(0, len(paths), self._chunk_size):
+                chunk = paths[i:i + self._chunk_size]
+                rows.extend(conn.execute(
+                    "SELECT path, mtime, size, info_hash, pieces_hash, announce FROM torrent_info "
+                    f"WHERE path IN ({','.join('?' * len(chunk))})", chunk
+                ).fetchall())
+        for path, mtime, size, info_hash, pieces_hash, announce in rows:
+            stat = stats.get(path)
+            if not stat or stat.st_mtime_ns != mtime or stat.st_size != size:
+                continue
+            tor_info = TorInfo.local(torrent_path=path, info_hash=info_hash, pieces_hash=pieces_hash)
+            tor_info.torrent_announce = announce
+            result[path] = tor_info
+        return result
+
+    def put_many(self, stats: Dict[str, os.stat_result], tor_infos: List[TorInfo]):
+        """
+        批量写入种子信息
+        """
+        rows = []
+        for tor_info in tor_infos:
+            stat = stats.get(tor_info.torrent_path)
+            if not stat:
+                continue
+            announce = tor_info.torrent_announce
+            if isinstance(announce, bytes):
+                announce = announce.decode("utf-8", errors="ignore")
+            rows.append((tor_info.torrent_path, stat.st_mtime_ns, stat.st_size,
+                         tor_info.info_hash, tor_info.pieces_hash, announce))
+        if not rows:
+            return
+        with self.__connect() as conn:
+            conn.executemany("INSERT OR REPLACE INTO torrent_info VALUES (?, ?, ?, ?, ?, ?)", rows)
+
+    def prune(self, seen_paths: Set[str]) -> int:
+        """
+        删除种子文件已不存在的缓存记录，本次扫描中已读取过的种子文件不再检查，返回删除数量
+        """
+        with self.__connect() as conn:
+            paths = [row[0] for row in conn.execute("SELECT path FROM torrent_info")]
+            removed = [(path,) for path in paths if path not in seen_paths and not os.path.exists(path)]
+            if removed:
+                conn.executemany("DELETE FROM torrent_info WHERE path = ?", removed)
+        return len(removed)
+
+
+def _parse_local_torrent(torrent_path: str) -> Tuple[str, Optional[TorInfo], str]:
+    """
+    解析本地种子文件，供进程池调用
+    """
+    local_tor, err = CrossSeedHelper.get_local_torrent_info(torrent_path)
+    return torrent_path, local_tor, err
+
+
 class CrossSeedHelper(object):
     _version = "0.2.0"
+    # 未命中缓存的种子数超过该值时，使用进程池并行解析
+    _parallel_threshold = 200
+    # 并行解析的最大进程数
+    _parallel_workers = 4
+
+    def __init__(self, cache_path: str = None):
+        self._cache = None
+        if cache_path:
+            try:
+                self._cache = TorInfoCache(cache_path)
+            except Exception as err:
+                logger.warn(f"种子信息缓存初始化失败，将直接读取种子文件：{err}")
+        # 本次辅种任务中已读取过的种子文件
+        self._seen_paths: Set[str] = set()
+
+    def get_local_torrent_infos(self, torrent_paths: List[str]) -> Dict[str, Tuple[Optional[TorInfo], str]]:
+        """
+        批量获取本地种子信息，优先读取缓存，仅解析新增或变更的种子文件
+        """
+        stats = {}
+        results = {}
+        for torrent_path in torrent_paths:
+            try:
+                stats[torrent_path] = os.stat(torrent_path)
+            except OSError as err:
+                results[torrent_path] = (None, str(err))
+        self._seen_paths.update(stats.keys())
+
+        cached = {}
+        if self._cache:
+            try:
+                cached = self._cache.get_many(stats)
+            except Exception as err:
+                logger.warn(f"读取种子信息缓存失败：{err}")
+        for torrent_path, tor_info in cached.items():
+            results[torrent_path] = (tor_info, "")
+
+        missing = [torrent_path for torrent_path in stats if torrent_path not in cached]
+        if missing:
+            logger.info(f"种子信息缓存命中 {len(cached)} 个，需要解析的种子文件 {len(missing)} 个")
+            parsed = self.__parse_local_torrents(missing)
+            results.update({path: (tor_info, err) for path, tor_info, err in parsed})
+            if self._cache:
+                try:
+                    self._cache.put_many(stats, [tor_info for _, tor_info, _ in parsed if tor_info])
+                except Exception as err:
+                    logger.warn(f"写入种子信息缓存失败：{err}")
+        return results
+
+    def __parse_local_torrents(self, torrent_paths: List[str]) -> List[Tuple[str, Optional[TorInfo], str]]:
+        if len(torrent_paths) >= self._parallel_threshold:
+            try:
+                # 主程序为多线程服务，fork可能复制其它线程持有的锁，使用spawn启动子进程
+                workers = min(self._parallel_workers, os.cpu_count() or 1)
+                with ProcessPoolExecutor(max_workers=workers,
+                                         mp_context=multiprocessing.get_context("spawn")) as executor:
+                    return list(executor.map(_parse_local_torrent, torrent_paths,
+                                             chunksize=max(len(torrent_paths) // (workers * 4), 1)))
+            except Exception as err:
+                logger.warn(f"并行解析种子文件失败，改为逐个解析：{err}")
+        return [_parse_local_torrent(torrent_path) for torrent_path in torrent_paths]
+
+    def prune_cache(self):
+        """
+        清理已不存在的种子文件缓存，在每次辅种任务结束时调用
+        """
+        seen_paths, self._seen_paths = self._seen_paths, set()
+        if not self._cache:
+            return
+        try:
+            removed = self._cache.prune(seen_paths)
+            if removed:
+                logger.info(f"已清理 {removed} 条失效的种子信息缓存")
+        except Exception as err:
+            logger.warn(f"清理种子信息缓存失败：{err}")
 
     @staticmethod
     def get_local_torrent_info(torrent_path: Path | str) -> Tuple[Optional[TorInfo], str]:
@@ -138,10 +299,12 @@ class CrossSeedHelper(object):
     @staticmethod
     def get_target_torrent(
             site: CSSiteConfig,
-            pieces_hash_set: List[str]
+            pieces_hash_set: List[str],
+            session: Optional[requests.Session] = None
     ) -> Tuple[Optional[List[TorInfo]], Optional[str]]:
         """
         返回pieces_hash对应的种子信息，包括站点id,pieces_hash,种子id
+        查询间隔由调用方控制，传入session时复用该站点的长连接
         """
         headers = {
             "Content-Type": "application/json",
@@ -151,7 +314,7 @@ class CrossSeedHelper(object):
         data = {"passkey": site.passkey, "pieces_hash": pieces_hash_set}
         remote_torrent_infos = []
         try:
-            response = requests.post(
+            response = (session or requests).post(
                 site.get_api_url(),
                 headers=headers,
                 json=data,
@@ -165,7 +328,6 @@ class CrossSeedHelper(object):
                     remote_torrent_infos.append(
                         TorInfo.remote(site.name, pieces_hash, torrent_id)
                     )
-            time.sleep(site.query_gap)
         except requests.exceptions.RequestException as e:
             return None, f"站点{site.name}请求失败：{e}"
         return remote_torrent_infos, None
@@ -220,6 +382,8 @@ class CrossSeed(_PluginBase):
     _permanent_error_caches = []
     _torrentpaths = []
     _site_cs_infos = []
+    # 并发查询的最大站点数
+    _query_workers = 5
     # 辅种计数
     total = 0
     realtotal = 0
@@ -320,7 +484,8 @@ class CrossSeed(_PluginBase):
 
         # 启动定时任务 & 立即运行一次
         if self.get_state() or self._onlyonce:
-            self.cross_helper = CrossSeedHelper()
+            self.cross_helper = CrossSeedHelper(
+                cache_path=os.path.join(self.get_data_path(), "torrent_info_cache.db"))
             self._scheduler = BackgroundScheduler(timezone=settings.TZ)
 
             if self._onlyonce:
@@ -784,7 +949,7 @@ class CrossSeed(_PluginBase):
             else:
                 logger.info(f"下载器 {downloader} 没有已完成种子")
                 continue
-            hash_strs = []
+            candidates = []
             for torrent in torrents:
                 if self._event.is_set():
                     logger.info("辅种服务停止")
@@ -797,30 +962,44 @@ class CrossSeed(_PluginBase):
                 save_path = self.__get_save_path(torrent, service.type)
                 # 获取种子文件路径
                 torrent_path = Path(self._torrentpaths[idx]) / f"{hash_str}.torrent"
-                torrent_info = None
                 if not torrent_path.exists():
-                    if False and service.type == "qbittorrent":
-                        # qb开启SQLite功能后将不再以hash命名的方式保存torrent文件
-                        # TODO 导出功能需要qb4.5.0以上版本才支持
-                        logger.warn(f"QB种子文件不存在：{torrent_path} 尝试远程导出种子")
-                        try:
-                            torrent_data = torrent.export()
-                            torrent_info, err = TorInfo.from_data(torrent_data)
-                        except Exception as e:
-                            err = str(e)
-                        if not torrent_info:
-                            logger.error(f"尝试远程导出种子 {hash_str} 出错 {err}")
-                            continue
-                    else:
-                        logger.error(f"种子文件不存在：{torrent_path}")
+                    logger.error(f"种子文件不存在：{torrent_path}")
+                    continue
+
+                if self._nopaths and save_path:
+                    # 过滤不需要转移的路径
+                    nopath_skip = False
+                    for nopath in self._nopaths.split('\n'):
+                        if os.path.normpath(save_path).startswith(os.path.normpath(nopath)):
+                            logger.info(f"种子 {hash_str} 保存路径 {save_path} 不需要辅种，跳过 ...")
+                            nopath_skip = True
+                            break
+                    if nopath_skip:
                         continue
 
-                # 读取种子文件具体信息
-                if not torrent_info:
-                    torrent_info, err = self.cross_helper.get_local_torrent_info(torrent_path)
-                    if not torrent_info:
-                        logger.error(f"未能读取到种子文件具体信息：{torrent_path} {err}")
+                # 获取种子标签
+                torrent_labels = self.__get_label(torrent, service.type)
+                if torrent_labels and self._nolabels:
+                    is_skip = False
+                    for label in self._nolabels.split(','):
+                        if label in torrent_labels:
+                            logger.info(f"种子 {hash_str} 含有不辅种标签 {label}，跳过 ...")
+                            is_skip = True
+                            break
+                    if is_skip:
                         continue
+                candidates.append((torrent, hash_str, save_path, str(torrent_path)))
+
+            # 批量读取种子文件具体信息，已缓存且未变更的种子文件不再重复解析
+            local_torrent_infos = self.cross_helper.get_local_torrent_infos(
+                [torrent_path for _, _, _, torrent_path in candidates])
+
+            hash_strs = []
+            for torrent, hash_str, save_path, torrent_path in candidates:
+                torrent_info, err = local_torrent_infos.get(torrent_path) or (None, "")
+                if not torrent_info:
+                    logger.error(f"未能读取到种子文件具体信息：{torrent_path} {err}")
+                    continue
 
                 # 用站点+pieces_hash记录该站点是否已经在该下载器中,需要从tracker补充站点名字
                 tracker_urls = set()
@@ -849,28 +1028,6 @@ class CrossSeed(_PluginBase):
                         if site_info:
                             torrent_info.site_name = site_info.get("name")
 
-                if self._nopaths and save_path:
-                    # 过滤不需要转移的路径
-                    nopath_skip = False
-                    for nopath in self._nopaths.split('\n'):
-                        if os.path.normpath(save_path).startswith(os.path.normpath(nopath)):
-                            logger.info(f"种子 {hash_str} 保存路径 {save_path} 不需要辅种，跳过 ...")
-                            nopath_skip = True
-                            break
-                    if nopath_skip:
-                        continue
-
-                # 获取种子标签
-                torrent_labels = self.__get_label(torrent, service.type)
-                if torrent_labels and self._nolabels:
-                    is_skip = False
-                    for label in self._nolabels.split(','):
-                        if label in torrent_labels:
-                            logger.info(f"种子 {hash_str} 含有不辅种标签 {label}，跳过 ...")
-                            is_skip = True
-                            break
-                    if is_skip:
-                        continue
                 hash_strs.append({
                     "hash": hash_str,
                     "save_path": save_path,
@@ -882,6 +1039,8 @@ class CrossSeed(_PluginBase):
                 self.check_recheck()
             else:
                 logger.info("没有需要辅种的种子")
+        # 清理失效的种子信息缓存
+        self.cross_helper.prune_cache()
         # 保存缓存
         self.__update_config()
         # 发送消息
@@ -971,25 +1130,65 @@ class CrossSeed(_PluginBase):
         logger.info(f"去重后，总共需要辅种查询的种子数：{len(pieces_hash_set)}")
         pieces_hashes = list(pieces_hash_set)
 
-        # 分站点逐个批次辅种
-        # 逐个站点查询可辅种数据
-        chunk_size = 100
+        # 过滤已经停用的站点
+        site_configs = []
         for site_config in self._site_cs_infos:
-            # 检查站点是否已经停用
             db_site = SiteOper().get(site_config.id)
             if db_site and not db_site.is_active:
                 logger.info(f"站点{site_config.name}已停用，跳过辅种")
                 continue
-            remote_tors: List[TorInfo] = []
-            total_size = len(pieces_hashes)
-            for i in range(0, len(pieces_hashes), chunk_size):
+            site_configs.append(site_config)
+        if not site_configs:
+            return
+
+        # 多个站点并发查询，站点内按查询间隔逐个批次查询，查询结果逐批次返回后立即辅种
+        result_queue = queue.Queue()
+        remote_counts = {site_config.name: 0 for site_config in site_configs}
+        with ThreadPoolExecutor(max_workers=min(self._query_workers, len(site_configs))) as executor:
+            for site_config in site_configs:
+                executor.submit(self.__query_site_torrents, site_config, pieces_hashes, result_queue)
+            remaining = len(site_configs)
+            while remaining:
                 if self._event.is_set():
                     logger.info("辅种服务停止")
                     return
+                try:
+                    site_config, remote_tors = result_queue.get(timeout=1)
+                except queue.Empty:
+                    continue
+                # 站点查询结束
+                if remote_tors is None:
+                    remaining -= 1
+                    logger.info(f"站点{site_config.name}返回可以辅种的种子总数为{remote_counts[site_config.name]}")
+                    continue
+                remote_counts[site_config.name] += len(remote_tors)
+                if not self.__seed_remote_torrents(remote_tors=remote_tors, site_config=site_config,
+                                                   service=service, save_paths=save_paths,
+                                                   site_pieces_hash_set=site_pieces_hash_set):
+                    logger.info("辅种服务停止")
+                    return
+
+        logger.info(f"下载器 {service.name} 辅种完成")
+
+    def __query_site_torrents(self, site_config: CSSiteConfig, pieces_hashes: List[str],
+                              result_queue: queue.Queue):
+        """
+        分批次查询站点可辅种的种子，每批次结果放入队列，查询结束后放入None作为结束标记
+        """
+        chunk_size = 100
+        total_size = len(pieces_hashes)
+        session = requests.Session()
+        try:
+            for i in range(0, total_size, chunk_size):
+                if self._event.is_set():
+                    break
+                # 按站点查询间隔等待，退出事件触发时立即结束
+                if i and self._event.wait(site_config.query_gap):
+                    break
                 # 切片操作
                 chunk = pieces_hashes[i:i + chunk_size]
                 # 处理分组
-                chunk_tors, err_msg = self.cross_helper.get_target_torrent(site_config, chunk)
+                chunk_tors, err_msg = self.cross_helper.get_target_torrent(site_config, chunk, session=session)
                 if not chunk_tors and err_msg:
                     logger.info(
                         f"查询站点{site_config.name}可辅种的信息出错 {err_msg},进度={i + 1}/{total_size}"
@@ -998,45 +1197,53 @@ class CrossSeed(_PluginBase):
                     logger.info(
                         f"站点{site_config.name}本批次的可辅种/查询数={len(chunk_tors)}/{len(chunk)},进度={i + 1}/{total_size}"
                     )
-                    remote_tors = remote_tors + chunk_tors
-
-            logger.info(f"站点{site_config.name}返回可以辅种的种子总数为{len(remote_tors)}")
-
-            # 去除已经下载过的种子
-            local_cnt = 0
-            not_local_tors = []
-            for tor_info in remote_tors:
-                if (
-                        tor_info
-                        and tor_info.site_name
-                        and tor_info.pieces_hash
-                        and tor_info.get_name_pieces_tag() in site_pieces_hash_set
-                ):
-                    local_cnt = local_cnt + 1
-                else:
-                    not_local_tors.append(tor_info)
-            logger.info(f"站点{site_config.name}正在做种或已经辅种过的种子数为{local_cnt}")
-
-            for tor_info in not_local_tors:
-                if self._event.is_set():
-                    logger.info("辅种服务停止")
-                    return
-                if not tor_info:
-                    continue
-                if not tor_info.torrent_id or not tor_info.pieces_hash:
-                    continue
-                if tor_info.get_name_id_tag() in self._success_caches:
-                    logger.info(f"{tor_info.get_name_id_tag()} 已处理过辅种，跳过 ...")
-                    continue
-                if tor_info.get_name_id_tag() in self._error_caches or tor_info.get_name_id_tag() in self._permanent_error_caches:
-                    logger.info(f"种子 {tor_info.get_name_id_tag()} 辅种失败且已缓存，跳过 ...")
-                    continue
-                # 添加任务
-                self.__download_torrent(tor=tor_info, site_config=site_config,
-                                        service=service,
-                                        save_path=save_paths.get(tor_info.pieces_hash))
+                    if chunk_tors:
+                        result_queue.put((site_config, chunk_tors))
+        except Exception as e:
+            logger.error(f"查询站点{site_config.name}可辅种的信息出错 {str(e)}")
+        finally:
+            session.close()
+            result_queue.put((site_config, None))
+
+    def __seed_remote_torrents(self, remote_tors: List[TorInfo], site_config: CSSiteConfig,
+                               service: ServiceInfo, save_paths: Dict[str, str],
+                               site_pieces_hash_set: set) -> bool:
+        """
+        对站点返回的可辅种种子执行辅种，收到退出事件时返回False
+        """
+        # 去除已经下载过的种子
+        local_cnt = 0
+        not_local_tors = []
+        for tor_info in remote_tors:
+            if (
+                    tor_info
+                    and tor_info.site_name
+                    and tor_info.pieces_hash
+                    and tor_info.get_name_pieces_tag() in site_pieces_hash_set
+            ):
+                local_cnt = local_cnt + 1
+            else:
+                not_local_tors.append(tor_info)
+        logger.info(f"站点{site_config.name}正在做种或已经辅种过的种子数为{local_cnt}")
 
-        logger.info(f"下载器 {service.name} 辅种完成")
+        for tor_info in not_local_tors:
+            if self._event.is_set():
+                return False
+            if not tor_info:
+                continue
+            if not tor_info.torrent_id or not tor_info.pieces_hash:
+                continue
+            if tor_info.get_name_id_tag() in self._success_caches:
+                logger.info(f"{tor_info.get_name_id_tag()} 已处理过辅种，跳过 ...")
+                continue
+            if tor_info.get_name_id_tag() in self._error_caches or tor_info.get_name_id_tag() in self._permanent_error_caches:
+                logger.info(f"种子 {tor_info.get_name_id_tag()} 辅种失败且已缓存，跳过 ...")
+                continue
+            # 添加任务
+            self.__download_torrent(tor=tor_info, site_config=site_config,
+                                    service=service,
+                                    save_path=save_paths.get(tor_info.pieces_hash))
+        return True
 
     @staticmethod
     def __download(service: ServiceInfo, content: Union[bytes, str],
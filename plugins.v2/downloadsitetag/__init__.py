@@ -6,11 +6,12 @@ import pytz
 from app.helper.sites import SitesHelper
 from apscheduler.schedulers.background import BackgroundScheduler
 from apscheduler.triggers.cron import CronTrigger
+from sqlalchemy.orm import Session
 
 from app.core.config import settings
 from app.core.context import Context
 from app.core.event import eventmanager, Event
-from app.db.downloadhistory_oper import DownloadHistoryOper
+from app.db import db_query
 from app.db.models.downloadhistory import DownloadHistory
 from app.helper.downloader import DownloaderHelper
 from app.log import logger
@@ -208,6 +209,11 @@ class DownloadSiteTag(_PluginBase):
             "agsvpt.trackers.work": "agsvpt.com",
             "tracker.cinefiles.info": "audiences.me",
         }
+        siteshelper = SitesHelper()
+        # tracker域名 -> 站点名称
+        site_cache: Dict[str, Optional[str]] = {}
+        # tmdbid -> genre_ids
+        genre_cache: Dict[Any, Optional[list]] = {}
         for service in self.service_infos.values():
             downloader = service.name
             downloader_obj = service.instance
@@ -224,8 +230,13 @@ class DownloadSiteTag(_PluginBase):
             # 按添加时间进行排序, 时间靠前的按大小和名称加入处理历史, 判定为原始种子, 其他为辅种
             torrents = self._torrents_sort(torrents=torrents, dl_type=service.type)
             logger.info(f"{self.LOG_TAG}下载器 {downloader} 分析种子信息中 ...")
-            downloadhis = DownloadHistoryOper()
-            siteshelper = SitesHelper()
+            # 一次性查询所有种子的下载历史
+            histories = self._get_histories_by_hashes(
+                [_hash for _hash in (self._get_hash(torrent=torrent, dl_type=service.type) for torrent in torrents)
+                 if _hash])
+            # 待批量设置的标签与分类: 标签组合 -> hash列表, 分类 -> hash列表
+            tag_groups: Dict[Tuple[str, ...], List[str]] = {}
+            cat_groups: Dict[str, List[str]] = {}
             for torrent in torrents:
                 try:
                     if self._event.is_set():
@@ -242,7 +253,7 @@ class DownloadSiteTag(_PluginBase):
                     torrent_tags = self._get_label(torrent=torrent, dl_type=service.type)
                     torrent_cat = self._get_category(torrent=torrent, dl_type=service.type)
                     # 提取种子hash对应的下载历史
-                    history: DownloadHistory = downloadhis.get_by_hash(_hash)
+                    history: DownloadHistory = histories.get(_hash)
                     if not history:
                         # 如果找到已处理种子的历史, 表明当前种子是辅种, 否则创建一个空DownloadHistory
                         if _key and _key in dispose_history:
@@ -269,9 +280,9 @@ class DownloadSiteTag(_PluginBase):
                                     break
                             else:
                                 domain = StringUtils.get_url_domain(tracker)
-                            site_info = siteshelper.get_indexer(domain)
-                            if site_info:
-                                history.torrent_site = site_info.get("name")
+                            site_name = self._get_site_name(siteshelper, domain, site_cache)
+                            if site_name:
+                                history.torrent_site = site_name
                                 break
                         # 如果通过tracker还是无法获取站点名称, 且tmdbid, type, title都是空的, 那么跳过当前种子
                         if not history.torrent_site and not history.tmdbid and not history.type and not history.title:
@@ -292,10 +303,11 @@ class DownloadSiteTag(_PluginBase):
                         # 因允许tmdbid为空时运行到此, 因此需要判断tmdbid不为空
                         history_type = MediaType(history.type) if history.type else None
                         if history.tmdbid and history_type == MediaType.TV:
-                            # tmdb_id获取tmdb信息
-                            tmdb_info = self.chain.tmdb_info(mtype=history_type, tmdbid=history.tmdbid)
-                            if tmdb_info:
-                                genre_ids = tmdb_info.get("genre_ids")
+                            # tmdb_id获取tmdb信息, 同一tmdbid只查询一次
+                            if history.tmdbid not in genre_cache:
+                                tmdb_info = self.chain.tmdb_info(mtype=history_type, tmdbid=history.tmdbid)
+                                genre_cache[history.tmdbid] = tmdb_info.get("genre_ids") if tmdb_info else None
+                            genre_ids = genre_cache[history.tmdbid]
                         _cat = self._genre_ids_get_cat(history.type, genre_ids)
 
                     # 去除种子已经存在的标签
@@ -307,15 +319,77 @@ class DownloadSiteTag(_PluginBase):
                     # 判断当前种子是否不需要修改
                     if not _cat and not _tags:
                         continue
+                    if service.type == "qbittorrent":
+                        # qBittorrent 按标签组合与分类分组后批量设置
+                        if _tags:
+                            tag_groups.setdefault(tuple(sorted(_tags)), []).append(_hash)
+                        if _cat:
+                            cat_groups.setdefault(_cat, []).append(_hash)
+                        continue
                     # 执行通用方法, 设置种子标签与分类
                     self._set_torrent_info(service=service, _hash=_hash, _torrent=torrent, _tags=_tags, _cat=_cat,
                                            _original_tags=torrent_tags)
                 except Exception as e:
                     logger.error(
                         f"{self.LOG_TAG}分析种子信息时发生了错误: {str(e)}")
+            if tag_groups or cat_groups:
+                self._set_torrents_info_batch(service=service, tag_groups=tag_groups, cat_groups=cat_groups)
 
         logger.info(f"{self.LOG_TAG}执行完成")
 
+    @staticmethod
+    @db_query
+    def _get_histories_by_hashes(hashes: List[str], db: Session = None) -> Dict[str, DownloadHistory]:
+        """
+        批量查询下载历史, 同一hash存在多条记录时取最新的一条
+        """
+        histories = {}
+        for i in range(0, len(hashes), 500):
+            chunk = hashes[i:i + 500]
+            for history in db.query(DownloadHistory) \
+                    .filter(DownloadHistory.download_hash.in_(chunk)) \
+                    .order_by(DownloadHistory.date) \
+                    .all():
+                histories[history.download_hash] = history
+        return histories
+
+    @staticmethod
+    def _get_site_name(siteshelper: SitesHelper, domain: str, site_cache: Dict[str, Optional[str]]) -> Optional[str]:
+        """
+        通过tracker域名获取站点名称
+        """
+        if domain not in site_cache:
+            site_info = siteshelper.get_indexer(domain)
+            site_cache[domain] = site_info.get("name") if site_info else None
+        return site_cache[domain]
+
+    def _set_torrents_info_batch(self, service: ServiceInfo, tag_groups: Dict[Tuple[str, ...], List[str]],
+                                 cat_groups: Dict[str, List[str]]):
+        """
+        批量设置qBittorrent种子标签与分类, 每个标签组合或分类只调用一次下载器接口
+        """
+        downloader_obj = service.instance
+        if not downloader_obj:
+            return
+        for _tags, hashes in tag_groups.items():
+            try:
+                downloader_obj.set_torrents_tag(ids=hashes, tags=list(_tags))
+                logger.warn(f"{self.LOG_TAG}下载器: {service.name} {len(hashes)} 个种子  标签: {','.join(_tags)}")
+            except Exception as e:
+                logger.error(f"{self.LOG_TAG}下载器: {service.name} 批量设置标签 {','.join(_tags)} 失败: {str(e)}")
+        for _cat, hashes in cat_groups.items():
+            try:
+                # 尝试设置种子分类, 如果失败, 则创建再设置一遍
+                try:
+                    downloader_obj.qbc.torrents_set_category(category=_cat, torrent_hashes=hashes)
+                except Exception as e:
+                    logger.warn(f"下载器 {service.name} 设置分类 {_cat} 失败：{str(e)}, 尝试创建分类再设置 ...")
+                    downloader_obj.qbc.torrents_createCategory(name=_cat)
+                    downloader_obj.qbc.torrents_set_category(category=_cat, torrent_hashes=hashes)
+                logger.warn(f"{self.LOG_TAG}下载器: {service.name} {len(hashes)} 个种子  分类: {_cat}")
+            except Exception as e:
+                logger.error(f"{self.LOG_TAG}下载器: {service.name} 批量设置分类 {_cat} 失败: {str(e)}")
+
     def _genre_ids_get_cat(self, mtype, genre_ids=None):
         """
         根据genre_ids判断是否<动漫>分类
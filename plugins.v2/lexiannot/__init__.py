@@ -7,10 +7,14 @@ import time
 import threading
 import queue
 import shutil
-from typing import Any, List, Dict, Tuple, Optional, Union,  Type, TypeVar
+import sqlite3
+import hashlib
+from typing import Any, List, Dict, Tuple, Optional, Type, TypeVar, Callable, Collection
 import venv
 from pathlib import Path
 from collections import Counter
+from functools import lru_cache
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 from apscheduler.schedulers.background import BackgroundScheduler
 import pysubs2
@@ -36,6 +40,127 @@ from app.plugins.lexiannot.query_gemini import DialogueTranslationTask, Vocabula
 
 T = TypeVar('T', VocabularyTranslationTask, DialogueTranslationTask)
 
+
+class TokenBucket:
+    """
+    令牌桶限速，按固定速率发放请求令牌，允许不超过桶容量的突发请求
+    """
+
+    def __init__(self, rate: float, capacity: int):
+        self.__rate = rate
+        self.__capacity = max(capacity, 1)
+        self.__tokens = float(self.__capacity)
+        self.__last = time.monotonic()
+        self.__lock = threading.Lock()
+
+    def acquire(self, stop_event: threading.Event) -> bool:
+        """
+        获取一个令牌，令牌不足时等待；stop_event 被设置时返回 False
+        """
+        if self.__rate <= 0:
+            return not stop_event.is_set()
+        while True:
+            with self.__lock:
+                now = time.monotonic()
+                self.__tokens = min(self.__capacity, self.__tokens + (now - self.__last) * self.__rate)
+                self.__last = now
+                if self.__tokens >= 1:
+                    self.__tokens -= 1
+                    return True
+                delay = (1 - self.__tokens) / self.__rate
+            if stop_event.wait(delay):
+                return False
+
+
+class TranslationCache:
+    """
+    翻译结果缓存，以 (模型, 单词, 上下文哈希) 为键，整句翻译的单词为空字符串
+    """
+
+    def __init__(self, db_path: str):
+        self._db_path = db_path
+        with self.__connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS translation ("
+                "model TEXT, lemma TEXT, context_hash TEXT, chinese TEXT, "
+                "PRIMARY KEY (model, lemma, context_hash))"
+            )
+
+    def __connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self._db_path)
+
+    @staticmethod
+    def hash_context(text: str) -> str:
+        return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+    def get_many(self, keys: Collection[Tuple[str, str, str]]) -> Dict[Tuple[str, str, str], str]:
+        """
+        批量查询翻译结果
+        """
+        result = {}
+        if not keys:
+            return result
+        models = {key[0] for key in keys}
+        hashes = list({key[2] for key in keys})
+        with self.__connect() as conn:
+            for model in models:
+                for i in range(0, len(hashes), 500):
+                    chunk = hashes[i:i + 500]
+                    rows = conn.execute(
+                        f"SELECT lemma, context_hash, chinese FROM translation "
+                        f"WHERE model = ? AND context_hash IN ({','.join('?' * len(chunk))})",
+                        [model, *chunk]
+                    ).fetchall()
+                    for lemma, context_hash, chinese in rows:
+                        key = (model, lemma, context_hash)
+                        if key in keys:
+                            result[key] = chinese
+        return result
+
+    def put_many(self, rows: List[Tuple[str, str, str, str]]):
+        """
+        批量写入翻译结果
+        """
+        if not rows:
+            return
+        with self.__connect() as conn:
+            conn.executemany("INSERT OR REPLACE INTO translation VALUES (?, ?, ?, ?)", rows)
+
+
+class LexiconIndex:
+    """
+    词库索引，按词库版本预先整理 (lemma, spaCy词性) -> CEFR 等级，并缓存单词查询结果
+    """
+
+    def __init__(self, cefr_lexicon: Dict[str, Any], coca20k_lexicon: Dict[str, Any], version: Optional[str],
+                 cache_size: int = 65536):
+        self.version = version
+        self.__cefr_by_pos: Dict[str, Dict[str, str]] = {}
+        self.__min_cefr: Dict[str, str] = {}
+        for word, entries in (cefr_lexicon or {}).items():
+            if not entries:
+                continue
+            pos_map: Dict[str, str] = {}
+            for entry in entries:
+                spacy_pos = LexiAnnot.convert_pos_to_spacy(entry['pos'])
+                if spacy_pos and spacy_pos not in pos_map:
+                    pos_map[spacy_pos] = entry['cefr']
+            self.__cefr_by_pos[word] = pos_map
+            self.__min_cefr[word] = min(entry['cefr'] for entry in entries)
+        self.__coca20k = coca20k_lexicon or {}
+        self.query = lru_cache(maxsize=cache_size)(self.__query)
+
+    def __query(self, lemma: str, pos: str) -> Tuple[Optional[str], Optional[Dict[str, Any]]]:
+        """
+        查询单词的CEFR等级及COCA20K词条
+        """
+        word = lemma.lower().strip("-*'")
+        cefr = None
+        if word in self.__min_cefr:
+            cefr = self.__cefr_by_pos[word].get(pos) or self.__min_cefr[word]
+        return cefr, self.__coca20k.get(word)
+
+
 class LexiAnnot(_PluginBase):
     # 插件名称
     plugin_name = "美剧生词标注"
@@ -70,6 +195,8 @@ class LexiAnnot(_PluginBase):
     _context_window = 0
     _max_retries = 0
     _request_interval = 0
+    _spacy_batch_size = 64
+    _spacy_n_process = 1
     _ffmpeg_path = ''
     _english_only = False
     _when_file_trans = False
@@ -90,6 +217,10 @@ class LexiAnnot(_PluginBase):
     _spacy_model_name = "en_core_web_sm"
     _scheduler: Optional[BackgroundScheduler] = None
     _nlp = None
+    _lexicon_index: Optional[LexiconIndex] = None
+    _translation_cache: Optional[TranslationCache] = None
+    # Gemini 并发请求数
+    _query_workers = 3
     _worker_thread = None
     _task_queue = None
     _shutdown_event = None
@@ -118,6 +249,16 @@ class LexiAnnot(_PluginBase):
             self._context_window = config.get("context_window")
             self._max_retries = config.get("max_retries")
             self._request_interval = config.get("request_interval")
+            try:
+                self._spacy_batch_size = int(config.get("spacy_batch_size") or 64)
+            except ValueError:
+                logger.warn(f"spaCy批处理大小配置错误：{config.get('spacy_batch_size')}，使用默认值 64")
+                self._spacy_batch_size = 64
+            try:
+                self._spacy_n_process = int(config.get("spacy_n_process") or 1)
+            except ValueError:
+                logger.warn(f"spaCy进程数配置错误：{config.get('spacy_n_process')}，使用默认值 1")
+                self._spacy_n_process = 1
             self._ffmpeg_path = config.get("ffmpeg_path")
             self._english_only = config.get("english_only")
             self._when_file_trans = config.get("when_file_trans")
@@ -153,6 +294,8 @@ class LexiAnnot(_PluginBase):
                 self._enabled = False
                 self.__update_config()
                 return
+            if self._lexicon_index is None or self._lexicon_index.version != self._lexicon_version:
+                self._lexicon_index = LexiconIndex(self._cefr_lexicon, self._coca2k_lexicon, self._lexicon_version)
             if self._enable_gemini:
                 self._gemini_available = True
                 res = self.init_venv()
@@ -161,6 +304,12 @@ class LexiAnnot(_PluginBase):
                 if not self._gemini_apikey:
                     logger.warn(f"未提供GEMINI APIKEY")
                     self._gemini_available = False
+                try:
+                    self._translation_cache = TranslationCache(
+                        os.path.join(self.get_data_path(), "translation_cache.db"))
+                except Exception as e:
+                    logger.warn(f"翻译缓存初始化失败: {e}")
+                    self._translation_cache = None
             self._shutdown_event = threading.Event()
             self._worker_thread = threading.Thread(target=self.__process_tasks, daemon=True)
             self._worker_thread.start()
@@ -586,6 +735,51 @@ class LexiAnnot(_PluginBase):
                             },
                         ]
                     },
+                    {
+                        'component': 'VRow',
+                        'content': [
+                            {
+                                'component': 'VCol',
+                                'props': {
+                                    'cols': 12,
+                                    'md': 6,
+                                },
+                                'content': [
+                                    {
+                                        'component': 'VTextField',
+                                        'props': {
+                                            'model': 'spacy_batch_size',
+                                            'label': '分词批大小',
+                                            'placeholder': '64',
+                                            'type': 'number',
+                                            'min': 1,
+                                            'hint': 'spaCy每批处理的字幕行数'
+                                        }
+                                    }
+                                ]
+                            },
+                            {
+                                'component': 'VCol',
+                                'props': {
+                                    'cols': 12,
+                                    'md': 6,
+                                },
+                                'content': [
+                                    {
+                                        'component': 'VTextField',
+                                        'props': {
+                                            'model': 'spacy_n_process',
+                                            'label': '分词进程数',
+                                            'placeholder': '1',
+                                            'type': 'number',
+                                            'min': 1,
+                                            'hint': 'spaCy并行分词的进程数'
+                                        }
+                                    }
+                                ]
+                            },
+                        ]
+                    },
                     {
                         'component': 'VRow',
                         'content': [
@@ -685,6 +879,8 @@ class LexiAnnot(_PluginBase):
             "context_window": 10,
             "max_retries": 3,
             'request_interval': 3,
+            "spacy_batch_size": 64,
+            "spacy_n_process": 1,
             "ffmpeg_path": "",
             "english_only": True,
             "when_file_trans": True,
@@ -752,6 +948,8 @@ class LexiAnnot(_PluginBase):
                             'context_window': self._context_window,
                             'max_retries': self._max_retries,
                             'request_interval': self._request_interval,
+                            'spacy_batch_size': self._spacy_batch_size,
+                            'spacy_n_process': self._spacy_n_process,
                             'ffmpeg_path': self._ffmpeg_path,
                             'english_only': self._english_only,
                             'when_file_trans': self._when_file_trans,
@@ -1327,7 +1525,7 @@ class LexiAnnot(_PluginBase):
             logger.warning(f"Failed to reconstruct tasks: {str(e)}")
             return tasks
 
-    def __process_by_ai(self, lines_to_process: List[Dict[str, Any]], cefr_lexicon, swear_words, coca20k_lexicon):
+    def __process_by_ai(self, lines_to_process: List[Dict[str, Any]], lexicon_index: LexiconIndex, swear_words):
         simple_vocabulary = list(filter(lambda x:x<self._annot_level, ['A1', 'A2', 'B1', 'B2', 'C1', 'C2']))
         patterns = [r'\d+th|\d?1st|\d?2nd']
         compiled_patterns = [re.compile(p) for p in patterns]
@@ -1335,16 +1533,16 @@ class LexiAnnot(_PluginBase):
         logger.info(f"通过spaCy分词...")
         vocabulary_trans_instruction = '''You are an expert translator. You will be given a list of English words along with their context, formatted as JSON. For each entry, provide the most appropriate translation in Simplified Chinese based on the context.
     Only complete the `Chinese` field. Do not include pinyin, explanations, or any additional information.'''
+        swear_words = set(swear_words)
+        texts = [line_data.get('raw_subtitle').replace('\n', ' ') for line_data in lines_to_process]
+        docs = self._nlp.pipe(texts, batch_size=self._spacy_batch_size, n_process=self._spacy_n_process)
         # 使用nlp分词
-        for line_data in lines_to_process:
+        for line_data, text, doc in zip(lines_to_process, texts, docs):
             if self._shutdown_event.is_set():
                 return lines_to_process
-            text_raw = line_data.get('raw_subtitle')
-            text = text_raw.replace('\n', ' ')
             new_vocab = []
-            doc = self._nlp(text)
             last_end_pos = 0
-            lemma_to_query = []
+            lemma_to_query = set()
             for token in doc:
                 if len(token.text) == 1:
                     continue
@@ -1354,16 +1552,15 @@ class LexiAnnot(_PluginBase):
                     continue
                 if any(p.match(token.lemma_) for p in compiled_patterns):
                     continue
-                cefr = LexiAnnot.get_cefr_by_spacy(token, cefr_lexicon)
+                cefr, res_of_coco = lexicon_index.query(token.lemma_, token.pos_)
                 if cefr and cefr in simple_vocabulary:
                     continue
-                res_of_coco = LexiAnnot.query_coca20k(token.lemma_, coca20k_lexicon)
                 if res_of_coco and not cefr:
                     cefr = 'COCA20K'
                 if token.lemma_ in lemma_to_query:
                     continue
                 else:
-                    lemma_to_query.append(token.lemma_)
+                    lemma_to_query.add(token.lemma_)
                 start_pos = text.find(token.text, last_end_pos)
                 end_pos = start_pos + len(token.text)
                 phonetics = ''
@@ -1376,110 +1573,167 @@ class LexiAnnot(_PluginBase):
                                   'pos': token.pos_, 'cefr': cefr, 'Chinese': '', 'phonetics': phonetics,
                                   'pos_defs': pos_defs})
             line_data['new_vocab'] = new_vocab
+        if not self._gemini_available:
+            return lines_to_process
+        window_size = max(int(self._context_window or 10), 1)
+        lines_by_index = {line_data['index']: line_data for line_data in lines_to_process}
+        model = self._gemini_model
         # 查询词汇翻译
-        task_bulk: List[Union[VocabularyTranslationTask|DialogueTranslationTask]] = []
-        i = 0
-        if self._gemini_available:
-            logger.info(f"查询词汇翻译...")
+        logger.info(f"查询词汇翻译...")
+        context_hashes: Dict[int, str] = {}
         for line_data in lines_to_process:
-            if self._shutdown_event.is_set():
-                return lines_to_process
-            if not self._gemini_available:
-                break
-            i += 1
-            if not (len(line_data["new_vocab"]) or (i == len(lines_to_process) and len(task_bulk))):
+            if line_data['new_vocab']:
+                context_hashes[line_data['index']] = TranslationCache.hash_context(
+                    line_data['raw_subtitle'].replace('\n', ' '))
+        cached = self.__load_translations({(model, v['lemma'], context_hashes[index])
+                                           for index in context_hashes
+                                           for v in lines_by_index[index]['new_vocab']})
+        pending_vocab: Dict[int, List[Dict[str, Any]]] = {}
+        vocab_tasks: List[VocabularyTranslationTask] = []
+        for index, context_hash in context_hashes.items():
+            line_data = lines_by_index[index]
+            missing = []
+            for v in line_data['new_vocab']:
+                chinese = cached.get((model, v['lemma'], context_hash))
+                if chinese:
+                    v['Chinese'] = chinese
+                else:
+                    missing.append(v)
+            if not missing:
                 continue
-            new_vocab = [Vocabulary(lemma=new_vocab['lemma'], Chinese='') for new_vocab in line_data['new_vocab']]
-            task_bulk.append(VocabularyTranslationTask(index=line_data['index'],
-                                                   vocabulary=new_vocab,
-                                                   context=Context(
-                                                       original_text=line_data['raw_subtitle'].replace('\n', ' ')
-                                                   )))
-            if len(task_bulk) >= self._context_window or (len(task_bulk) and i == len(lines_to_process)):
-                logger.info(f"processing dialogues: "
-                      f"{LexiAnnot.format_duration(lines_to_process[task_bulk[0].index]['time_code'][0])} -> "
-                      f"{LexiAnnot.format_duration(lines_to_process[i - 1]['time_code'][1])}")
-                answer: Optional[List[VocabularyTranslationTask]] = self.__query_gemini(task_bulk,
-                                                                                        VocabularyTranslationTask,
-                                                                                        self._gemini_apikey,
-                                                                                        vocabulary_trans_instruction,
-                                                                                        self._gemini_model,
-                                                                                        model_temperature)
-                if not answer:
+            pending_vocab[index] = missing
+            vocab_tasks.append(VocabularyTranslationTask(index=index,
+                                                         vocabulary=[Vocabulary(lemma=v['lemma'], Chinese='')
+                                                                     for v in missing],
+                                                         context=Context(
+                                                             original_text=line_data['raw_subtitle'].replace('\n', ' ')
+                                                         )))
+
+        def merge_vocabulary(_: Collection[int], answer: List[VocabularyTranslationTask]):
+            rows = []
+            for answer_line in answer:
+                missing_vocab = pending_vocab.get(answer_line.index)
+                answer_lemma = tuple(v.lemma for v in answer_line.vocabulary)
+                if not missing_vocab or tuple(v['lemma'] for v in missing_vocab) != answer_lemma:
+                    logger.warn(f'Unknown answer: {answer_line.index}: {answer_line.context.original_text}')
                     continue
-                time.sleep(self._request_interval)
-                for answer_line in answer:
-                    answer_lemma = tuple(v.lemma for v in answer_line.vocabulary)
-                    filtered_raw = [x for x in lines_to_process if x.get('index') == answer_line.index]
-                    if not len(filtered_raw):
-                        logger.warn(f'Unknown answer: {answer_line.index}: {answer_line.context.original_text}')
-                    available_answer = False
-                    for item in filtered_raw:
-                        lemma = tuple(v['lemma'] for v in item['new_vocab'])
-                        if lemma == answer_lemma:
-                            available_answer = True
-                            for i_, v in enumerate(item['new_vocab']):
-                                v['Chinese'] = answer_line.vocabulary[i_].Chinese
-                            break
-                    if not available_answer:
-                        logger.warn(f'Unknown answer: {answer_line.index}: {answer_line.context.original_text}')
-                task_bulk = []
-        if not self._sentence_translation:
+                for v, answer_vocab in zip(missing_vocab, answer_line.vocabulary):
+                    v['Chinese'] = answer_vocab.Chinese
+                    if answer_vocab.Chinese:
+                        rows.append((model, v['lemma'], context_hashes[answer_line.index], answer_vocab.Chinese))
+            self.__save_translations(rows)
+
+        vocab_windows = [({task.index for task in vocab_tasks[i:i + window_size]}, vocab_tasks[i:i + window_size])
+                         for i in range(0, len(vocab_tasks), window_size)]
+        self.__run_gemini_windows(vocab_windows, VocabularyTranslationTask, vocabulary_trans_instruction,
+                                  model_temperature, lines_by_index, merge_vocabulary)
+        if not self._sentence_translation or self._shutdown_event.is_set():
             return lines_to_process
-        if self._gemini_available:
-            logger.info(f"查询整句翻译...")
         # 查询整句翻译
+        logger.info(f"查询整句翻译...")
+        dialogue_hashes: Dict[int, str] = {}
         translation_tasks: List[DialogueTranslationTask] = []
         for line_data in lines_to_process:
+            original_text = line_data['raw_subtitle'].replace('\n', ' ')
+            dialogue_hashes[line_data['index']] = TranslationCache.hash_context(original_text)
             translation_tasks.append(DialogueTranslationTask(index=line_data['index'],
-                                                             original_text=line_data['raw_subtitle'].replace('\n', ' '),
+                                                             original_text=original_text,
                                                              Chinese=''))
-        i = 0
+        cached = self.__load_translations({(model, '', context_hash) for context_hash in dialogue_hashes.values()})
+        for index, context_hash in dialogue_hashes.items():
+            chinese = cached.get((model, '', context_hash))
+            if chinese:
+                lines_by_index[index]['Chinese'] = chinese
         dialog_trans_instruction = '''You are an expert translator. You will be given a list of dialogue translation tasks in JSON format. For each entry, provide the most appropriate translation in Simplified Chinese based on the context. 
     Only complete the `Chinese` field. Do not include pinyin, explanations, or any additional information.'''
-        while i < len(translation_tasks):
-            if self._shutdown_event.is_set():
-                return lines_to_process
-            if not self._gemini_available:
-                break
-            start_index = max(0, i - 1)
-            end_index = min(len(translation_tasks), i + self._context_window + 1)
-            task_bulk: List[DialogueTranslationTask] = translation_tasks[start_index:end_index]
-            logger.info(f"processing dialogues: "
-            f"{LexiAnnot.format_duration(lines_to_process[i]['time_code'][0])} -> "
-            f"{LexiAnnot.format_duration(lines_to_process[min(len(translation_tasks), i + self._context_window)-1]['time_code'][1])}")
-            answer: List[DialogueTranslationTask] = self.__query_gemini(task_bulk,
-                                                                        DialogueTranslationTask,
-                                                                        self._gemini_apikey,
-                                                                        dialog_trans_instruction,
-                                                                        self._gemini_model,
-                                                                        model_temperature)
-            time.sleep(self._request_interval)
+
+        def merge_dialogue(accepted: Collection[int], answer: List[DialogueTranslationTask]):
+            rows = []
             for answer_line in answer:
-                if  answer_line.index not in range(i, i+self._context_window):
+                if answer_line.index not in accepted:
                     continue
-                filtered_raw = [x for x in lines_to_process if x.get('index') == answer_line.index]
-                if not len(filtered_raw):
-                    logger.warn(f'Unknown answer: {answer_line.index}: {answer_line.original_text}')
-                available_answer = False
-                for item in filtered_raw:
-                    if item['raw_subtitle'].replace('\n', ' ') == answer_line.original_text:
-                        available_answer = True
-                        item['Chinese'] = answer_line.Chinese
-                        break
-                if not available_answer:
+                item = lines_by_index.get(answer_line.index)
+                if not item or item['raw_subtitle'].replace('\n', ' ') != answer_line.original_text:
                     logger.warn(f'Unknown answer: {answer_line.index}: {answer_line.original_text}')
-            i += self._context_window
+                    continue
+                item['Chinese'] = answer_line.Chinese
+                if answer_line.Chinese:
+                    rows.append((model, '', dialogue_hashes[answer_line.index], answer_line.Chinese))
+            self.__save_translations(rows)
+
+        dialogue_windows = []
+        for i in range(0, len(translation_tasks), window_size):
+            accepted = range(i, min(len(translation_tasks), i + window_size))
+            if all(lines_to_process[j]['Chinese'] for j in accepted):
+                continue
+            # 前后各多带一句作为上下文
+            dialogue_windows.append((accepted, translation_tasks[max(0, i - 1):accepted.stop + 1]))
+        self.__run_gemini_windows(dialogue_windows, DialogueTranslationTask, dialog_trans_instruction,
+                                  model_temperature, lines_by_index, merge_dialogue)
         return lines_to_process
 
+    def __run_gemini_windows(self,
+                             windows: List[Tuple[Collection[int], List[T]]],
+                             task_type: Type[T],
+                             system_instruction: str,
+                             temperature: float,
+                             lines_by_index: Dict[int, Dict[str, Any]],
+                             merge: Callable[[Collection[int], List[T]], None]):
+        """
+        并发发送翻译请求，以令牌桶控制请求速率，结果在当前线程中合并
+        """
+        if not windows:
+            return
+        interval = float(self._request_interval or 0)
+        bucket = TokenBucket(1 / interval if interval > 0 else 0, self._query_workers)
+
+        def query(accepted: Collection[int], tasks: List[T]) -> Optional[List[T]]:
+            if not bucket.acquire(self._shutdown_event):
+                return None
+            logger.info(f"processing dialogues: "
+                        f"{LexiAnnot.format_duration(lines_by_index[min(accepted)]['time_code'][0])} -> "
+                        f"{LexiAnnot.format_duration(lines_by_index[max(accepted)]['time_code'][1])}")
+            return self.__query_gemini(tasks, task_type, self._gemini_apikey, system_instruction,
+                                       self._gemini_model, temperature)
+
+        with ThreadPoolExecutor(max_workers=self._query_workers) as executor:
+            futures = {executor.submit(query, accepted, tasks): accepted for accepted, tasks in windows}
+            for future in as_completed(futures):
+                if self._shutdown_event.is_set():
+                    for f in futures:
+                        f.cancel()
+                    return
+                try:
+                    answer = future.result()
+                except Exception as e:
+                    logger.warn(f"翻译请求失败: {e}")
+                    continue
+                if answer:
+                    merge(futures[future], answer)
+
+    def __load_translations(self, keys: Collection[Tuple[str, str, str]]) -> Dict[Tuple[str, str, str], str]:
+        if not self._translation_cache:
+            return {}
+        try:
+            return self._translation_cache.get_many(keys)
+        except Exception as e:
+            logger.warn(f"读取翻译缓存失败: {e}")
+            return {}
+
+    def __save_translations(self, rows: List[Tuple[str, str, str, str]]):
+        if not self._translation_cache:
+            return
+        try:
+            self._translation_cache.put_many(rows)
+        except Exception as e:
+            logger.warn(f"写入翻译缓存失败: {e}")
+
     def process_subtitles(self, ass_file: SSAFile) -> Optional[SSAFile]:
         """
         处理字幕内容，标记词汇并添加翻译。
         """
         lang = 'en'
-        cefr_lexicon = self._cefr_lexicon
         swear_words = self._swear_words
-        coca20k_lexicon = self._coca2k_lexicon
         abgr_str = (f'&H{self._color_alpha:02x}{self._accent_color_rgb[2]:02x}'
                                  f'{self._accent_color_rgb[1]:02x}{self._accent_color_rgb[0]:02x}&') #&H00FFFFFF&
         pos_map = {
@@ -1510,7 +1764,7 @@ class LexiAnnot(_PluginBase):
             lines_to_process.append(line_data)
             main_dialogue[index] = dialogue
             index += 1
-        lines_to_process = self.__process_by_ai(lines_to_process, cefr_lexicon, swear_words, coca20k_lexicon)
+        lines_to_process = self.__process_by_ai(lines_to_process, self._lexicon_index, swear_words)
 
         # 在原字幕添加标注
         main_style_fs = ass_file.styles[main_style].fontsize
@@ -1,6 +1,11 @@
+import heapq
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
 from typing import Any, List, Dict, Tuple, Optional
 
+from cacheout import LRUCache
+
 from app.core.event import eventmanager, Event
 from app.helper.mediaserver import MediaServerHelper
 from app.log import logger
@@ -10,6 +15,53 @@ from app.schemas.types import EventType, MediaType, MediaImageType, Notification
 from app.utils.web import WebUtils
 
 
+class ExpiringKeys:
+    """
+    带过期时间的键集合，字典保存最新过期时间，最小堆按过期时间惰性清理
+    """
+
+    def __init__(self):
+        self._expires: Dict[str, float] = {}
+        self._heap: List[Tuple[float, str]] = []
+        self._lock = threading.Lock()
+
+    def __purge(self, now: float):
+        while self._heap and self._heap[0][0] <= now:
+            expire, key = heapq.heappop(self._heap)
+            # 堆中可能是已刷新或删除的旧记录，只清理过期时间一致的键
+            if self._expires.get(key) == expire:
+                del self._expires[key]
+        # 旧记录过多时重建堆
+        if len(self._heap) > 2 * len(self._expires) + 64:
+            self._heap = [(expire, key) for key, expire in self._expires.items()]
+            heapq.heapify(self._heap)
+
+    def add(self, key: str, duration: int = 600):
+        """
+        添加键，已存在时刷新过期时间
+        """
+        with self._lock:
+            expire = time.time() + duration
+            self._expires[key] = expire
+            heapq.heappush(self._heap, (expire, key))
+
+    def remove(self, key: str):
+        with self._lock:
+            self._expires.pop(key, None)
+
+    def __contains__(self, key: str) -> bool:
+        with self._lock:
+            now = time.time()
+            self.__purge(now)
+            expire = self._expires.get(key)
+            return expire is not None and expire > now
+
+    def keys(self) -> List[str]:
+        with self._lock:
+            self.__purge(time.time())
+            return list(self._expires.keys())
+
+
 class MediaServerMsg(_PluginBase):
     # 插件名称
     plugin_name = "媒体库服务器通知"
@@ -35,7 +87,14 @@ class MediaServerMsg(_PluginBase):
     _add_play_link = False
     _mediaservers = None
     _types = []
-    _webhook_msg_keys = {}
+    _webhook_msg_keys: Optional[ExpiringKeys] = None
+    # 消息发送线程池
+    _executor: Optional[ThreadPoolExecutor] = None
+    _send_workers = 3
+    # IP归属地缓存
+    _location_cache = LRUCache(maxsize=1024, ttl=24 * 3600, timer=time.time)
+    # 剧集图片缓存，键为 (tmdb_id, season, episode)
+    _image_cache = LRUCache(maxsize=1024, ttl=6 * 3600, timer=time.time)
 
     # 拼装消息内容
     _webhook_actions = {
@@ -58,6 +117,8 @@ class MediaServerMsg(_PluginBase):
     }
 
     def init_plugin(self, config: dict = None):
+        # 停止现有任务
+        self.stop_service()
 
         if config:
             self._enabled = config.get("enabled")
@@ -65,6 +126,12 @@ class MediaServerMsg(_PluginBase):
             self._mediaservers = config.get("mediaservers") or []
             self._add_play_link = config.get("add_play_link", False)
 
+        if self._webhook_msg_keys is None:
+            self._webhook_msg_keys = ExpiringKeys()
+        if self._enabled:
+            self._executor = ThreadPoolExecutor(max_workers=self._send_workers,
+                                                thread_name_prefix="mediaservermsg")
+
     def service_infos(self, type_filter: Optional[str] = None) -> Optional[Dict[str, ServiceInfo]]:
         """
         服务信息
@@ -281,11 +348,39 @@ class MediaServerMsg(_PluginBase):
 
         expiring_key = f"{event_info.item_id}-{event_info.client}-{event_info.user_name}"
         # 过滤停止播放重复消息
-        if str(event_info.event) == "playback.stop" and expiring_key in self._webhook_msg_keys.keys():
+        if str(event_info.event) == "playback.stop" and expiring_key in self._webhook_msg_keys:
             # 刷新过期时间
             self.__add_element(expiring_key)
             return
 
+        if str(event_info.event) == "playback.stop":
+            # 停止播放消息，添加到过期字典
+            self.__add_element(expiring_key)
+        if str(event_info.event) == "playback.start":
+            # 开始播放消息，删除过期字典
+            self.__remove_element(expiring_key)
+
+        # 归属地、图片查询及发送放到线程池中，不阻塞Webhook处理
+        executor = self._executor
+        if executor:
+            try:
+                executor.submit(self.__send_message, event_info)
+                return
+            except RuntimeError:
+                # 插件正在重载，线程池已关闭
+                pass
+        self.__send_message(event_info)
+
+    def __send_message(self, event_info: WebhookEventInfo):
+        """
+        拼装并发送通知消息
+        """
+        try:
+            self.__do_send(event_info)
+        except Exception as e:
+            logger.error(f"发送媒体服务器通知失败：{str(e)}")
+
+    def __do_send(self, event_info: WebhookEventInfo):
         # 消息标题
         if event_info.item_type in ["TV", "SHOW"]:
             message_title = f"{self._webhook_actions.get(event_info.event)}剧集 {event_info.item_name}"
@@ -303,7 +398,7 @@ class MediaServerMsg(_PluginBase):
         if event_info.device_name:
             message_texts.append(f"设备：{event_info.client} {event_info.device_name}")
         if event_info.ip:
-            message_texts.append(f"IP地址：{event_info.ip} {WebUtils.get_location(event_info.ip)}")
+            message_texts.append(f"IP地址：{event_info.ip} {self.__get_location(event_info.ip)}")
         if event_info.percentage:
             percentage = round(float(event_info.percentage), 2)
             message_texts.append(f"进度：{percentage}%")
@@ -321,13 +416,7 @@ class MediaServerMsg(_PluginBase):
             season_id = event_info.season_id if event_info.season_id else None
             episode_id = event_info.episode_id if event_info.episode_id else None
 
-            specific_image = self.chain.obtain_specific_image(
-                mediaid=event_info.tmdb_id,
-                mtype=MediaType.TV,
-                image_type=MediaImageType.Backdrop,
-                season=season_id,
-                episode=episode_id
-            )
+            specific_image = self.__get_specific_image(event_info.tmdb_id, season_id, episode_id)
             if specific_image:
                 image_url = specific_image
         # 使用默认图片
@@ -347,33 +436,53 @@ class MediaServerMsg(_PluginBase):
                     if play_link:
                         break
 
-        if str(event_info.event) == "playback.stop":
-            # 停止播放消息，添加到过期字典
-            self.__add_element(expiring_key)
-        if str(event_info.event) == "playback.start":
-            # 开始播放消息，删除过期字典
-            self.__remove_element(expiring_key)
-
         # 发送消息
         self.post_message(mtype=NotificationType.MediaServer,
                           title=message_title, text=message_content, image=image_url, link=play_link)
 
+    def __get_location(self, ip: str) -> str:
+        """
+        查询IP归属地，结果缓存
+        """
+        location = self._location_cache.get(ip)
+        if location is None:
+            location = WebUtils.get_location(ip) or ""
+            self._location_cache.set(ip, location)
+        return location
+
+    def __get_specific_image(self, tmdb_id, season, episode) -> Optional[str]:
+        """
+        查询剧集背景图，未查询到图片时也缓存，避免重复请求
+        """
+        key = (tmdb_id, season, episode)
+        image = self._image_cache.get(key)
+        if image is None:
+            image = self.chain.obtain_specific_image(
+                mediaid=tmdb_id,
+                mtype=MediaType.TV,
+                image_type=MediaImageType.Backdrop,
+                season=season,
+                episode=episode
+            ) or ""
+            self._image_cache.set(key, image)
+        return image or None
+
     def __add_element(self, key, duration=600):
-        expiration_time = time.time() + duration
         # 如果元素已经存在，更新其过期时间
-        self._webhook_msg_keys[key] = expiration_time
+        self._webhook_msg_keys.add(key, duration)
 
     def __remove_element(self, key):
-        self._webhook_msg_keys = {k: v for k, v in self._webhook_msg_keys.items() if k != key}
+        self._webhook_msg_keys.remove(key)
 
     def __get_elements(self):
-        current_time = time.time()
         # 过滤掉过期的元素
-        self._webhook_msg_keys = {k: v for k, v in self._webhook_msg_keys.items() if v > current_time}
-        return list(self._webhook_msg_keys.keys())
+        return self._webhook_msg_keys.keys()
 
     def stop_service(self):
         """
         退出插件
         """
-        pass
+        if self._executor:
+            # 等待已提交的消息发送完成
+            self._executor.shutdown(wait=True)
+            self._executor = None
@@ -1,7 +1,10 @@
+import threading
 import time
 from pathlib import Path
 from typing import Any, List, Dict, Tuple, Optional
 
+from app import schemas
+from app.core.config import settings
 from app.core.context import MediaInfo
 from app.core.event import eventmanager, Event
 from app.helper.mediaserver import MediaServerHelper
@@ -35,6 +38,17 @@ class MediaServerRefresh(_PluginBase):
     _enabled = False
     _delay = 0
     _mediaservers = None
+    # 合并刷新的最短等待时间（秒）
+    _min_window = 3
+    # 自第一个待刷新项目起的最长等待时间（秒）
+    _max_wait = 300
+    _lock = threading.Lock()
+    _timer: Optional[threading.Timer] = None
+    # 待刷新项目，按目标目录去重
+    _pending: Dict[str, RefreshMediaItem] = {}
+    _pending_since: Optional[float] = None
+    # 刷新统计：收到的入库事件数、合并到已有刷新中的事件数、实际发起的刷新次数
+    _stats = {"received": 0, "coalesced": 0, "issued": 0}
 
     def init_plugin(self, config: dict = None):
 
@@ -78,7 +92,24 @@ class MediaServerRefresh(_PluginBase):
         pass
 
     def get_api(self) -> List[Dict[str, Any]]:
-        pass
+        return [
+            {
+                "path": "/stats",
+                "endpoint": self.get_stats,
+                "methods": ["GET"],
+                "summary": "获取媒体库刷新合并统计"
+            }
+        ]
+
+    def get_stats(self, apikey: str):
+        """
+        获取刷新合并统计
+        """
+        if apikey != settings.API_TOKEN:
+            return schemas.Response(success=False, message="API密钥错误")
+        with self._lock:
+            data = {**self._stats, "pending": len(self._pending)}
+        return schemas.Response(success=True, data=data)
 
     def get_form(self) -> Tuple[List[dict], Dict[str, Any]]:
         """
@@ -148,7 +179,8 @@ class MediaServerRefresh(_PluginBase):
                                         'props': {
                                             'model': 'delay',
                                             'label': '延迟时间（秒）',
-                                            'placeholder': '0'
+                                            'placeholder': '0',
+                                            'hint': '在此时间内连续入库的媒体合并为一次刷新'
                                         }
                                     }
                                 ]
@@ -177,41 +209,84 @@ class MediaServerRefresh(_PluginBase):
         if not event_info:
             return
 
-        # 刷新媒体库
-        if not self.service_infos:
-            return
-
-        if self._delay:
-            logger.info(f"延迟 {self._delay} 秒后刷新媒体库... ")
-            time.sleep(float(self._delay))
-
         # 入库数据
         transferinfo: TransferInfo = event_info.get("transferinfo")
         if not transferinfo or not transferinfo.target_diritem or not transferinfo.target_diritem.path:
             return
 
         mediainfo: MediaInfo = event_info.get("mediainfo")
-        items = [
-            RefreshMediaItem(
-                title=mediainfo.title,
-                year=mediainfo.year,
-                type=mediainfo.type,
-                category=mediainfo.category,
-                target_path=Path(transferinfo.target_diritem.path)
-            )
-        ]
+        item = RefreshMediaItem(
+            title=mediainfo.title,
+            year=mediainfo.year,
+            type=mediainfo.type,
+            category=mediainfo.category,
+            target_path=Path(transferinfo.target_diritem.path)
+        )
 
-        for name, service in self.service_infos.items():
-            if hasattr(service.instance, 'refresh_library_by_items'):
-                service.instance.refresh_library_by_items(items)
-            elif hasattr(service.instance, 'refresh_root_library'):
-                # FIXME Jellyfin未找到刷新单个项目的API
-                service.instance.refresh_root_library()
-            else:
-                logger.warning(f"{name} 不支持刷新")
+        # 加入待刷新队列，在等待时间内没有新的入库时统一刷新
+        window = max(float(self._delay or 0), self._min_window)
+        with self._lock:
+            self._stats["received"] += 1
+            if self._pending:
+                # 合并到尚未发出的刷新中
+                self._stats["coalesced"] += 1
+            self._pending[str(item.target_path)] = item
+            now = time.time()
+            if self._pending_since is None:
+                self._pending_since = now
+            elif now - self._pending_since >= self._max_wait:
+                # 超过最长等待时间，不再推迟已有的刷新
+                return
+            if self._timer:
+                self._timer.cancel()
+            self._timer = threading.Timer(min(window, self._pending_since + self._max_wait - now), self.__flush)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def __flush(self):
+        """
+        刷新队列中的所有项目，每个媒体服务器只调用一次
+        """
+        with self._lock:
+            items = list(self._pending.values())
+            self._pending = {}
+            self._pending_since = None
+            self._timer = None
+        if not items:
+            return
+
+        # 刷新媒体库
+        service_infos = self.service_infos
+        if not service_infos:
+            return
+
+        logger.info(f"刷新媒体库，共 {len(items)} 个目录 ...")
+        for name, service in service_infos.items():
+            try:
+                if hasattr(service.instance, 'refresh_library_by_items'):
+                    service.instance.refresh_library_by_items(items)
+                elif hasattr(service.instance, 'refresh_root_library'):
+                    # FIXME Jellyfin未找到刷新单个项目的API
+                    service.instance.refresh_root_library()
+                else:
+                    logger.warning(f"{name} 不支持刷新")
+                    continue
+            except Exception as e:
+                logger.error(f"{name} 刷新媒体库失败：{str(e)}")
+                continue
+            with self._lock:
+                self._stats["issued"] += 1
+        logger.info(f"媒体库刷新统计：入库 {self._stats['received']} 次，"
+                    f"合并 {self._stats['coalesced']} 次，刷新 {self._stats['issued']} 次")
 
     def stop_service(self):
         """
         退出插件
         """
-        pass
+        with self._lock:
+            if self._timer:
+                self._timer.cancel()
+                self._timer = None
+        # 退出前刷新已入队的项目
+        if self._pending:
+            self.__flush()
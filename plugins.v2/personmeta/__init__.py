@@ -1,10 +1,14 @@
 import base64
 import copy
 import datetime
+import hashlib
 import json
+import os
 import re
+import sqlite3
 import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from typing import Any, List, Dict, Tuple, Optional
 
@@ -12,6 +16,7 @@ import pytz
 import zhconv
 from apscheduler.schedulers.background import BackgroundScheduler
 from apscheduler.triggers.cron import CronTrigger
+from cacheout import LRUCache
 from requests import RequestException
 
 from app import schemas
@@ -30,6 +35,92 @@ from app.utils.http import RequestUtils
 from app.utils.string import StringUtils
 
 
+class PersonStateStore:
+    """
+    人物处理状态，以 (媒体服务器, 人物ID) 为键，记录TMDB ID、锁定字段、中文名、图片哈希和处理时间
+    所有状态在首次访问服务器时载入内存，更新时同步写入数据库
+    """
+
+    def __init__(self, db_path: str):
+        self._db_path = db_path
+        self._lock = threading.Lock()
+        self._states: Dict[str, Dict[str, dict]] = {}
+        with self.__connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS person ("
+                "server TEXT, person_id TEXT, tmdb_id TEXT, locked_fields TEXT, name TEXT, "
+                "image_hash TEXT, processed_at REAL, PRIMARY KEY (server, person_id))"
+            )
+
+    def __connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self._db_path)
+
+    def __load(self, server: str) -> Dict[str, dict]:
+        states = self._states.get(server)
+        if states is None:
+            with self.__connect() as conn:
+                rows = conn.execute("SELECT person_id, tmdb_id, locked_fields, name, image_hash, processed_at "
+                                    "FROM person WHERE server = ?", (server,)).fetchall()
+            states = {
+                person_id: {
+                    "tmdb_id": tmdb_id,
+                    "locked_fields": locked_fields.split(",") if locked_fields else [],
+                    "name": name,
+                    "image_hash": image_hash,
+                    "processed_at": processed_at
+                } for person_id, tmdb_id, locked_fields, name, image_hash, processed_at in rows
+            }
+            self._states[server] = states
+        return states
+
+    def get(self, server: str, person_id: str) -> Optional[dict]:
+        with self._lock:
+            return self.__load(server).get(str(person_id))
+
+    def set(self, server: str, person_id: str, tmdb_id: Optional[str], locked_fields: List[str],
+            name: Optional[str], image_hash: Optional[str]):
+        state = {
+            "tmdb_id": tmdb_id,
+            "locked_fields": locked_fields or [],
+            "name": name,
+            "image_hash": image_hash,
+            "processed_at": time.time()
+        }
+        with self._lock:
+            self.__load(server)[str(person_id)] = state
+            with self.__connect() as conn:
+                conn.execute("INSERT OR REPLACE INTO person VALUES (?, ?, ?, ?, ?, ?, ?)",
+                             (server, str(person_id), tmdb_id, ",".join(state["locked_fields"]),
+                              name, image_hash, state["processed_at"]))
+
+
+class RateLimiter:
+    """
+    限制调用间隔，多个线程共用时按顺序排队
+    """
+
+    def __init__(self, interval: float):
+        self._interval = interval
+        self._lock = threading.Lock()
+        self._next_time = 0.0
+
+    def wait(self, stop_event: threading.Event = None) -> bool:
+        """
+        等待到可调用的时间，收到停止信号时返回False
+        """
+        with self._lock:
+            now = time.time()
+            run_time = max(now, self._next_time)
+            self._next_time = run_time + self._interval
+        delay = run_time - now
+        if delay <= 0:
+            return True
+        if stop_event:
+            return not stop_event.wait(delay)
+        time.sleep(delay)
+        return True
+
+
 class PersonMeta(_PluginBase):
     # 插件名称
     plugin_name = "演职人员刮削"
@@ -62,6 +153,20 @@ class PersonMeta(_PluginBase):
     _type = "all"
     _remove_nozh = False
     _mediaservers = []
+    # 媒体库刮削并发数
+    _workers = 4
+    # 豆瓣请求间隔（秒）
+    _douban_interval = 3
+    # 未获取到中文信息的人物，间隔多少天后重新处理
+    _retry_days = 7
+    # 人物处理状态
+    _person_states: Optional[PersonStateStore] = None
+    _douban_limiter: Optional[RateLimiter] = None
+    # 图片地址 -> base64，同一图片只下载一次
+    _image_cache = LRUCache(maxsize=256, ttl=3600, timer=time.time)
+    # 人物ID -> 锁，避免同一人物被多个线程同时处理
+    _person_locks: Dict[Tuple[str, str], threading.Lock] = {}
+    _person_locks_lock = threading.Lock()
 
     def init_plugin(self, config: dict = None):
 
@@ -73,10 +178,17 @@ class PersonMeta(_PluginBase):
             self._delay = config.get("delay") or 0
             self._remove_nozh = config.get("remove_nozh") or False
             self._mediaservers = config.get("mediaservers") or []
+            try:
+                self._workers = max(int(config.get("workers") or 4), 1)
+            except ValueError:
+                self._workers = 4
 
         # 停止现有任务
         self.stop_service()
 
+        self._person_states = PersonStateStore(os.path.join(self.get_data_path(), "person_state.db"))
+        self._douban_limiter = RateLimiter(self._douban_interval)
+
         # 启动服务
         if self._onlyonce:
             self._scheduler = BackgroundScheduler(timezone=settings.TZ)
@@ -105,7 +217,8 @@ class PersonMeta(_PluginBase):
             "type": self._type,
             "delay": self._delay,
             "remove_nozh": self._remove_nozh,
-            "mediaservers": self._mediaservers
+            "mediaservers": self._mediaservers,
+            "workers": self._workers
         })
 
     def get_state(self) -> bool:
@@ -286,6 +399,23 @@ class PersonMeta(_PluginBase):
                                         }
                                     }
                                 ]
+                            },
+                            {
+                                'component': 'VCol',
+                                'props': {
+                                    'cols': 12,
+                                    'md': 6
+                                },
+                                'content': [
+                                    {
+                                        'component': 'VTextField',
+                                        'props': {
+                                            'model': 'workers',
+                                            'label': '媒体库刮削并发数',
+                                            'placeholder': '4'
+                                        }
+                                    }
+                                ]
                             }
                         ]
                     }
@@ -297,7 +427,8 @@ class PersonMeta(_PluginBase):
             "cron": "",
             "type": "all",
             "delay": 30,
-            "remove_nozh": False
+            "remove_nozh": False,
+            "workers": 4
         }
 
     def get_page(self) -> List[dict]:
@@ -367,28 +498,48 @@ class PersonMeta(_PluginBase):
         if not service_infos:
             return
         mediaserverchain = MediaServerChain()
-        for server, service in service_infos.items():
-            # 扫描所有媒体库
-            logger.info(f"开始刮削服务器 {server} 的演员信息 ...")
-            for library in mediaserverchain.librarys(server):
-                logger.info(f"开始刮削媒体库 {library.name} 的演员信息 ...")
-                for item in mediaserverchain.items(server, library.id):
-                    if not item:
-                        continue
-                    if not item.item_id:
-                        continue
-                    if "Series" not in item.item_type \
-                            and "Movie" not in item.item_type:
-                        continue
-                    if self._event.is_set():
-                        logger.info(f"演职人员刮削服务停止")
-                        return
-                    # 处理条目
-                    logger.info(f"开始刮削 {item.title} 的演员信息 ...")
-                    self.__update_item(server=server, item=item, server_type=service.type)
-                    logger.info(f"{item.title} 的演员信息刮削完成")
-                logger.info(f"媒体库 {library.name} 的演员信息刮削完成")
-            logger.info(f"服务器 {server} 的演员信息刮削完成")
+        # 限制排队中的条目数量，避免一次性读取整个媒体库
+        slots = threading.BoundedSemaphore(self._workers * 2)
+
+        def scrap_item(_server: str, _item: MediaServerItem, _server_type: str):
+            try:
+                if self._event.is_set():
+                    return
+                logger.info(f"开始刮削 {_item.title} 的演员信息 ...")
+                self.__update_item(server=_server, item=_item, server_type=_server_type)
+                logger.info(f"{_item.title} 的演员信息刮削完成")
+            except Exception as err:
+                logger.error(f"刮削 {_item.title} 的演员信息失败：{str(err)}")
+            finally:
+                slots.release()
+
+        try:
+            with ThreadPoolExecutor(max_workers=self._workers, thread_name_prefix="personmeta") as executor:
+                for server, service in service_infos.items():
+                    # 扫描所有媒体库
+                    logger.info(f"开始刮削服务器 {server} 的演员信息 ...")
+                    for library in mediaserverchain.librarys(server):
+                        logger.info(f"开始刮削媒体库 {library.name} 的演员信息 ...")
+                        for item in mediaserverchain.items(server, library.id):
+                            if not item:
+                                continue
+                            if not item.item_id:
+                                continue
+                            if "Series" not in item.item_type \
+                                    and "Movie" not in item.item_type:
+                                continue
+                            if self._event.is_set():
+                                logger.info("演职人员刮削服务停止")
+                                return
+                            # 处理条目
+                            slots.acquire()
+                            executor.submit(scrap_item, server, item, service.type)
+                        logger.info(f"媒体库 {library.name} 的演员条目已全部提交")
+                    logger.info(f"服务器 {server} 的演员条目已全部提交")
+        finally:
+            # 人物锁仅在本次刮削期间使用，结束后释放
+            self.__clear_person_locks()
+        logger.info("媒体库演员信息刮削完成")
 
     def __update_peoples(self, server: str, server_type: str,
                          itemid: str, iteminfo: dict, douban_actors):
@@ -536,6 +687,97 @@ class PersonMeta(_PluginBase):
         更新人物信息，返回替换后的人物信息
         """
 
+        # 返回的人物信息
+        ret_people = copy.deepcopy(people)
+
+        person_id = people.get("Id")
+        if not self._person_states or not person_id:
+            return self.__update_person(server=server, server_type=server_type, people=people,
+                                        ret_people=ret_people, douban_actors=douban_actors)
+
+        # 同一人物在多个条目中出现，只处理一次
+        with self.__person_lock(server, person_id):
+            state = self._person_states.get(server, person_id)
+            if not state or not state.get("name"):
+                # 未获取到中文名的人物，重试间隔内且当前条目也无豆瓣演员可匹配时跳过
+                if state and self.__state_valid(state) \
+                        and not self.__match_douban_actor(people, douban_actors):
+                    return None
+                return self.__update_person(server=server, server_type=server_type, people=people,
+                                            ret_people=ret_people, douban_actors=douban_actors,
+                                            image_hash=state.get("image_hash") if state else None)
+
+        # 已获取到中文名的人物直接使用记录的中文名，只按当前条目匹配饰演角色
+        ret_people["Name"] = state.get("name")
+        character = self.__get_douban_character(self.__match_douban_actor(people, douban_actors))
+        if character:
+            ret_people["Role"] = character
+        return ret_people
+
+    def __save_person_state(self, server: str, people: dict, tmdb_id: Optional[str], personinfo: dict,
+                            name: Optional[str], image_hash: Optional[str]):
+        """
+        记录人物处理状态
+        """
+        if not self._person_states or not people.get("Id"):
+            return
+        self._person_states.set(server=server, person_id=people.get("Id"), tmdb_id=tmdb_id,
+                                locked_fields=personinfo.get("LockedFields") or [],
+                                name=name, image_hash=image_hash)
+
+    def __state_valid(self, state: dict) -> bool:
+        """
+        未获取到中文名的人物是否仍在重试间隔内
+        """
+        return time.time() - (state.get("processed_at") or 0) < self._retry_days * 24 * 3600
+
+    @classmethod
+    def __clear_person_locks(cls):
+        """
+        清空人物锁
+        """
+        with cls._person_locks_lock:
+            cls._person_locks.clear()
+
+    def __person_lock(self, server: str, person_id: str) -> threading.Lock:
+        with self._person_locks_lock:
+            key = (server, str(person_id))
+            lock = self._person_locks.get(key)
+            if not lock:
+                lock = threading.Lock()
+                self._person_locks[key] = lock
+            return lock
+
+    @staticmethod
+    def __match_douban_actor(people: dict, douban_actors: list = None) -> Optional[dict]:
+        """
+        从豆瓣演员中匹配人物
+        """
+        for douban_actor in douban_actors or []:
+            if douban_actor.get("latin_name") == people.get("Name") \
+                    or douban_actor.get("name") == people.get("Name"):
+                return douban_actor
+        return None
+
+    @staticmethod
+    def __get_douban_character(douban_actor: Optional[dict]) -> Optional[str]:
+        """
+        获取豆瓣饰演角色，如"饰 詹姆斯·邦德 James Bond 007"
+        """
+        if not douban_actor or not douban_actor.get("character"):
+            return None
+        character = re.sub(r"饰\s+", "",
+                           douban_actor.get("character"))
+        character = re.sub("演员", "",
+                           character)
+        return character or None
+
+    def __update_person(self, server: str, server_type: str, people: dict, ret_people: dict,
+                        douban_actors: list = None, image_hash: str = None) -> Optional[dict]:
+        """
+        更新媒体服务器中的人物详情和图片，并记录处理状态
+        """
+
         def __get_peopleid(p: dict) -> Tuple[Optional[str], Optional[str]]:
             """
             获取人物的TMDBID、IMDBID
@@ -553,9 +795,6 @@ class PersonMeta(_PluginBase):
                 peopleimdbid = p["ProviderIds"]["imdb"]
             return peopletmdbid, peopleimdbid
 
-        # 返回的人物信息
-        ret_people = copy.deepcopy(people)
-
         try:
             # 查询媒体库人物详情
             personinfo = self.get_iteminfo(server=server, server_type=server_type,
@@ -622,45 +861,41 @@ class PersonMeta(_PluginBase):
                                   or not updated_overview
                                   or not update_character):
                 # 从豆瓣演员中匹配中文名称、角色和简介
-                for douban_actor in douban_actors:
-                    if douban_actor.get("latin_name") == people.get("Name") \
-                            or douban_actor.get("name") == people.get("Name"):
-                        # 名称
-                        if not updated_name:
-                            logger.debug(f"{people.get('Name')} 从豆瓣中获取到中文名：{douban_actor.get('name')}")
-                            personinfo["Name"] = douban_actor.get("name")
-                            ret_people["Name"] = douban_actor.get("name")
-                            updated_name = True
-                        # 描述
-                        if not updated_overview:
-                            if douban_actor.get("title"):
-                                logger.debug(f"{people.get('Name')} 从豆瓣中获取到中文描述：{douban_actor.get('title')}")
-                                personinfo["Overview"] = douban_actor.get("title")
-                                updated_overview = True
-                        # 饰演角色
-                        if not update_character:
-                            if douban_actor.get("character"):
-                                # "饰 詹姆斯·邦德 James Bond 007"
-                                character = re.sub(r"饰\s+", "",
-                                                   douban_actor.get("character"))
-                                character = re.sub("演员", "",
-                                                   character)
-                                if character:
-                                    logger.debug(f"{people.get('Name')} 从豆瓣中获取到饰演角色：{character}")
-                                    ret_people["Role"] = character
-                                    update_character = True
-                        # 图片
-                        if not profile_path:
-                            avatar = douban_actor.get("avatar") or {}
-                            if avatar.get("large"):
-                                logger.debug(f"{people.get('Name')} 从豆瓣中获取到图片：{avatar.get('large')}")
-                                profile_path = avatar.get("large")
-                        break
-
-            # 更新人物图片
-            if profile_path:
+                douban_actor = self.__match_douban_actor(people, douban_actors)
+                if douban_actor:
+                    # 名称
+                    if not updated_name:
+                        logger.debug(f"{people.get('Name')} 从豆瓣中获取到中文名：{douban_actor.get('name')}")
+                        personinfo["Name"] = douban_actor.get("name")
+                        ret_people["Name"] = douban_actor.get("name")
+                        updated_name = True
+                    # 描述
+                    if not updated_overview:
+                        if douban_actor.get("title"):
+                            logger.debug(f"{people.get('Name')} 从豆瓣中获取到中文描述：{douban_actor.get('title')}")
+                            personinfo["Overview"] = douban_actor.get("title")
+                            updated_overview = True
+                    # 饰演角色
+                    if not update_character:
+                        character = self.__get_douban_character(douban_actor)
+                        if character:
+                            logger.debug(f"{people.get('Name')} 从豆瓣中获取到饰演角色：{character}")
+                            ret_people["Role"] = character
+                            update_character = True
+                    # 图片
+                    if not profile_path:
+                        avatar = douban_actor.get("avatar") or {}
+                        if avatar.get("large"):
+                            logger.debug(f"{people.get('Name')} 从豆瓣中获取到图片：{avatar.get('large')}")
+                            profile_path = avatar.get("large")
+
+            # 更新人物图片，图片地址未变化时跳过
+            new_image_hash = hashlib.md5(profile_path.encode("utf-8")).hexdigest() if profile_path else None
+            if profile_path and new_image_hash != image_hash:
                 logger.debug(f"更新人物 {people.get('Name')} 的图片：{profile_path}")
-                self.set_item_image(server=server, server_type=server_type, itemid=people.get("Id"), imageurl=profile_path)
+                if not self.set_item_image(server=server, server_type=server_type,
+                                           itemid=people.get("Id"), imageurl=profile_path):
+                    new_image_hash = image_hash
 
             # 锁定人物信息
             if updated_name:
@@ -676,9 +911,15 @@ class PersonMeta(_PluginBase):
                 ret = self.set_iteminfo(server=server, server_type=server_type,
                                         itemid=people.get("Id"), iteminfo=personinfo)
                 if ret:
+                    self.__save_person_state(server=server, people=people, tmdb_id=person_tmdbid,
+                                             personinfo=personinfo,
+                                             name=ret_people.get("Name") if updated_name else None,
+                                             image_hash=new_image_hash)
                     return ret_people
             else:
                 logger.debug(f"人物 {people.get('Name')} 未找到中文数据")
+                self.__save_person_state(server=server, people=people, tmdb_id=person_tmdbid,
+                                         personinfo=personinfo, name=None, image_hash=new_image_hash)
         except Exception as err:
             logger.error(f"更新人物信息失败：{str(err)}")
         return None
@@ -687,10 +928,9 @@ class PersonMeta(_PluginBase):
         """
         获取豆瓣演员信息
         """
-        # 随机休眠 3-10 秒
-        sleep_time = 3 + int(time.time()) % 7
-        logger.debug(f"随机休眠 {sleep_time}秒 ...")
-        time.sleep(sleep_time)
+        # 豆瓣请求限速，多个线程共用
+        if self._douban_limiter and not self._douban_limiter.wait(self._event):
+            return []
         # 匹配豆瓣信息
         doubaninfo = self.chain.match_doubaninfo(name=mediainfo.title,
                                                  imdbid=mediainfo.imdb_id,
@@ -992,6 +1232,9 @@ class PersonMeta(_PluginBase):
             """
             下载图片
             """
+            image_base64 = self._image_cache.get(imageurl)
+            if image_base64:
+                return image_base64
             try:
                 if "doubanio.com" in imageurl:
                     r = RequestUtils(headers={
@@ -1000,7 +1243,9 @@ class PersonMeta(_PluginBase):
                 else:
                     r = RequestUtils().get_res(url=imageurl, raise_exception=True)
                 if r:
-                    return base64.b64encode(r.content).decode()
+                    image_base64 = base64.b64encode(r.content).decode()
+                    self._image_cache.set(imageurl, image_base64)
+                    return image_base64
                 else:
                     logger.warn(f"{imageurl} 图片下载失败，请检查网络连通性")
             except Exception as err:
@@ -1099,5 +1344,6 @@ class PersonMeta(_PluginBase):
                     self._scheduler.shutdown()
                     self._event.clear()
                 self._scheduler = None
+            self.__clear_person_locks()
         except Exception as e:
             print(str(e))
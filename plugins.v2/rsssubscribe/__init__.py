@@ -1,6 +1,7 @@
 import datetime
 import re
 import traceback
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from threading import Lock
 from typing import Optional, Any, List, Dict, Tuple
@@ -47,6 +48,10 @@ class RssSubscribe(_PluginBase):
     # 私有变量
     _scheduler: Optional[BackgroundScheduler] = None
     _cache_path: Optional[Path] = None
+    # 并发获取RSS的线程数
+    _fetch_workers: int = 5
+    # 历史记录保留条数
+    _history_limit: int = 1000
 
     # 配置属性
     _enabled: bool = False
@@ -609,19 +614,28 @@ class RssSubscribe(_PluginBase):
             history = []
         else:
             history: List[dict] = self.get_data('history') or []
+        history_size = len(history)
+        # 已处理过的标题
+        seen_keys = {h.get("key") for h in history}
         downloadchain = DownloadChain()
         subscribechain = SubscribeChain()
-        for url in self._address.split("\n"):
+        # 过滤规则
+        filter_groups = self.systemconfig.get(SystemConfigKey.SubscribeFilterRuleGroups)
+        include_re = re.compile(r"%s" % self._include, re.IGNORECASE) if self._include else None
+        exclude_re = re.compile(r"%s" % self._exclude, re.IGNORECASE) if self._exclude else None
+        sizes = [float(_size) * 1024 ** 3 for _size in self._size_range.split("-")] if self._size_range else []
+        # 并发获取所有RSS
+        urls = [url for url in self._address.split("\n") if url]
+        if not urls:
+            return
+        logger.info(f"开始刷新RSS：{', '.join(urls)} ...")
+        with ThreadPoolExecutor(max_workers=min(len(urls), self._fetch_workers)) as executor:
+            rss_results = list(executor.map(self.__parse_rss, urls))
+        for url, results in zip(urls, rss_results):
             # 处理每一个RSS链接
-            if not url:
-                continue
-            logger.info(f"开始刷新RSS：{url} ...")
-            results = RssHelper().parse(url, proxy=self._proxy)
             if not results:
                 logger.error(f"未获取到RSS数据：{url}")
-                return
-            # 过滤规则
-            filter_groups = self.systemconfig.get(SystemConfigKey.SubscribeFilterRuleGroups)
+                continue
             # 解析数据
             for result in results:
                 try:
@@ -632,19 +646,16 @@ class RssSubscribe(_PluginBase):
                     size = result.get("size")
                     pubdate: datetime.datetime = result.get("pubdate")
                     # 检查是否处理过
-                    if not title or title in [h.get("key") for h in history]:
+                    if not title or title in seen_keys:
                         continue
                     # 检查规则
-                    if self._include and not re.search(r"%s" % self._include,
-                                                       f"{title} {description}", re.IGNORECASE):
+                    if include_re and not include_re.search(f"{title} {description}"):
                         logger.info(f"{title} - {description} 不符合包含规则")
                         continue
-                    if self._exclude and re.search(r"%s" % self._exclude,
-                                                   f"{title} {description}", re.IGNORECASE):
+                    if exclude_re and exclude_re.search(f"{title} {description}"):
                         logger.info(f"{title} - {description} 不符合排除规则")
                         continue
-                    if self._size_range:
-                        sizes = [float(_size) * 1024 ** 3 for _size in self._size_range.split("-")]
+                    if sizes:
                         if len(sizes) == 1 and float(size) < sizes[0]:
                             logger.info(f"{title} - 种子大小不符合条件")
                             continue
@@ -734,14 +745,28 @@ class RssSubscribe(_PluginBase):
                         "tmdbid": mediainfo.tmdb_id,
                         "time": datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
                     })
+                    seen_keys.add(title)
                 except Exception as err:
                     logger.error(f'刷新RSS数据出错：{str(err)} - {traceback.format_exc()}')
             logger.info(f"RSS {url} 刷新完成")
-        # 保存历史记录
-        self.save_data('history', history)
+        # 保存历史记录，仅保留最近的记录
+        if len(history) != history_size or self._clearflag:
+            if len(history) > self._history_limit:
+                history = sorted(history, key=lambda x: x.get('time') or '')[-self._history_limit:]
+            self.save_data('history', history)
         # 缓存只清理一次
         self._clearflag = False
 
+    def __parse_rss(self, url: str) -> Optional[list]:
+        """
+        获取RSS数据
+        """
+        try:
+            return RssHelper().parse(url, proxy=self._proxy)
+        except Exception as err:
+            logger.error(f"获取RSS数据出错：{url} - {str(err)}")
+            return None
+
     def __log_and_notify_error(self, message):
         """
         记录错误日志并发送系统通知
@@ -753,12 +778,23 @@ class RssSubscribe(_PluginBase):
         """
         检查并修正配置值
         """
+        valid = True
         size_range = config.get("size_range")
         if size_range and not self.__is_number_or_range(str(size_range)):
             self.__log_and_notify_error(f"自定义订阅出错，种子大小设置错误：{size_range}")
             config["size_range"] = None
-            return False
-        return True
+            valid = False
+        for key, name in (("include", "包含规则"), ("exclude", "排除规则")):
+            pattern = config.get(key)
+            if not pattern:
+                continue
+            try:
+                re.compile(r"%s" % pattern, re.IGNORECASE)
+            except re.error as err:
+                self.__log_and_notify_error(f"自定义订阅出错，{name}正则表达式错误：{pattern}，{err}")
+                config[key] = None
+                valid = False
+        return valid
 
     @staticmethod
     def __is_number_or_range(value):
@@ -50,6 +50,8 @@ class SiteStatistic(_PluginBase):
     _dashboard_type: str = "today"
     _notify_type = ""
     _scheduler = None
+    # 站点数据缓存：(最近一次统计数据标识, (最新日期, 最近一次数据, 上一次数据))
+    _data_cache: Optional[Tuple[tuple, Tuple[str, List[SiteUserData], List[SiteUserData]]]] = None
 
     def init_plugin(self, config: dict = None):
 
@@ -273,45 +275,50 @@ class SiteStatistic(_PluginBase):
             self.post_message(mtype=NotificationType.SiteMessage,
                               title="站点数据统计", text="\n".join(sorted_messages))
 
-    @staticmethod
-    def __get_data() -> Tuple[str, List[SiteUserData], List[SiteUserData]]:
+    def __get_data(self) -> Tuple[str, List[SiteUserData], List[SiteUserData]]:
         """
         获取最近一次统计的日期、最近一次统计的站点数据、上一次的站点数据
         如果上一次某个站点数据缺失，则 fallback 到该站点之前最近有数据的日期
+        最近一次统计数据未发生变化时，直接使用缓存结果
         """
         # 优化：只获取最近的站点数据，而不是所有历史数据
         latest_data: List[SiteUserData] = SiteOper().get_userdata_latest()
         if not latest_data:
             return "", [], []
 
+        # 最近一次统计数据的标识，站点数据刷新后变化
+        cache_key = tuple(sorted((data.name, data.updated_day, data.updated_time) for data in latest_data))
+        with lock:
+            if self._data_cache and self._data_cache[0] == cache_key:
+                latest_day, cached_latest, cached_previous = self._data_cache[1]
+                return latest_day, list(cached_latest), list(cached_previous)
+
         # 获取最新日期（用于显示）
         latest_day = max(data.updated_day for data in latest_data)
         
         # 按上传量降序排序
         latest_data.sort(key=lambda x: x.upload or 0, reverse=True)
 
+        # 按日期加载所有站点数据，同一日期只查询一次
+        day_data_cache: Dict[str, Dict[str, SiteUserData]] = {}
+
+        def __get_day_data(day: str) -> Dict[str, SiteUserData]:
+            if day not in day_data_cache:
+                day_data_cache[day] = {data.name: data for data in SiteOper().get_userdata_by_date(day) or []}
+            return day_data_cache[day]
+
         # 为每个站点查找对应的前一天数据
         previous_data = []
         for current_site in latest_data:
             site_name = current_site.name
-            current_day = current_site.updated_day
-            
-            # 计算该站点的前一天日期
-            previous_day_str = (datetime.strptime(current_day, "%Y-%m-%d") - timedelta(days=1)).strftime("%Y-%m-%d")
-            
-            # 获取前一天的数据
-            previous_data_list = SiteOper().get_userdata_by_date(previous_day_str)
-            previous_by_site = {data.name: data for data in previous_data_list}
-            site_prev = previous_by_site.get(site_name)
-            
-            # 如果前一天没有该站点数据，尝试查找更早的数据
+            current_day = datetime.strptime(current_site.updated_day, "%Y-%m-%d")
+
+            # 获取前一天的数据，如果前一天没有该站点数据，尝试查找更早的数据，最多回溯7天，避免查询过多历史数据
+            site_prev = __get_day_data((current_day - timedelta(days=1)).strftime("%Y-%m-%d")).get(site_name)
             if not site_prev or site_prev.err_msg:
-                # 最多回溯7天，避免查询过多历史数据
                 for i in range(2, 8):
-                    fallback_date = (datetime.strptime(current_day, "%Y-%m-%d") - timedelta(days=i)).strftime("%Y-%m-%d")
-                    fallback_data_list = SiteOper().get_userdata_by_date(fallback_date)
-                    fallback_by_site = {data.name: data for data in fallback_data_list}
-                    candidate = fallback_by_site.get(site_name)
+                    fallback_date = (current_day - timedelta(days=i)).strftime("%Y-%m-%d")
+                    candidate = __get_day_data(fallback_date).get(site_name)
                     if candidate and not candidate.err_msg:
                         site_prev = candidate
                         break
@@ -319,10 +326,10 @@ class SiteStatistic(_PluginBase):
             if site_prev:
                 previous_data.append(site_prev)
 
-        # 清理垃圾
-        gc.collect()
+        with lock:
+            self._data_cache = (cache_key, (latest_day, latest_data, previous_data))
 
-        return latest_day, latest_data, previous_data
+        return latest_day, list(latest_data), list(previous_data)
 
     @staticmethod
     def __get_total_elements(today: str, stattistic_data: List[SiteUserData], yesterday_sites_data: List[SiteUserData],
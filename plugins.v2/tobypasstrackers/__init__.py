@@ -17,6 +17,7 @@ from app.db.site_oper import SiteOper
 from app.log import logger
 from app.plugins import _PluginBase
 from app.plugins.tobypasstrackers.dns_helper import DnsHelper
+from app.plugins.tobypasstrackers.ip_helper import IpRangeIndex
 from app.schemas.types import EventType, NotificationType
 from app.utils.http import RequestUtils
 
@@ -525,44 +526,6 @@ class ToBypassTrackers(_PluginBase):
 
     @eventmanager.register(EventType.PluginAction)
     def update_ips(self):
-        def __is_ip_in_subnet(ip_input: str, su_bnet: str) -> bool:
-            """
-            Check if the given IP address is in the specified subnet.
-
-            :param ip_input: IP address as a string (e.g., '192.168.1.1')
-            :param su_bnet: Subnet in CIDR notation (e.g., '192.168.1.0/24')
-            :return: True if IP is in the subnet, False otherwise
-            """
-            ip_obj = ipaddress.ip_address(ip_input)
-            subnet_obj = ipaddress.ip_network(su_bnet, strict=False)
-            return ip_obj in subnet_obj
-
-        def __search_ip(ip, ips_list):
-            i = 0
-            for ip_range in ips_list:
-                if __is_ip_in_subnet(ip, ip_range):
-                    return i
-                i += 1
-            return -1
-
-        def __exclude_ip_range(range_b: str, range_a: str):
-            """
-            Exclude IP range A from IP range B and return the remaining subranges.
-
-            :param range_b: The larger IP range in CIDR notation (must include range_a).
-            :param range_a: The smaller IP range to exclude in CIDR notation.
-            :return: List of remaining IP subranges in CIDR notation.
-            """
-            net_b = ipaddress.ip_network(range_b, strict=False)
-            net_a = ipaddress.ip_network(range_a, strict=False)
-
-            if not (net_a.subnet_of(net_b)):
-                raise ValueError("Range A is not fully contained within Range B.")
-
-            remaining_ranges = list(net_b.address_exclude(net_a))
-
-            return [str(sub_net) for sub_net in remaining_ranges]
-
         async def resolve_and_check(domain_, results_, failed_msg_, dns_type_, ip_list_):
             try:
                 addresses = await query_helper.query_dns(domain_, dns_type_)
@@ -572,12 +535,8 @@ class ToBypassTrackers(_PluginBase):
                     return
 
                 for address in addresses:
-                    has_flag = any(__is_ip_in_subnet(address, subnet) for subnet in ip_list_)
-                    if not has_flag:
-                        if dns_type_ == "AAAA":
-                            ip_list_.append(address)
-                        else:
-                            ip_list_.append(address)
+                    if address not in ip_list_:
+                        ip_list_.append(address)
                     logger.info(f"Resolving【{domain_name_map.get(domain_, domain_)}】{address} ({domain_})")
             except Exception as e:
                 logger.exception(f"处理 {domain_} 出错: {e}")
@@ -669,29 +628,16 @@ class ToBypassTrackers(_PluginBase):
                     except socket.error:
                         exempted_domains.append(exempted_domain)
 
-        asyncio.run(resolve_all(exempted_domains, exempted_ip, exempted_ipv6))
-        for ip in exempted_ip:
-            index = __search_ip(ip, ip_list)
-            if index == -1:
-                continue
-            ip_larger = ip_list[index]
-            ip_list.pop(index)
-            length = int(ip_larger.split('/')[1])
-            if length < 12:
-                remaining_ip = __exclude_ip_range(ip_larger, f"{ip}/{length + 8}")
-                ip_list.extend(remaining_ip)
-        for ip in exempted_ipv6:
-            index = __search_ip(ip, ipv6_list)
-            if index == -1:
-                continue
-            ip_larger = ipv6_list[index]
-            ipv6_list.pop(index)
-            length = int(ip_larger.split('/')[1])
-            if length < 32:
-                remaining_ip = __exclude_ip_range(ip_larger, f"{ip}/{min(32, length + 8)}")
-                ipv6_list.extend(remaining_ip)
-        self.ipv4_txt = "\n".join(ip_list)
-        self.ipv6_txt = "\n".join(ipv6_list)
+        asyncio.run(resolve_all(exempted_domains, exempted_ipv6, exempted_ip))
+        # 建立网段索引，通过二分查找从原始网段中排除豁免的IP，输出时再合并网段
+        ip_index = IpRangeIndex(ip_list + ipv6_list)
+        for ip in exempted_ip + exempted_ipv6:
+            if ":" in ip:
+                ip_index.exclude(ip, max_prefixlen=32, max_exclude_prefixlen=32)
+            else:
+                ip_index.exclude(ip, max_prefixlen=12, max_exclude_prefixlen=32)
+        self.ipv4_txt = ip_index.to_text(4)
+        self.ipv6_txt = ip_index.to_text(6)
         self.save_data("ipv4_txt", self.ipv4_txt)
         self.save_data("ipv6_txt", self.ipv6_txt)
         if self._notify:
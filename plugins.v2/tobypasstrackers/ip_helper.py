@@ -0,0 +1,108 @@
+import bisect
+import ipaddress
+from typing import Dict, Iterable, List, Optional, Tuple, Union
+
+from app.log import logger
+
+IPNetwork = Union[ipaddress.IPv4Network, ipaddress.IPv6Network]
+
+
+class IpRangeIndex:
+    """
+    IP网段索引，保留原始网段并按起始地址排序，通过二分查找定位IP所属网段
+    被其它网段包含的网段单独保存，外层网段被排除拆分后重新加入
+    排除IP时作用于原始网段，输出时再合并相邻网段
+    """
+
+    def __init__(self, ranges: Iterable[str] = None):
+        networks: Dict[int, List[IPNetwork]] = {4: [], 6: []}
+        for ip_range in ranges or []:
+            ip_range = ip_range.strip()
+            if not ip_range:
+                continue
+            try:
+                network = ipaddress.ip_network(ip_range, strict=False)
+            except ValueError:
+                logger.warn(f"无效的IP网段: {ip_range}")
+                continue
+            networks[network.version].append(network)
+        self.__networks: Dict[int, List[IPNetwork]] = {}
+        # 被其它网段包含的网段
+        self.__covered: Dict[int, List[IPNetwork]] = {}
+        for version, nets in networks.items():
+            self.__networks[version], self.__covered[version] = self.__dedupe(nets)
+        self.__starts: Dict[int, List[int]] = {
+            version: [int(net.network_address) for net in nets] for version, nets in self.__networks.items()
+        }
+
+    @staticmethod
+    def __dedupe(networks: List[IPNetwork]) -> Tuple[List[IPNetwork], List[IPNetwork]]:
+        """
+        排序并分离出重复或被前一网段包含的网段，返回 (互不重叠的网段, 被包含的网段)
+        """
+        result: List[IPNetwork] = []
+        covered: List[IPNetwork] = []
+        for net in sorted(networks, key=lambda n: (int(n.network_address), n.prefixlen)):
+            if result and int(net.broadcast_address) <= int(result[-1].broadcast_address):
+                if net != result[-1]:
+                    covered.append(net)
+                continue
+            result.append(net)
+        return result, covered
+
+    def __search(self, ip: Union[ipaddress.IPv4Address, ipaddress.IPv6Address]) -> int:
+        starts = self.__starts[ip.version]
+        index = bisect.bisect_right(starts, int(ip)) - 1
+        if index >= 0 and ip in self.__networks[ip.version][index]:
+            return index
+        return -1
+
+    def find(self, ip: str) -> Optional[IPNetwork]:
+        """
+        查找IP所属网段，不存在时返回None
+        """
+        try:
+            ip_obj = ipaddress.ip_address(ip)
+        except ValueError:
+            return None
+        index = self.__search(ip_obj)
+        return self.__networks[ip_obj.version][index] if index >= 0 else None
+
+    def replace(self, network: IPNetwork, subnets: List[IPNetwork]):
+        """
+        将指定网段替换为其子网段
+        """
+        index = self.__search(network.network_address)
+        if index < 0 or self.__networks[network.version][index] != network:
+            return
+        subnets = sorted(subnets)
+        self.__networks[network.version][index:index + 1] = subnets
+        self.__starts[network.version][index:index + 1] = [int(net.network_address) for net in subnets]
+
+    def exclude(self, ip: str, max_prefixlen: int, max_exclude_prefixlen: int):
+        """
+        排除IP：所属原始网段较大时仅排除该IP附近的子网段，否则移除整个网段
+        被移除网段所包含的原始网段重新加入，其中仍包含该IP的继续按同样规则排除
+        """
+        while True:
+            ip_larger = self.find(ip)
+            if not ip_larger:
+                return
+            length = ip_larger.prefixlen
+            remaining_ip = []
+            if length < max_prefixlen:
+                net_a = ipaddress.ip_network(f"{ip}/{min(max_exclude_prefixlen, length + 8)}", strict=False)
+                remaining_ip = list(ip_larger.address_exclude(net_a))
+            covered = self.__covered[ip_larger.version]
+            inner = [net for net in covered if net.subnet_of(ip_larger)]
+            if inner:
+                self.__covered[ip_larger.version] = [net for net in covered if not net.subnet_of(ip_larger)]
+                remaining_ip, inner_covered = self.__dedupe(remaining_ip + inner)
+                self.__covered[ip_larger.version].extend(inner_covered)
+            self.replace(ip_larger, remaining_ip)
+
+    def to_text(self, version: int) -> str:
+        """
+        合并相邻网段后输出指定协议版本的网段列表，每行一个网段
+        """
+        return "\n".join(str(net) for net in ipaddress.collapse_addresses(self.__networks[version]))
@@ -60,6 +60,7 @@ class TorrentRemover(_PluginBase):
     _errorkeywords = None
     _torrentstates = None
     _torrentcategorys = None
+    _batchsize = 50
 
     def init_plugin(self, config: dict = None):
 
@@ -82,6 +83,10 @@ class TorrentRemover(_PluginBase):
             self._errorkeywords = config.get("errorkeywords") or ""
             self._torrentstates = config.get("torrentstates") or ""
             self._torrentcategorys = config.get("torrentcategorys") or ""
+            try:
+                self._batchsize = max(int(config.get("batchsize") or 50), 1)
+            except ValueError:
+                self._batchsize = 50
 
         self.stop_service()
 
@@ -114,8 +119,8 @@ class TorrentRemover(_PluginBase):
                     "trackerkeywords": self._trackerkeywords,
                     "errorkeywords": self._errorkeywords,
                     "torrentstates": self._torrentstates,
-                    "torrentcategorys": self._torrentcategorys
-
+                    "torrentcategorys": self._torrentcategorys,
+                    "batchsize": self._batchsize
                 })
                 if self._scheduler.get_jobs():
                     # 启动服务
@@ -425,6 +430,22 @@ class TorrentRemover(_PluginBase):
                                         }
                                     }
                                 ]
+                            },
+                            {
+                                'component': 'VCol',
+                                'props': {
+                                    'cols': 6
+                                },
+                                'content': [
+                                    {
+                                        'component': 'VTextField',
+                                        'props': {
+                                            'model': 'batchsize',
+                                            'label': '批量处理数量',
+                                            'placeholder': '每次请求下载器处理的种子数，默认50'
+                                        }
+                                    }
+                                ]
                             }
                         ]
                     },
@@ -562,7 +583,8 @@ class TorrentRemover(_PluginBase):
             "trackerkeywords": "",
             "errorkeywords": "",
             "torrentstates": "",
-            "torrentcategorys": ""
+            "torrentcategorys": "",
+            "batchsize": 50
         }
 
     def get_page(self) -> List[dict]:
@@ -636,47 +658,32 @@ class TorrentRemover(_PluginBase):
                     downlader_obj = self.__get_downloader(downloader)
                     if self._action == "pause":
                         message_text = f"{downloader.title()} 共暂停{len(torrents)}个种子"
-                        for torrent in torrents:
-                            if self._event.is_set():
-                                logger.info(f"自动删种服务停止")
-                                return
-                            text_item = f"{torrent.get('name')} " \
-                                        f"来自站点：{torrent.get('site')} " \
-                                        f"大小：{StringUtils.str_filesize(torrent.get('size'))}"
-                            # 暂停种子
-                            downlader_obj.stop_torrents(ids=[torrent.get("id")])
-                            logger.info(f"自动删种任务 暂停种子：{text_item}")
-                            message_text = f"{message_text}\n{text_item}"
+                        action_text = "暂停种子"
                     elif self._action == "delete":
                         message_text = f"{downloader.title()} 共删除{len(torrents)}个种子"
-                        for torrent in torrents:
-                            if self._event.is_set():
-                                logger.info(f"自动删种服务停止")
-                                return
-                            text_item = f"{torrent.get('name')} " \
-                                        f"来自站点：{torrent.get('site')} " \
-                                        f"大小：{StringUtils.str_filesize(torrent.get('size'))}"
-                            # 删除种子
-                            downlader_obj.delete_torrents(delete_file=False,
-                                                          ids=[torrent.get("id")])
-                            logger.info(f"自动删种任务 删除种子：{text_item}")
-                            message_text = f"{message_text}\n{text_item}"
+                        action_text = "删除种子"
                     elif self._action == "deletefile":
                         message_text = f"{downloader.title()} 共删除{len(torrents)}个种子及文件"
-                        for torrent in torrents:
-                            if self._event.is_set():
-                                logger.info(f"自动删种服务停止")
-                                return
+                        action_text = "删除种子及文件"
+                    else:
+                        continue
+                    # 按批次处理，减少下载器请求次数
+                    for i in range(0, len(torrents), self._batchsize):
+                        if self._event.is_set():
+                            logger.info(f"自动删种服务停止")
+                            return
+                        batch = torrents[i:i + self._batchsize]
+                        ids = [torrent.get("id") for torrent in batch]
+                        if self._action == "pause":
+                            downlader_obj.stop_torrents(ids=ids)
+                        else:
+                            downlader_obj.delete_torrents(delete_file=self._action == "deletefile", ids=ids)
+                        for torrent in batch:
                             text_item = f"{torrent.get('name')} " \
                                         f"来自站点：{torrent.get('site')} " \
                                         f"大小：{StringUtils.str_filesize(torrent.get('size'))}"
-                            # 删除种子
-                            downlader_obj.delete_torrents(delete_file=True,
-                                                          ids=[torrent.get("id")])
-                            logger.info(f"自动删种任务 删除种子及文件：{text_item}")
+                            logger.info(f"自动删种任务 {action_text}：{text_item}")
                             message_text = f"{message_text}\n{text_item}"
-                    else:
-                        continue
                     if torrents and message_text and self._notify:
                         self.post_message(
                             mtype=NotificationType.SiteMessage,
@@ -807,34 +814,32 @@ class TorrentRemover(_PluginBase):
             remove_torrents.append(item)
         # 处理辅种
         if self._samedata and remove_torrents:
-            remove_ids = [t.get("id") for t in remove_torrents]
+            remove_ids = {t.get("id") for t in remove_torrents}
+            # 按名称和大小建立索引
+            same_data_index: Dict[Tuple[str, int], List[dict]] = {}
+            for torrent in torrents:
+                if downloader_config.type == "qbittorrent":
+                    plus_item = {
+                        "id": torrent.hash,
+                        "name": torrent.name,
+                        "site": StringUtils.get_url_sld(torrent.tracker),
+                        "size": torrent.size
+                    }
+                else:
+                    plus_item = {
+                        "id": torrent.hashString,
+                        "name": torrent.name,
+                        "site": torrent.trackers[0].get("sitename") if torrent.trackers else "",
+                        "size": torrent.total_size
+                    }
+                same_data_index.setdefault((plus_item["name"], plus_item["size"]), []).append(plus_item)
             remove_torrents_plus = []
             for remove_torrent in remove_torrents:
-                name = remove_torrent.get("name")
-                size = remove_torrent.get("size")
-                for torrent in torrents:
-                    if downloader_config.type == "qbittorrent":
-                        plus_id = torrent.hash
-                        plus_name = torrent.name
-                        plus_size = torrent.size
-                        plus_site = StringUtils.get_url_sld(torrent.tracker)
-                    else:
-                        plus_id = torrent.hashString
-                        plus_name = torrent.name
-                        plus_size = torrent.total_size
-                        plus_site = torrent.trackers[0].get("sitename") if torrent.trackers else ""
-                    # 比对名称和大小
-                    if plus_name == name \
-                            and plus_size == size \
-                            and plus_id not in remove_ids:
-                        remove_torrents_plus.append(
-                            {
-                                "id": plus_id,
-                                "name": plus_name,
-                                "site": plus_site,
-                                "size": plus_size
-                            }
-                        )
+                # 比对名称和大小
+                for plus_item in same_data_index.get((remove_torrent.get("name"), remove_torrent.get("size")), []):
+                    if plus_item["id"] not in remove_ids:
+                        remove_ids.add(plus_item["id"])
+                        remove_torrents_plus.append(plus_item)
             if remove_torrents_plus:
                 remove_torrents.extend(remove_torrents_plus)
         return remove_torrents
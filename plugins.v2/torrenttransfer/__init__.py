@@ -1,4 +1,5 @@
 import os
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 from pathlib import Path
 from threading import Event
@@ -72,6 +73,12 @@ class TorrentTransfer(_PluginBase):
     _is_recheck_running = False
     # 任务标签
     _torrent_tags = []
+    # 并发解析种子文件的线程数
+    _prepare_workers = 4
+    # 每批转移的种子数，每批完成后批量删除源种子并保存断点
+    _batch_size = 50
+    # 添加种子的间隔（秒）
+    _add_interval = 0.1
 
     def init_plugin(self, config: dict = None):
 
@@ -780,25 +787,33 @@ class TorrentTransfer(_PluginBase):
             del_dup = 0
 
             downloader_helper = DownloaderHelper()
+            from_is_qb = downloader_helper.is_downloader("qbittorrent", service=from_service)
+            # 读取断点，先完成上次中断时未删除的源种子
+            checkpoint = self.__load_checkpoint(from_service.name, to_service.name)
+            if checkpoint["pending_delete"]:
+                self.__save_checkpoint(from_downloader, checkpoint)
+            # 一次性获取目的下载器中的所有种子hash，获取失败时逐个查询
+            to_hashes = self.__get_all_hashes(to_service)
+
+            # 过滤已在目的下载器中的种子，转换保存路径
+            pending_torrents = []
+            duplicate_hashes = []
             for torrent_item in trans_torrents:
-                # 检查种子文件是否存在
-                torrent_file = Path(self._fromtorrentpath) / f"{torrent_item.get('hash')}.torrent"
-                if not torrent_file.exists():
-                    logger.error(f"种子文件不存在：{torrent_file}")
-                    # 失败计数
-                    fail += 1
-                    continue
-
-                # 查询hash值是否已经在目的下载器中
-                torrent_info, _ = to_downloader.get_torrents(ids=[torrent_item.get('hash')])
-                if torrent_info:
+                hash_str = torrent_item.get('hash')
+                # 以目的下载器的实际种子为准，批量查询失败时才使用断点记录
+                if to_hashes is not None:
+                    is_exists = hash_str in to_hashes
+                elif hash_str in checkpoint["done"]:
+                    is_exists = True
+                else:
+                    torrent_info, _ = to_downloader.get_torrents(ids=[hash_str])
+                    is_exists = bool(torrent_info)
+                if is_exists:
                     # 删除重复的源种子，不能删除文件！
                     if self._deleteduplicate:
-                        logger.info(f"删除重复的源下载器任务（不含文件）：{torrent_item.get('hash')} ...")
-                        from_downloader.delete_torrents(delete_file=False, ids=[torrent_item.get('hash')])
-                        del_dup += 1
+                        duplicate_hashes.append(hash_str)
                     else:
-                        logger.info(f"{torrent_item.get('hash')} 已在目的下载器中，跳过 ...")
+                        logger.info(f"{hash_str} 已在目的下载器中，跳过 ...")
                         # 跳过计数
                         skip += 1
                     continue
@@ -812,70 +827,47 @@ class TorrentTransfer(_PluginBase):
                     # 失败计数
                     fail += 1
                     continue
-
-                # 如果源下载器是QB检查是否有Tracker，没有的话额外获取
-                if downloader_helper.is_downloader("qbittorrent", service=from_service):
-                    # 读取种子内容、解析种子文件
-                    content = torrent_file.read_bytes()
+                torrent_item["download_dir"] = download_dir
+                pending_torrents.append(torrent_item)
+
+            if duplicate_hashes:
+                logger.info(f"删除重复的源下载器任务（不含文件）：{len(duplicate_hashes)} 个 ...")
+                from_downloader.delete_torrents(delete_file=False, ids=duplicate_hashes)
+                del_dup += len(duplicate_hashes)
+
+            stopped = False
+            for i in range(0, len(pending_torrents), self._batch_size):
+                if self._event.is_set():
+                    stopped = True
+                    break
+                batch = pending_torrents[i:i + self._batch_size]
+                # 并发读取并解析种子文件
+                with ThreadPoolExecutor(max_workers=self._prepare_workers) as executor:
+                    contents = list(executor.map(lambda item: self.__prepare_torrent(item, from_is_qb), batch))
+
+                for torrent_item, content in zip(batch, contents):
+                    if self._event.is_set():
+                        stopped = True
+                        break
                     if not content:
-                        logger.warn(f"读取种子文件失败：{torrent_file}")
+                        # 失败计数
                         fail += 1
                         continue
-                    # 读取trackers
-                    try:
-                        torrent_main = bdecode(content)
-                        main_announce = torrent_main.get('announce')
-                    except Exception as err:
-                        logger.warn(f"解析种子文件 {torrent_file} 失败：{str(err)}")
+
+                    # 发送到另一个下载器中下载：默认暂停、传输下载路径、关闭自动管理模式
+                    logger.info(f"添加转移做种任务到下载器 {to_service.name}：{torrent_item.get('hash')}")
+                    download_id = self.__download(service=to_service,
+                                                  content=content,
+                                                  save_path=torrent_item.get('download_dir'),
+                                                  torrent=torrent_item.get('torrent'))
+                    if not download_id:
+                        # 下载失败
                         fail += 1
+                        logger.error(f"添加下载任务失败：{torrent_item.get('hash')}")
                         continue
 
-                    if not main_announce:
-                        logger.info(f"{torrent_item.get('hash')} 未发现tracker信息，尝试补充tracker信息...")
-                        # 读取fastresume文件
-                        fastresume_file = Path(self._fromtorrentpath) / f"{torrent_item.get('hash')}.fastresume"
-                        if not fastresume_file.exists():
-                            logger.warn(f"fastresume文件不存在：{fastresume_file}")
-                            fail += 1
-                            continue
-                        # 尝试补充trackers
-                        try:
-                            # 解析fastresume文件
-                            fastresume = fastresume_file.read_bytes()
-                            torrent_fastresume = bdecode(fastresume)
-                            # 读取trackers
-                            fastresume_trackers = torrent_fastresume.get('trackers')
-                            if isinstance(fastresume_trackers, list) \
-                                    and len(fastresume_trackers) > 0 \
-                                    and fastresume_trackers[0]:
-                                # 重新赋值
-                                torrent_main['announce'] = fastresume_trackers[0][0]
-                                # 保留其他tracker，避免单一tracker无法连接
-                                if len(fastresume_trackers) > 1 or len(fastresume_trackers[0]) > 1:
-                                    torrent_main['announce-list'] = fastresume_trackers
-                                # 替换种子文件路径
-                                torrent_file = settings.TEMP_PATH / f"{torrent_item.get('hash')}.torrent"
-                                # 编码并保存到临时文件
-                                torrent_file.write_bytes(bencode(torrent_main))
-                        except Exception as err:
-                            logger.error(f"解析fastresume文件 {fastresume_file} 出错：{str(err)}")
-                            fail += 1
-                            continue
-
-                # 发送到另一个下载器中下载：默认暂停、传输下载路径、关闭自动管理模式
-                logger.info(f"添加转移做种任务到下载器 {to_service.name}：{torrent_file}")
-                download_id = self.__download(service=to_service,
-                                              content=torrent_file.read_bytes(),
-                                              save_path=download_dir,
-                                              torrent=torrent_item.get('torrent'))
-                if not download_id:
-                    # 下载失败
-                    fail += 1
-                    logger.error(f"添加下载任务失败：{torrent_file}")
-                    continue
-                else:
                     # 下载成功
-                    logger.info(f"成功添加转移做种任务，种子文件：{torrent_file}")
+                    logger.info(f"成功添加转移做种任务：{torrent_item.get('hash')}")
 
                     # TR会自动校验，QB需要手动校验
                     if downloader_helper.is_downloader("qbittorrent", service=to_service):
@@ -893,10 +885,10 @@ class TorrentTransfer(_PluginBase):
                     else:
                         self.__add_recheck_torrents(to_service, download_id)
 
-                    # 删除源种子，不能删除文件！
+                    # 记录断点，源种子在本批完成后统一删除
+                    checkpoint["done"].add(torrent_item.get('hash'))
                     if self._deletesource:
-                        logger.info(f"删除源下载器任务（不含文件）：{torrent_item.get('hash')} ...")
-                        from_downloader.delete_torrents(delete_file=False, ids=[torrent_item.get('hash')])
+                        checkpoint["pending_delete"].append(torrent_item.get('hash'))
 
                     # 成功计数
                     success += 1
@@ -909,6 +901,22 @@ class TorrentTransfer(_PluginBase):
                                        "delete_source": self._deletesource,
                                        "delete_duplicate": self._deleteduplicate,
                                    })
+                    # 限制添加速率
+                    if self._event.wait(self._add_interval):
+                        stopped = True
+                        break
+
+                # 批量删除源种子并保存断点
+                self.__save_checkpoint(from_downloader, checkpoint)
+                if stopped:
+                    break
+
+            if stopped:
+                logger.info("转移服务停止，已保存断点，下次运行时继续")
+            else:
+                # 全部完成，清除断点
+                self.del_data(key="checkpoint")
+
             # 触发校验任务
             if success > 0 and self._autostart:
                 self.check_recheck()
@@ -924,6 +932,106 @@ class TorrentTransfer(_PluginBase):
             logger.info(f"没有需要转移的种子")
         logger.info("转移做种任务执行完成")
 
+    def __get_all_hashes(self, service: ServiceInfo) -> Optional[set]:
+        """
+        获取下载器中所有种子的hash，获取失败时返回None
+        """
+        torrents, error = service.instance.get_torrents()
+        if error:
+            logger.warn(f"获取下载器 {service.name} 种子列表失败，将逐个查询种子是否存在")
+            return None
+        return {self.__get_hash(torrent, service.type) for torrent in torrents or []}
+
+    def __prepare_torrent(self, torrent_item: dict, from_is_qb: bool) -> Optional[bytes]:
+        """
+        读取种子文件内容，源下载器为QB且种子中没有tracker时，从fastresume文件补充
+        """
+        hash_str = torrent_item.get('hash')
+        # 检查种子文件是否存在
+        torrent_file = Path(self._fromtorrentpath) / f"{hash_str}.torrent"
+        if not torrent_file.exists():
+            logger.error(f"种子文件不存在：{torrent_file}")
+            return None
+        # 读取种子内容
+        content = torrent_file.read_bytes()
+        if not content:
+            logger.warn(f"读取种子文件失败：{torrent_file}")
+            return None
+        if not from_is_qb:
+            return content
+        # 读取trackers
+        try:
+            torrent_main = bdecode(content)
+            main_announce = torrent_main.get('announce')
+        except Exception as err:
+            logger.warn(f"解析种子文件 {torrent_file} 失败：{str(err)}")
+            return None
+        if main_announce:
+            return content
+
+        logger.info(f"{hash_str} 未发现tracker信息，尝试补充tracker信息...")
+        # 读取fastresume文件
+        fastresume_file = Path(self._fromtorrentpath) / f"{hash_str}.fastresume"
+        if not fastresume_file.exists():
+            logger.warn(f"fastresume文件不存在：{fastresume_file}")
+            return None
+        # 尝试补充trackers
+        try:
+            # 解析fastresume文件
+            torrent_fastresume = bdecode(fastresume_file.read_bytes())
+            # 读取trackers
+            fastresume_trackers = torrent_fastresume.get('trackers')
+            if isinstance(fastresume_trackers, list) \
+                    and len(fastresume_trackers) > 0 \
+                    and fastresume_trackers[0]:
+                # 重新赋值
+                torrent_main['announce'] = fastresume_trackers[0][0]
+                # 保留其他tracker，避免单一tracker无法连接
+                if len(fastresume_trackers) > 1 or len(fastresume_trackers[0]) > 1:
+                    torrent_main['announce-list'] = fastresume_trackers
+                return bencode(torrent_main)
+        except Exception as err:
+            logger.error(f"解析fastresume文件 {fastresume_file} 出错：{str(err)}")
+            return None
+        return content
+
+    def __load_checkpoint(self, from_name: str, to_name: str) -> dict:
+        """
+        读取转移断点，源或目的下载器变化时重新开始
+        """
+        checkpoint = self.get_data(key="checkpoint") or {}
+        if checkpoint.get("from") != from_name or checkpoint.get("to") != to_name:
+            checkpoint = {}
+        elif checkpoint.get("done"):
+            logger.info(f"从上次中断处继续转移，已完成 {len(checkpoint.get('done'))} 个种子")
+        return {
+            "from": from_name,
+            "to": to_name,
+            "done": set(checkpoint.get("done") or []),
+            "pending_delete": list(checkpoint.get("pending_delete") or [])
+        }
+
+    def __save_checkpoint(self, from_downloader: Union[Qbittorrent, Transmission], checkpoint: dict):
+        """
+        保存转移断点，并批量删除已转移的源种子（不含文件）
+        """
+        def save():
+            self.save_data(key="checkpoint", value={
+                "from": checkpoint["from"],
+                "to": checkpoint["to"],
+                "done": list(checkpoint["done"]),
+                "pending_delete": checkpoint["pending_delete"]
+            })
+
+        save()
+        if checkpoint["pending_delete"]:
+            logger.info(f"删除源下载器任务（不含文件）：{len(checkpoint['pending_delete'])} 个 ...")
+            if from_downloader.delete_torrents(delete_file=False, ids=checkpoint["pending_delete"]):
+                checkpoint["pending_delete"] = []
+                save()
+            else:
+                logger.error("删除源下载器任务失败，将在下次转移时重试")
+
     def __add_recheck_torrents(self, service: ServiceInfo, download_id: str):
         # 追加校验任务
         logger.info(f"添加校验检查任务：{download_id} ...")
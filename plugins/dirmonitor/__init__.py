@@ -2,7 +2,10 @@ import datetime
 import re
 import shutil
 import threading
+import time
 import traceback
+from concurrent.futures import ThreadPoolExecutor, wait
+from contextlib import contextmanager
 from pathlib import Path
 from typing import List, Tuple, Dict, Any, Optional
 
@@ -33,6 +36,31 @@ from app.utils.system import SystemUtils
 lock = threading.Lock()
 
 
+class KeyedLock:
+    """
+    按键加锁，相同键串行，不同键互不阻塞
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # 键 -> [锁, 引用计数]
+        self._locks: Dict[str, list] = {}
+
+    @contextmanager
+    def acquire(self, key: str):
+        with self._lock:
+            item = self._locks.setdefault(key, [threading.Lock(), 0])
+            item[1] += 1
+        try:
+            with item[0]:
+                yield
+        finally:
+            with self._lock:
+                item[1] -= 1
+                if not item[1]:
+                    self._locks.pop(key, None)
+
+
 class FileMonitorHandler(FileSystemEventHandler):
     """
     目录监控响应类
@@ -98,6 +126,17 @@ class DirMonitor(_PluginBase):
     # 存储源目录转移方式
     _transferconf: Dict[str, Optional[str]] = {}
     _medias = {}
+    # 并发处理文件数
+    _max_workers: int = 4
+    _executor: Optional[ThreadPoolExecutor] = None
+    # 文件锁及媒体锁
+    _file_locks = KeyedLock()
+    _media_locks = KeyedLock()
+    # 识别结果缓存：(父目录, 标题, 年份) -> (识别时间, 媒体信息)
+    _recognize_cache: Dict[tuple, Tuple[float, MediaInfo]] = {}
+    _recognize_locks = KeyedLock()
+    # 识别结果缓存有效期（秒）
+    _recognize_ttl = 600
     # 退出事件
     _event = threading.Event()
 
@@ -124,11 +163,19 @@ class DirMonitor(_PluginBase):
             self._cron = config.get("cron")
             self._size = config.get("size") or 0
             self._scrape = config.get("scrape") or False
+            try:
+                self._max_workers = int(config.get("max_workers") or 4)
+            except ValueError:
+                logger.warn(f"文件处理线程数配置错误：{config.get('max_workers')}，使用默认值 4")
+                self._max_workers = 4
 
         # 停止现有任务
         self.stop_service()
 
         if self._enabled or self._onlyonce:
+            # 文件处理线程池
+            self._executor = ThreadPoolExecutor(max_workers=max(self._max_workers, 1),
+                                                thread_name_prefix="dirmonitor")
             # 定时服务管理器
             self._scheduler = BackgroundScheduler(timezone=settings.TZ)
             # 追加入库消息统一发送服务
@@ -242,7 +289,8 @@ class DirMonitor(_PluginBase):
             "interval": self._interval,
             "cron": self._cron,
             "size": self._size,
-            "scrape": self._scrape
+            "scrape": self._scrape,
+            "max_workers": self._max_workers
         })
 
     @eventmanager.register(EventType.PluginAction)
@@ -267,11 +315,16 @@ class DirMonitor(_PluginBase):
         立即运行一次，全量同步目录中所有文件
         """
         logger.info("开始全量同步监控目录 ...")
+        futures = []
         # 遍历所有监控目录
         for mon_path in self._dirconf.keys():
             # 遍历目录下所有文件
             for file_path in SystemUtils.list_files(Path(mon_path), settings.RMT_MEDIAEXT):
-                self.__handle_file(event_path=str(file_path), mon_path=mon_path)
+                future = self.__submit_file(event_path=str(file_path), mon_path=mon_path)
+                if future:
+                    futures.append(future)
+        if futures:
+            wait(futures)
         logger.info("全量同步监控目录完成！")
 
     def event_handler(self, event, mon_path: str, text: str, event_path: str):
@@ -285,7 +338,47 @@ class DirMonitor(_PluginBase):
         if not event.is_directory:
             # 文件发生变化
             logger.debug("文件%s：%s" % (text, event_path))
-            self.__handle_file(event_path=event_path, mon_path=mon_path)
+            self.__submit_file(event_path=event_path, mon_path=mon_path)
+
+    def __submit_file(self, event_path: str, mon_path: str):
+        """
+        提交文件到线程池处理，线程池未启动时直接处理
+        """
+        if self._executor:
+            try:
+                return self._executor.submit(self.__handle_file, event_path, mon_path)
+            except RuntimeError:
+                # 线程池已关闭
+                return None
+        self.__handle_file(event_path=event_path, mon_path=mon_path)
+        return None
+
+    def __recognize_media(self, file_path: Path, file_meta: MetaInfoPath, download_history) -> Optional[MediaInfo]:
+        """
+        识别媒体信息，同一父目录下标题相同的文件共享识别结果
+        """
+        if download_history and download_history.tmdbid:
+            key = (download_history.type, download_history.tmdbid, download_history.doubanid)
+        else:
+            key = (str(file_path.parent), file_meta.name, file_meta.year, file_meta.type)
+        with self._recognize_locks.acquire(str(key)):
+            now = time.time()
+            cache = self._recognize_cache.get(key)
+            if cache and now - cache[0] < self._recognize_ttl:
+                return cache[1]
+            if download_history and download_history.tmdbid:
+                mediainfo: MediaInfo = self.mediaChain.recognize_media(mtype=MediaType(download_history.type),
+                                                                       tmdbid=download_history.tmdbid,
+                                                                       doubanid=download_history.doubanid)
+            else:
+                mediainfo: MediaInfo = self.mediaChain.recognize_by_meta(file_meta)
+            with lock:
+                # 清理过期的识别结果
+                for expired_key in [k for k, v in self._recognize_cache.items() if now - v[0] >= self._recognize_ttl]:
+                    self._recognize_cache.pop(expired_key, None)
+                if mediainfo:
+                    self._recognize_cache[key] = (now, mediainfo)
+            return mediainfo
 
     def __handle_file(self, event_path: str, mon_path: str):
         """
@@ -297,52 +390,52 @@ class DirMonitor(_PluginBase):
         try:
             if not file_path.exists():
                 return
-            # 全程加锁
-            with lock:
-                transfer_history = self.transferhis.get_by_src(event_path)
-                if transfer_history:
-                    logger.debug("文件已处理过：%s" % event_path)
-                    return
-
-                # 回收站及隐藏的文件不处理
-                if event_path.find('/@Recycle/') != -1 \
-                        or event_path.find('/#recycle/') != -1 \
-                        or event_path.find('/.') != -1 \
-                        or event_path.find('/@eaDir') != -1:
-                    logger.debug(f"{event_path} 是回收站或隐藏的文件")
-                    return
+            transfer_history = self.transferhis.get_by_src(event_path)
+            if transfer_history:
+                logger.debug("文件已处理过：%s" % event_path)
+                return
 
-                # 命中过滤关键字不处理
-                if self._exclude_keywords:
-                    for keyword in self._exclude_keywords.split("\n"):
-                        if keyword and re.findall(keyword, event_path):
-                            logger.info(f"{event_path} 命中过滤关键字 {keyword}，不处理")
-                            return
+            # 回收站及隐藏的文件不处理
+            if event_path.find('/@Recycle/') != -1 \
+                    or event_path.find('/#recycle/') != -1 \
+                    or event_path.find('/.') != -1 \
+                    or event_path.find('/@eaDir') != -1:
+                logger.debug(f"{event_path} 是回收站或隐藏的文件")
+                return
 
-                # 整理屏蔽词不处理
-                transfer_exclude_words = self.systemconfig.get(SystemConfigKey.TransferExcludeWords)
-                if transfer_exclude_words:
-                    for keyword in transfer_exclude_words:
-                        if not keyword:
-                            continue
-                        if keyword and re.search(r"%s" % keyword, event_path, re.IGNORECASE):
-                            logger.info(f"{event_path} 命中整理屏蔽词 {keyword}，不处理")
-                            return
+            # 命中过滤关键字不处理
+            if self._exclude_keywords:
+                for keyword in self._exclude_keywords.split("\n"):
+                    if keyword and re.findall(keyword, event_path):
+                        logger.info(f"{event_path} 命中过滤关键字 {keyword}，不处理")
+                        return
 
-                # 不是媒体文件不处理
-                if file_path.suffix.casefold() not in map(str.casefold, settings.RMT_MEDIAEXT):
-                    logger.debug(f"{event_path} 不是媒体文件")
-                    return
+            # 整理屏蔽词不处理
+            transfer_exclude_words = self.systemconfig.get(SystemConfigKey.TransferExcludeWords)
+            if transfer_exclude_words:
+                for keyword in transfer_exclude_words:
+                    if not keyword:
+                        continue
+                    if keyword and re.search(r"%s" % keyword, event_path, re.IGNORECASE):
+                        logger.info(f"{event_path} 命中整理屏蔽词 {keyword}，不处理")
+                        return
 
-                # 判断是不是蓝光目录
-                bluray_flag = False
-                if re.search(r"BDMV[/\\]STREAM", event_path, re.IGNORECASE):
-                    bluray_flag = True
-                    # 截取BDMV前面的路径
-                    blurray_dir = event_path[:event_path.find("BDMV")]
-                    file_path = Path(blurray_dir)
-                    logger.info(f"{event_path} 是蓝光目录，更正文件路径为：{str(file_path)}")
+            # 不是媒体文件不处理
+            if file_path.suffix.casefold() not in map(str.casefold, settings.RMT_MEDIAEXT):
+                logger.debug(f"{event_path} 不是媒体文件")
+                return
 
+            # 判断是不是蓝光目录
+            bluray_flag = False
+            if re.search(r"BDMV[/\\]STREAM", event_path, re.IGNORECASE):
+                bluray_flag = True
+                # 截取BDMV前面的路径
+                blurray_dir = event_path[:event_path.find("BDMV")]
+                file_path = Path(blurray_dir)
+                logger.info(f"{event_path} 是蓝光目录，更正文件路径为：{str(file_path)}")
+
+            # 同一文件（或蓝光目录）同时只由一个线程处理
+            with self._file_locks.acquire(str(file_path)):
                 # 查询历史记录，已转移的不处理
                 if self.transferhis.get_by_src(str(file_path)):
                     logger.info(f"{file_path} 已整理过")
@@ -376,13 +469,10 @@ class DirMonitor(_PluginBase):
                     if download_file:
                         download_history = self.downloadhis.get_by_hash(download_file.download_hash)
 
-                # 识别媒体信息
-                if download_history and download_history.tmdbid:
-                    mediainfo: MediaInfo = self.mediaChain.recognize_media(mtype=MediaType(download_history.type),
-                                                                           tmdbid=download_history.tmdbid,
-                                                                           doubanid=download_history.doubanid)
-                else:
-                    mediainfo: MediaInfo = self.mediaChain.recognize_by_meta(file_meta)
+                # 识别媒体信息，同目录同标题的文件共享识别结果
+                mediainfo: MediaInfo = self.__recognize_media(file_path=file_path,
+                                                              file_meta=file_meta,
+                                                              download_history=download_history)
                 if not mediainfo:
                     logger.warn(f'未识别到媒体信息，标题：{file_meta.name}')
                     # 新增转移成功历史记录
@@ -422,24 +512,39 @@ class DirMonitor(_PluginBase):
                 if download_history:
                     download_hash = download_history.download_hash
 
-                # 转移
-                transferinfo: TransferInfo = self.chain.transfer(mediainfo=mediainfo,
-                                                                 path=file_path,
-                                                                 transfer_type=transfer_type,
-                                                                 target=target,
-                                                                 meta=file_meta,
-                                                                 episodes_info=episodes_info)
+                # 同一媒体同一季的转移及刮削串行执行，不同媒体之间并行
+                with self._media_locks.acquire(f"{mediainfo.title_year} {file_meta.season}"):
+                    # 转移
+                    transferinfo: TransferInfo = self.chain.transfer(mediainfo=mediainfo,
+                                                                     path=file_path,
+                                                                     transfer_type=transfer_type,
+                                                                     target=target,
+                                                                     meta=file_meta,
+                                                                     episodes_info=episodes_info)
+
+                    if not transferinfo:
+                        logger.error("文件转移模块运行失败")
+                        return
 
-                if not transferinfo:
-                    logger.error("文件转移模块运行失败")
-                    return
+                    if not transferinfo.success:
+                        # 判断是否转移后文件已存在，补充转移成功历史记录
+                        if transferinfo.target_path and transferinfo.target_path.exists():
+                            logger.info(f"{file_path.name} 目标文件已存在，补充转移成功历史记录")
+                            # 补充转移成功历史记录
+                            self.transferhis.add_success(
+                                src_path=file_path,
+                                mode=transfer_type,
+                                download_hash=download_hash,
+                                meta=file_meta,
+                                mediainfo=mediainfo,
+                                transferinfo=transferinfo
+                            )
+                            return
 
-                if not transferinfo.success:
-                    # 判断是否转移后文件已存在，补充转移成功历史记录
-                    if transferinfo.target_path and transferinfo.target_path.exists():
-                        logger.info(f"{file_path.name} 目标文件已存在，补充转移成功历史记录")
-                        # 补充转移成功历史记录
-                        self.transferhis.add_success(
+                        # 转移失败
+                        logger.warn(f"{file_path.name} 入库失败：{transferinfo.message}")
+                        # 新增转移失败历史记录
+                        self.transferhis.add_fail(
                             src_path=file_path,
                             mode=transfer_type,
                             download_hash=download_hash,
@@ -447,12 +552,17 @@ class DirMonitor(_PluginBase):
                             mediainfo=mediainfo,
                             transferinfo=transferinfo
                         )
+                        if self._notify:
+                            self.post_message(
+                                mtype=NotificationType.Manual,
+                                title=f"{mediainfo.title_year}{file_meta.season_episode} 入库失败！",
+                                text=f"原因：{transferinfo.message or '未知'}",
+                                image=mediainfo.get_message_image()
+                            )
                         return
 
-                    # 转移失败
-                    logger.warn(f"{file_path.name} 入库失败：{transferinfo.message}")
-                    # 新增转移失败历史记录
-                    self.transferhis.add_fail(
+                    # 新增转移成功历史记录
+                    self.transferhis.add_success(
                         src_path=file_path,
                         mode=transfer_type,
                         download_hash=download_hash,
@@ -460,107 +570,90 @@ class DirMonitor(_PluginBase):
                         mediainfo=mediainfo,
                         transferinfo=transferinfo
                     )
-                    if self._notify:
-                        self.post_message(
-                            mtype=NotificationType.Manual,
-                            title=f"{mediainfo.title_year}{file_meta.season_episode} 入库失败！",
-                            text=f"原因：{transferinfo.message or '未知'}",
-                            image=mediainfo.get_message_image()
-                        )
-                    return
 
-                # 新增转移成功历史记录
-                self.transferhis.add_success(
-                    src_path=file_path,
-                    mode=transfer_type,
-                    download_hash=download_hash,
-                    meta=file_meta,
-                    mediainfo=mediainfo,
-                    transferinfo=transferinfo
-                )
-
-                # 刮削单个文件
-                if self._scrape:
-                    self.chain.scrape_metadata(path=transferinfo.target_path,
-                                               mediainfo=mediainfo,
-                                               transfer_type=transfer_type)
-
-                """
-                {
-                    "title_year season": {
-                        "files": [
-                            {
-                                "path":,
-                                "mediainfo":,
-                                "file_meta":,
-                                "transferinfo":
-                            }
-                        ],
-                        "time": "2023-08-24 23:23:23.332"
+                    # 刮削单个文件
+                    if self._scrape:
+                        self.chain.scrape_metadata(path=transferinfo.target_path,
+                                                   mediainfo=mediainfo,
+                                                   transfer_type=transfer_type)
+
+                    """
+                    {
+                        "title_year season": {
+                            "files": [
+                                {
+                                    "path":,
+                                    "mediainfo":,
+                                    "file_meta":,
+                                    "transferinfo":
+                                }
+                            ],
+                            "time": "2023-08-24 23:23:23.332"
+                        }
                     }
-                }
-                """
-                # 发送消息汇总
-                media_list = self._medias.get(mediainfo.title_year + " " + file_meta.season) or {}
-                if media_list:
-                    media_files = media_list.get("files") or []
-                    if media_files:
-                        file_exists = False
-                        for file in media_files:
-                            if str(file_path) == file.get("path"):
-                                file_exists = True
-                                break
-                        if not file_exists:
-                            media_files.append({
-                                "path": str(file_path),
-                                "mediainfo": mediainfo,
-                                "file_meta": file_meta,
-                                "transferinfo": transferinfo
-                            })
-                    else:
-                        media_files = [
-                            {
-                                "path": str(file_path),
-                                "mediainfo": mediainfo,
-                                "file_meta": file_meta,
-                                "transferinfo": transferinfo
+                    """
+                    # 发送消息汇总
+                    with lock:
+                        media_list = self._medias.get(mediainfo.title_year + " " + file_meta.season) or {}
+                        if media_list:
+                            media_files = media_list.get("files") or []
+                            if media_files:
+                                file_exists = False
+                                for file in media_files:
+                                    if str(file_path) == file.get("path"):
+                                        file_exists = True
+                                        break
+                                if not file_exists:
+                                    media_files.append({
+                                        "path": str(file_path),
+                                        "mediainfo": mediainfo,
+                                        "file_meta": file_meta,
+                                        "transferinfo": transferinfo
+                                    })
+                            else:
+                                media_files = [
+                                    {
+                                        "path": str(file_path),
+                                        "mediainfo": mediainfo,
+                                        "file_meta": file_meta,
+                                        "transferinfo": transferinfo
+                                    }
+                                ]
+                            media_list = {
+                                "files": media_files,
+                                "time": datetime.datetime.now()
                             }
-                        ]
-                    media_list = {
-                        "files": media_files,
-                        "time": datetime.datetime.now()
-                    }
-                else:
-                    media_list = {
-                        "files": [
-                            {
-                                "path": str(file_path),
-                                "mediainfo": mediainfo,
-                                "file_meta": file_meta,
-                                "transferinfo": transferinfo
+                        else:
+                            media_list = {
+                                "files": [
+                                    {
+                                        "path": str(file_path),
+                                        "mediainfo": mediainfo,
+                                        "file_meta": file_meta,
+                                        "transferinfo": transferinfo
+                                    }
+                                ],
+                                "time": datetime.datetime.now()
                             }
-                        ],
-                        "time": datetime.datetime.now()
-                    }
-                self._medias[mediainfo.title_year + " " + file_meta.season] = media_list
-
-                # 广播事件
-                self.eventmanager.send_event(EventType.TransferComplete, {
-                    'meta': file_meta,
-                    'mediainfo': mediainfo,
-                    'transferinfo': transferinfo
-                })
-
-                # 移动模式删除空目录
-                if transfer_type == "move":
-                    for file_dir in file_path.parents:
-                        if len(str(file_dir)) <= len(str(Path(mon_path))):
-                            # 重要，删除到监控目录为止
-                            break
-                        files = SystemUtils.list_files(file_dir, settings.RMT_MEDIAEXT + settings.DOWNLOAD_TMPEXT)
-                        if not files:
-                            logger.warn(f"移动模式，删除空目录：{file_dir}")
-                            shutil.rmtree(file_dir, ignore_errors=True)
+                        self._medias[mediainfo.title_year + " " + file_meta.season] = media_list
+
+                    # 广播事件
+                    self.eventmanager.send_event(EventType.TransferComplete, {
+                        'meta': file_meta,
+                        'mediainfo': mediainfo,
+                        'transferinfo': transferinfo
+                    })
+
+                    # 移动模式删除空目录
+                    if transfer_type == "move":
+                        for file_dir in file_path.parents:
+                            if len(str(file_dir)) <= len(str(Path(mon_path))):
+                                # 重要，删除到监控目录为止
+                                break
+                            files = SystemUtils.list_files(file_dir, settings.RMT_MEDIAEXT + settings.DOWNLOAD_TMPEXT)
+                            if not files:
+                                logger.warn(f"移动模式，删除空目录：{file_dir}")
+                                shutil.rmtree(file_dir, ignore_errors=True)
 
         except Exception as e:
             logger.error("目录监控发生错误：%s - %s" % (str(e), traceback.format_exc()))
@@ -626,7 +719,8 @@ class DirMonitor(_PluginBase):
                                                              transferinfo=transferinfo,
                                                              season_episode=season_episode)
                 # 发送完消息，移出key
-                del self._medias[medis_title_year_season]
+                with lock:
+                    self._medias.pop(medis_title_year_season, None)
                 continue
 
     def get_state(self) -> bool:
@@ -818,7 +912,7 @@ class DirMonitor(_PluginBase):
                                 'component': 'VCol',
                                 'props': {
                                     'cols': 12,
-                                    'md': 4
+                                    'md': 3
                                 },
                                 'content': [
                                     {
@@ -835,7 +929,7 @@ class DirMonitor(_PluginBase):
                                 'component': 'VCol',
                                 'props': {
                                     'cols': 12,
-                                    'md': 4
+                                    'md': 3
                                 },
                                 'content': [
                                     {
@@ -852,7 +946,7 @@ class DirMonitor(_PluginBase):
                                 'component': 'VCol',
                                 'props': {
                                     'cols': 12,
-                                    'md': 4
+                                    'md': 3
                                 },
                                 'content': [
                                     {
@@ -863,6 +957,23 @@ class DirMonitor(_PluginBase):
                                         }
                                     }
                                 ]
+                            },
+                            {
+                                'component': 'VCol',
+                                'props': {
+                                    'cols': 12,
+                                    'md': 3
+                                },
+                                'content': [
+                                    {
+                                        'component': 'VTextField',
+                                        'props': {
+                                            'model': 'max_workers',
+                                            'label': '并发处理数',
+                                            'placeholder': '4'
+                                        }
+                                    }
+                                ]
                             }
                         ]
                     },
@@ -990,7 +1101,8 @@ class DirMonitor(_PluginBase):
             "interval": 10,
             "cron": "",
             "size": 0,
-            "scrape": True
+            "scrape": True,
+            "max_workers": 4
         }
 
     def get_page(self) -> List[dict]:
@@ -1008,6 +1120,9 @@ class DirMonitor(_PluginBase):
                 except Exception as e:
                     print(str(e))
         self._observer = []
+        if self._executor:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
         if self._scheduler:
             self._scheduler.remove_all_jobs()
             if self._scheduler.running:
@@ -1,9 +1,12 @@
+import json
 import os
+import sqlite3
 import threading
 import time
 import traceback
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 from pathlib import Path
-from typing import List, Tuple, Dict, Any
+from typing import List, Tuple, Dict, Any, Set, Optional
 
 from watchdog.events import FileSystemEventHandler
 from watchdog.observers import Observer
@@ -16,6 +19,9 @@ from app.schemas.types import EventType
 
 state_lock = threading.Lock()
 
+# 目录快照：(目录修改时间, {文件名: inode}, [子目录名])
+DirSnapshot = Tuple[int, Dict[str, int], List[str]]
+
 
 class FileMonitorHandler(FileSystemEventHandler):
     """
@@ -42,7 +48,7 @@ class FileMonitorHandler(FileSystemEventHandler):
         # 新增文件记录
         with state_lock:
             try:
-                self.sync.state_set[str(file_path)] = file_path.stat().st_ino
+                self.sync.add_state(str(file_path), file_path.stat().st_ino)
             except Exception as e:
                 logger.error(f"新增文件记录失败：{str(e)}")
 
@@ -60,7 +66,8 @@ class FileMonitorHandler(FileSystemEventHandler):
                     return
         # 新增文件记录
         with state_lock:
-            self.sync.state_set[str(file_path)] = file_path.stat().st_ino
+            self.sync.remove_state(str(Path(event.src_path)))
+            self.sync.add_state(str(file_path), file_path.stat().st_ino)
 
     def on_deleted(self, event):
         file_path = Path(event.src_path)
@@ -86,28 +93,107 @@ class FileMonitorHandler(FileSystemEventHandler):
         self.sync.handle_deleted(file_path)
 
 
-def updateState(monitor_dirs: List[str]):
+class StateCache:
     """
-    更新监控目录的文件列表
+    监控目录快照缓存，重启后仅需重新扫描修改时间发生变化的目录
+    """
+
+    def __init__(self, db_path: str):
+        self._db_path = db_path
+        with self.__connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS dir_state ("
+                "path TEXT PRIMARY KEY, mtime INTEGER, files TEXT, subdirs TEXT)"
+            )
+
+    def __connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self._db_path)
+
+    def load(self) -> Dict[str, DirSnapshot]:
+        """
+        读取全部目录快照
+        """
+        with self.__connect() as conn:
+            rows = conn.execute("SELECT path, mtime, files, subdirs FROM dir_state").fetchall()
+        return {path: (mtime, json.loads(files), json.loads(subdirs)) for path, mtime, files, subdirs in rows}
+
+    def save(self, snapshots: Dict[str, DirSnapshot]):
+        """
+        以当前扫描结果替换全部目录快照
+        """
+        rows = [(path, mtime, json.dumps(files), json.dumps(subdirs))
+                for path, (mtime, files, subdirs) in snapshots.items()]
+        with self.__connect() as conn:
+            conn.execute("DELETE FROM dir_state")
+            conn.executemany("INSERT INTO dir_state VALUES (?, ?, ?, ?)", rows)
+
+
+def scan_dir(path: str, snapshot: Optional[DirSnapshot] = None) -> Tuple[str, DirSnapshot]:
+    """
+    扫描单个目录的文件inode及子目录，目录修改时间未变化时直接复用快照
+    """
+    mtime = os.stat(path).st_mtime_ns
+    if snapshot and snapshot[0] == mtime:
+        return path, snapshot
+    files = {}
+    subdirs = []
+    with os.scandir(path) as entries:
+        for entry in entries:
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    subdirs.append(entry.name)
+                elif entry.is_symlink():
+                    # 符号链接记录目标文件的inode
+                    if entry.is_file():
+                        files[entry.name] = entry.stat().st_ino
+                elif entry.is_file(follow_symlinks=False):
+                    files[entry.name] = entry.inode()
+            except OSError:
+                continue
+    return path, (mtime, files, subdirs)
+
+
+def updateState(monitor_dirs: List[str],
+                snapshots: Dict[str, DirSnapshot] = None,
+                workers: int = 8) -> Tuple[Dict[str, int], Dict[str, DirSnapshot]]:
+    """
+    更新监控目录的文件列表，返回文件列表及新的目录快照
     """
     # 记录开始时间
     start_time = time.time()
+    snapshots = snapshots or {}
     state_set = {}
-    for mon_path in monitor_dirs:
-        for root, dirs, files in os.walk(mon_path):
-            for file in files:
-                file = Path(root) / file
-                if not file.exists():
+    new_snapshots = {}
+    reused = 0
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        pending = {executor.submit(scan_dir, mon_path, snapshots.get(mon_path))
+                   for mon_path in {str(Path(d)) for d in monitor_dirs if d}}
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                try:
+                    path, snapshot = future.result()
+                except OSError as e:
+                    logger.warn(f"扫描目录失败：{str(e)}")
                     continue
-                # 记录文件inode
-                state_set[str(file)] = file.stat().st_ino
+                if snapshot is snapshots.get(path):
+                    reused += 1
+                new_snapshots[path] = snapshot
+                _, files, subdirs = snapshot
+                for name, inode in files.items():
+                    # 记录文件inode
+                    state_set[os.path.join(path, name)] = inode
+                for name in subdirs:
+                    subdir = os.path.join(path, name)
+                    pending.add(executor.submit(scan_dir, subdir, snapshots.get(subdir)))
     # 记录结束时间
     end_time = time.time()
     # 计算耗时
     elapsed_time = end_time - start_time
-    logger.info(f"更新文件列表完成，共计{len(state_set)}个文件，耗时：{elapsed_time}秒")
+    logger.info(f"更新文件列表完成，共计{len(state_set)}个文件，{len(new_snapshots)}个目录"
+                f"（{reused}个未变化），耗时：{elapsed_time}秒")
 
-    return state_set
+    return state_set, new_snapshots
 
 
 class RemoveLink(_PluginBase):
@@ -140,8 +226,12 @@ class RemoveLink(_PluginBase):
     _delete_torrents = False
     _delete_history = False
     _observer = []
+    # 扫描目录的线程数
+    _scan_workers = 8
     # 监控目录的文件列表
     state_set: Dict[str, int] = {}
+    # inode 到文件路径的反向索引
+    inode_index: Dict[int, Set[str]] = {}
 
     def init_plugin(self, config: dict = None):
         logger.info(f"Hello, RemoveLink! config {config}")
@@ -182,8 +272,23 @@ class RemoveLink(_PluginBase):
                     logger.error(f"{mon_path} 启动目录监控失败：{err_msg}")
                     self.systemmessage.put(f"{mon_path} 启动目录监控失败：{err_msg}", title="清理硬链接")
             # 更新监控集合
+            state_cache = None
+            snapshots = {}
+            try:
+                state_cache = StateCache(os.path.join(self.get_data_path(), "state_cache.db"))
+                snapshots = state_cache.load()
+            except Exception as e:
+                logger.warn(f"读取目录快照失败：{str(e)}")
             with state_lock:
-                self.state_set = updateState(monitor_dirs)
+                self.state_set, snapshots = updateState(monitor_dirs, snapshots, self._scan_workers)
+                self.inode_index = {}
+                for path, inode in self.state_set.items():
+                    self.inode_index.setdefault(inode, set()).add(path)
+            if state_cache:
+                try:
+                    state_cache.save(snapshots)
+                except Exception as e:
+                    logger.warn(f"保存目录快照失败：{str(e)}")
 
     def __update_config(self):
         """
@@ -540,6 +645,28 @@ class RemoveLink(_PluginBase):
             # 更新路径为父目录，准备下一轮检查
             path = parent_path
 
+    def add_state(self, path: str, inode: int):
+        """
+        新增文件记录，调用方需持有 state_lock
+        """
+        self.remove_state(path)
+        self.state_set[path] = inode
+        self.inode_index.setdefault(inode, set()).add(path)
+
+    def remove_state(self, path: str) -> Optional[int]:
+        """
+        移除文件记录并返回其inode，调用方需持有 state_lock
+        """
+        inode = self.state_set.pop(path, None)
+        if inode is None:
+            return None
+        paths = self.inode_index.get(inode)
+        if paths is not None:
+            paths.discard(path)
+            if not paths:
+                self.inode_index.pop(inode)
+        return inode
+
     def handle_deleted(self, file_path: Path):
         """
         处理删除事件
@@ -561,34 +688,33 @@ class RemoveLink(_PluginBase):
                 logger.info(f"文件 {file_path} 未在监控列表中，不处理")
                 return
             else:
-                self.state_set.pop(str(file_path))
+                self.remove_state(str(file_path))
             try:
-                # 在current_set中查找与deleted_inode有相同inode的文件并删除
-                for path, inode in self.state_set.copy().items():
-                    if inode == deleted_inode:
-                        file = Path(path)
-                        if self.__is_excluded(file):
-                            logger.info(f"文件 {file} 在不删除目录中，不处理")
-                            continue
-                        # 删除硬链接文件
-                        logger.info(f"删除硬链接文件：{path}， inode: {inode}")
-                        file.unlink()
-                        # 清理刮削文件
-                        self.delete_scrap_infos(file_path)
-                        if self._delete_torrents:
-                            # 发送事件
-                            eventmanager.send_event(
-                                EventType.DownloadFileDeleted, {"src": str(file_path)}
-                            )
-                        # 删除历史记录
-                        self.delete_history(str(file_path))
-                        if self._notify:
-                            self.post_message(
-                                mtype=NotificationType.SiteMessage,
-                                title=f"【清理硬链接】",
-                                text=f"监控到删除源文件：[{file_path}]\n"
-                                     f"同步删除硬链接文件：[{path}]",
-                            )
+                # 通过inode反向索引查找与deleted_inode有相同inode的文件并删除
+                for path in list(self.inode_index.get(deleted_inode, ())):
+                    file = Path(path)
+                    if self.__is_excluded(file):
+                        logger.info(f"文件 {file} 在不删除目录中，不处理")
+                        continue
+                    # 删除硬链接文件
+                    logger.info(f"删除硬链接文件：{path}， inode: {deleted_inode}")
+                    file.unlink()
+                    # 清理刮削文件
+                    self.delete_scrap_infos(file_path)
+                    if self._delete_torrents:
+                        # 发送事件
+                        eventmanager.send_event(
+                            EventType.DownloadFileDeleted, {"src": str(file_path)}
+                        )
+                    # 删除历史记录
+                    self.delete_history(str(file_path))
+                    if self._notify:
+                        self.post_message(
+                            mtype=NotificationType.SiteMessage,
+                            title=f"【清理硬链接】",
+                            text=f"监控到删除源文件：[{file_path}]\n"
+                                 f"同步删除硬链接文件：[{path}]",
+                        )
             except Exception as e:
                 logger.error(
                     "删除硬链接文件发生错误：%s - %s" % (str(e), traceback.format_exc())
@@ -0,0 +1,16 @@
+import logging
+import sys
+import types
+
+try:
+    import app.log  # noqa: F401
+except ImportError:
+    # 插件仓库不包含MoviePilot主程序，以标准日志替代app.log
+    _logger = logging.getLogger("moviepilot-plugins")
+    _logger.warn = _logger.warning
+    _app = sys.modules.setdefault("app", types.ModuleType("app"))
+    _app.__path__ = []
+    _log = types.ModuleType("app.log")
+    _log.logger = _logger
+    _app.log = _log
+    sys.modules["app.log"] = _log
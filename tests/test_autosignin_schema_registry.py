@@ -0,0 +1,70 @@
+import importlib.util
+from pathlib import Path
+
+import pytest
+
+_plugin_path = Path(__file__).resolve().parents[1] / "plugins.v2" / "autosignin"
+_spec = importlib.util.spec_from_file_location("autosignin_schema_registry", _plugin_path / "schema_registry.py")
+schema_registry = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(schema_registry)
+
+SITE_URLS = {
+    "52pt.site": "52pt",
+    "pt.btschool.club": "btschool",
+    "ptchdbits.co": "chdbits",
+    "haidan.video": "haidan",
+    "club.hares.top": "hares",
+    "hdarea.club": "hdarea",
+    "hdchina.org": "hdchina",
+    "hdcity.city": "hdcity",
+    "hdsky.me": "hdsky",
+    "pt.hdupt.com": "hdupt",
+    "m-team": "mteam",
+    "v6.nexushd.org": "nexushd",
+    "open.cd": "opencd",
+    "pterclub.com": "pterclub",
+    "pttime.org": "pttime",
+    "tjupt.org": "tjupt",
+    "totheglory.im": "ttg",
+    "u2.dmhy.org": "u2",
+    "yemapt.org": "yema",
+    "zhuque.in": "zhuque",
+}
+
+
+@pytest.fixture(scope="module")
+def registry():
+    return schema_registry.SiteSchemaRegistry(package="sites", path=_plugin_path / "sites")
+
+
+def _candidates(registry, url):
+    return registry._SiteSchemaRegistry__candidates(url)
+
+
+def test_all_bundled_sites_indexed(registry):
+    assert sorted(name for names in registry._index.values() for name in names) == sorted(SITE_URLS.values())
+    assert registry._dynamic == []
+
+
+@pytest.mark.parametrize("site_url, module", SITE_URLS.items())
+def test_site_url_routing(registry, site_url, module):
+    if site_url == "m-team":
+        site_url = "kp.m-team.cc"
+    for url in (f"https://{site_url}/", f"http://www.{site_url}", f"https://{site_url}:443/index.php"):
+        assert _candidates(registry, url)[0] == module
+
+
+@pytest.mark.parametrize("url, module", [
+    ("https://kp.m-team.cc/", "mteam"),
+    ("https://api.m-team.io/api", "mteam"),
+    ("https://api.yemapt.org/", "yema"),
+    ("https://yemapt.org:443/", "yema"),
+    ("https://www.pt.btschool.club/index.php", "btschool"),
+    ("https://cdn.hdsky.me:8443/", "hdsky"),
+])
+def test_special_case_routing(registry, url, module):
+    assert _candidates(registry, url)[0] == module
+
+
+def test_unknown_site(registry):
+    assert _candidates(registry, "https://example.com/") == []
@@ -0,0 +1,189 @@
+import importlib.util
+import random
+import time
+from pathlib import Path
+from types import SimpleNamespace
+
+import pytest
+
+# 刷流插件依赖MoviePilot主程序
+pytest.importorskip("app.chain.torrents")
+
+_spec = importlib.util.spec_from_file_location(
+    "brushflow", Path(__file__).resolve().parents[1] / "plugins.v2" / "brushflow" / "__init__.py")
+brushflow = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(brushflow)
+
+
+class FakeDownloader:
+    """
+    模拟qbittorrent下载器，只提供check()用到的接口
+    """
+
+    def __init__(self, torrents):
+        self.torrents = torrents
+        self.deleted = []
+        self.qbc = None
+
+    def get_torrents(self, ids=None, tags=None):
+        return self.torrents, False
+
+    def get_completed_torrents(self, ids=None, tags=None):
+        ids = set(ids or [])
+        return [torrent for torrent in self.torrents if torrent["hash"] in ids and torrent["progress"] >= 1]
+
+    def delete_torrents(self, delete_file, ids):
+        self.deleted.extend(ids)
+        return True
+
+    @staticmethod
+    def is_inactive():
+        return False
+
+
+class FakeDownloaderHelper:
+
+    @staticmethod
+    def is_downloader(service_type, service=None, name=None):
+        return service is not None and service.type == service_type
+
+
+class BenchBrushFlow(brushflow.BrushFlow):
+    """
+    跳过插件初始化，下载器及数据存储使用内存实现
+    """
+
+    def __init__(self, config: dict, downloader: FakeDownloader, torrent_tasks: dict):
+        self._brush_config = brushflow.BrushConfig(config=config)
+        self._service = SimpleNamespace(name="bench", type="qbittorrent", instance=downloader)
+        self._data = {"torrents": torrent_tasks}
+
+    @property
+    def service_info(self):
+        return self._service
+
+    def get_data(self, key=None, plugin_id=None):
+        return self._data.get(key)
+
+    def save_data(self, key, value, plugin_id=None):
+        self._data[key] = value
+
+    def post_message(self, *args, **kwargs):
+        pass
+
+
+def _make_config(torrent_tasks: dict) -> dict:
+    """
+    动态删种阈值按总体积设置，条件删种后仅需少量按做种时间删除
+    """
+    total_gb = sum(task["size"] for task in torrent_tasks.values()) / 1024 ** 3
+    return {
+        "enabled": True,
+        "notify": False,
+        "downloader": "bench",
+        "proxy_delete": True,
+        "delete_size_range": f"{int(total_gb * 0.95)}-{int(total_gb * 0.97)}",
+        "download_time": 1,
+        "seed_time": 48,
+        "auto_archive_days": 0,
+    }
+
+
+def _make_torrents(count: int, seed: int = 0):
+    """
+    生成刷流种子及任务记录，约2%下载超时，约2%做种时间超过48小时
+    """
+    rng = random.Random(seed)
+    now = int(time.time())
+    torrents, torrent_tasks = [], {}
+    for i in range(count):
+        torrent_hash = f"{i:040x}"
+        size = rng.randint(1, 20) * 1024 ** 3
+        roll = rng.random()
+        if roll < 0.02:
+            # 未完成且下载超时
+            added_on, completion_on, downloaded, progress = now - 2 * 3600, 0, size // 2, 0.5
+        elif roll < 0.04:
+            added_on, completion_on, downloaded, progress = now - 72 * 3600, now - 60 * 3600, size, 1
+        else:
+            added_on, completion_on, downloaded, progress = now - 1800, now - 600, size, 1
+        torrents.append({
+            "hash": torrent_hash, "name": f"Torrent.{i}", "tags": "刷流", "added_on": added_on,
+            "completion_on": completion_on, "last_activity": now - 60, "ratio": rng.random() * 2,
+            "uploaded": rng.randint(0, size), "downloaded": downloaded, "total_size": size,
+            "progress": progress, "tracker": "https://tracker.example.com/announce",
+        })
+        torrent_tasks[torrent_hash] = {
+            "site_name": f"site{i % 20}", "title": f"Torrent.{i}", "description": "", "size": size,
+            "hit_and_run": rng.random() < 0.05, "deleted": False,
+        }
+    return torrents, torrent_tasks
+
+
+def _legacy_condition_deletes(plugin, torrents, torrent_tasks):
+    """
+    改造前的动态删种计算：每个阶段重新获取种子Hash和信息，以列表判断已删除种子
+    """
+    get_hash = plugin._BrushFlow__get_hash
+    get_info = plugin._BrushFlow__get_torrent_info
+    # 改造前状态更新和删种检查各自获取一遍种子信息
+    for torrent in torrents:
+        get_hash(torrent)
+        get_info(torrent)
+    torrent_info_map = {get_hash(torrent): get_info(torrent) for torrent in torrents}
+
+    pre_delete_hashes = []
+    for torrent in torrents:
+        torrent_hash = get_hash(torrent)
+        torrent_task = torrent_tasks[torrent_hash]
+        if torrent_task.get("hit_and_run"):
+            continue
+        should_delete, _ = plugin._BrushFlow__evaluate_proxy_pre_conditions_for_delete(
+            site_name=torrent_task["site_name"], torrent_info=get_info(torrent), torrent_task=torrent_task)
+        if should_delete:
+            pre_delete_hashes.append(torrent_hash)
+    sum(torrent_info_map[get_hash(torrent)].get("total_size", 0)
+        for torrent in torrents if get_hash(torrent) in pre_delete_hashes)
+    torrents = [torrent for torrent in torrents if get_hash(torrent) not in pre_delete_hashes]
+
+    proxy_delete_hashes = []
+    for torrent in torrents:
+        torrent_hash = get_hash(torrent)
+        torrent_task = torrent_tasks[torrent_hash]
+        should_delete, _ = plugin._BrushFlow__evaluate_conditions_for_delete(
+            site_name=torrent_task["site_name"], torrent_info=get_info(torrent), torrent_task=torrent_task)
+        if should_delete:
+            proxy_delete_hashes.append(torrent_hash)
+    sum(torrent_info_map[get_hash(torrent)].get("total_size", 0)
+        for torrent in torrents if get_hash(torrent) in proxy_delete_hashes)
+    return set(pre_delete_hashes) | set(proxy_delete_hashes)
+
+
+@pytest.fixture(autouse=True)
+def _downloader_helper(monkeypatch):
+    monkeypatch.setattr(brushflow, "DownloaderHelper", FakeDownloaderHelper)
+
+
+@pytest.mark.parametrize("count", [10000, 50000])
+def test_check_benchmark(count):
+    torrents, torrent_tasks = _make_torrents(count)
+    config = _make_config(torrent_tasks)
+
+    legacy_plugin = BenchBrushFlow(config, FakeDownloader(torrents), dict(torrent_tasks))
+    start = time.perf_counter()
+    legacy_deletes = _legacy_condition_deletes(legacy_plugin, torrents, torrent_tasks)
+    legacy_elapsed = time.perf_counter() - start
+
+    downloader = FakeDownloader(torrents)
+    plugin = BenchBrushFlow(config, downloader, {k: dict(v) for k, v in torrent_tasks.items()})
+    start = time.perf_counter()
+    plugin.check()
+    elapsed = time.perf_counter() - start
+
+    print(f"\n{count} 个种子：改造前删种计算 {legacy_elapsed:.2f}s，check() {elapsed:.2f}s")
+    # 按条件删除的种子与改造前一致，其余为动态删除阈值触发的按做种时间删除
+    assert legacy_deletes <= set(downloader.deleted)
+    deleted_tasks = plugin.get_data("torrents")
+    assert all(deleted_tasks[torrent_hash]["deleted"] for torrent_hash in downloader.deleted)
+    # check()包含完整的检查流程，仍应快于改造前仅删种条件部分的计算
+    assert elapsed < legacy_elapsed
@@ -0,0 +1,46 @@
+import importlib.util
+from pathlib import Path
+
+import pytest
+
+_spec = importlib.util.spec_from_file_location(
+    "chatgpt_recognizer",
+    Path(__file__).resolve().parents[1] / "plugins.v2" / "chatgpt" / "recognizer.py")
+recognizer = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(recognizer)
+RecognizeCache = recognizer.RecognizeCache
+
+
+@pytest.mark.parametrize("title, pattern, episode", [
+    ("[SubsPlease] Frieren - 05 (1080p) [ABC].mkv", "[subsplease] frieren - {ep} (1080p) [abc].mkv", 5),
+    ("Show.S01E05.1080p.WEB-DL.mkv", "show.s01e{ep}.1080p.web-dl.mkv", 5),
+    ("[Nekomoe] 葬送的芙莉莲 [12][1080p].mp4", "[nekomoe] 葬送的芙莉莲 [{ep}][1080p].mp4", 12),
+    ("庆余年 第12集 4K.mp4", "庆余年 第{ep}集 4k.mp4", 12),
+    ("[Grp] Title - 07v2 [720p]", "[grp] title - {ep}v2 [720p]", 7),
+    # 年份和分辨率不是集数
+    ("Apollo 13 - 1995 BluRay", "apollo 13 - 1995 bluray", None),
+    ("[VCB-Studio] Movie [720]", "[vcb-studio] movie [720]", None),
+    ("The.Matrix.1999.1080p.BluRay.mkv", "the.matrix.1999.1080p.bluray.mkv", None),
+])
+def test_normalize(title, pattern, episode):
+    assert RecognizeCache.normalize(title) == (pattern, episode)
+
+
+def test_episode_backfill(tmp_path):
+    cache = RecognizeCache(str(tmp_path / "recognize_cache.db"))
+    cache.put("v1", "Show.S01E05.mkv", {"name": "Show", "episode": 5})
+    assert cache.get("v1", "show.s01e09.mkv") == {"name": "Show", "episode": 9}
+    # 缓存结果没有集数时不回填
+    cache.put("v1", "[G] Film - 03 [x]", {"name": "Film", "episode": None})
+    assert cache.get("v1", "[G] Film - 04 [x]") == {"name": "Film", "episode": None}
+    # 提示词版本不同时不命中
+    assert cache.get("v2", "Show.S01E05.mkv") is None
+
+
+def test_lru_eviction(tmp_path):
+    cache = RecognizeCache(str(tmp_path / "recognize_cache.db"), maxsize=2)
+    cache.put("v1", "A.2001.mkv", {"name": "A"})
+    cache.put("v1", "B.2002.mkv", {"name": "B"})
+    cache.put("v1", "C.2003.mkv", {"name": "C"})
+    assert cache.get("v1", "A.2001.mkv") is None
+    assert cache.get("v1", "C.2003.mkv") == {"name": "C"}
@@ -0,0 +1,134 @@
+import importlib.util
+import random
+import re
+import sys
+import threading
+import time
+from pathlib import Path
+
+import pytest
+
+spacy = pytest.importorskip("spacy")
+pysubs2 = pytest.importorskip("pysubs2")
+# 插件依赖MoviePilot主程序
+pytest.importorskip("app.plugins")
+try:
+    nlp = spacy.load("en_core_web_sm")
+except OSError:
+    pytest.skip("未安装spaCy模型 en_core_web_sm", allow_module_level=True)
+
+_plugin_path = Path(__file__).resolve().parents[1] / "plugins.v2" / "lexiannot"
+_sample_path = Path(__file__).resolve().parent / "data" / "lexiannot_sample.ass"
+
+
+def _load(name: str, path: Path):
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+# 插件以 app.plugins.lexiannot 包的形式导入 query_gemini
+_load("app.plugins.lexiannot.query_gemini", _plugin_path / "query_gemini.py")
+lexiannot = _load("lexiannot", _plugin_path / "__init__.py")
+LexiAnnot = lexiannot.LexiAnnot
+
+CEFR_LEVELS = ["A1", "A2", "B1", "B2", "C1", "C2"]
+LEXICON_POS = ["noun", "verb", "adjective", "adverb", "preposition", "conjunction", "be-verb", "modal auxiliary"]
+
+
+def _make_lexicons(texts, seed: int = 0):
+    """
+    按字幕中出现的单词生成CEFR及COCA20K词库，并补充无关词条使词库规模接近实际
+    """
+    rng = random.Random(seed)
+    words = {word.lower() for text in texts for word in re.findall(r"[A-Za-z']+", text)}
+    words.update(f"filler{i}" for i in range(8000))
+    cefr_lexicon, coca20k_lexicon = {}, {}
+    for word in sorted(words):
+        cefr_lexicon[word] = [{"pos": rng.choice(LEXICON_POS), "cefr": rng.choice(CEFR_LEVELS)}
+                              for _ in range(rng.randint(1, 4))]
+        if rng.random() < 0.5:
+            coca20k_lexicon[word] = {"phonetics_1": word, "pos_defs": []}
+    return cefr_lexicon, coca20k_lexicon
+
+
+def _lines_to_process():
+    ass_file = pysubs2.load(str(_sample_path))
+    return [{"index": index, "raw_subtitle": event.plaintext, "new_vocab": [], "Chinese": ""}
+            for index, event in enumerate(e for e in ass_file if e.style == "Default")]
+
+
+def _legacy_process(lines_to_process, cefr_lexicon, coca20k_lexicon, swear_words, annot_level):
+    """
+    改造前的分词流程：逐行调用nlp，每个单词重新转换词库词性，按列表去重
+    """
+    simple_vocabulary = list(filter(lambda x: x < annot_level, CEFR_LEVELS))
+    compiled_patterns = [re.compile(r'\d+th|\d?1st|\d?2nd')]
+    for line_data in lines_to_process:
+        text = line_data.get('raw_subtitle').replace('\n', ' ')
+        new_vocab = []
+        doc = nlp(text)
+        last_end_pos = 0
+        lemma_to_query = []
+        for token in doc:
+            if len(token.text) == 1:
+                continue
+            if token.lemma_ in swear_words:
+                continue
+            if token.pos_ not in ('NOUN', 'AUX', 'VERB', 'ADJ', 'ADV', 'ADP', 'CCONJ', 'SCONJ'):
+                continue
+            if any(p.match(token.lemma_) for p in compiled_patterns):
+                continue
+            cefr = LexiAnnot.get_cefr_by_spacy(token, cefr_lexicon)
+            if cefr and cefr in simple_vocabulary:
+                continue
+            res_of_coco = LexiAnnot.query_coca20k(token.lemma_, coca20k_lexicon)
+            if res_of_coco and not cefr:
+                cefr = 'COCA20K'
+            if token.lemma_ in lemma_to_query:
+                continue
+            lemma_to_query.append(token.lemma_)
+            start_pos = text.find(token.text, last_end_pos)
+            end_pos = start_pos + len(token.text)
+            last_end_pos = end_pos
+            new_vocab.append({'start': start_pos, 'end': end_pos, 'lemma': token.lemma_, 'pos': token.pos_,
+                              'cefr': cefr})
+        line_data['new_vocab'] = new_vocab
+    return lines_to_process
+
+
+def _make_plugin():
+    plugin = LexiAnnot.__new__(LexiAnnot)
+    plugin._nlp = nlp
+    plugin._shutdown_event = threading.Event()
+    plugin._annot_level = "B2"
+    plugin._spacy_batch_size = 64
+    plugin._spacy_n_process = 1
+    plugin._gemini_available = False
+    return plugin
+
+
+def test_process_by_ai_benchmark():
+    lines = _lines_to_process()
+    assert len(lines) == 1800
+    cefr_lexicon, coca20k_lexicon = _make_lexicons(line["raw_subtitle"] for line in lines)
+    swear_words = ["damn", "hell"]
+
+    start = time.perf_counter()
+    legacy = _legacy_process(_lines_to_process(), cefr_lexicon, coca20k_lexicon, set(swear_words), "B2")
+    legacy_elapsed = time.perf_counter() - start
+
+    # 词库索引在词库版本更新时才重建，不计入单个文件的处理时间
+    lexicon_index = lexiannot.LexiconIndex(cefr_lexicon, coca20k_lexicon, "bench")
+    start = time.perf_counter()
+    result = _make_plugin()._LexiAnnot__process_by_ai(lines, lexicon_index, swear_words)
+    elapsed = time.perf_counter() - start
+
+    print(f"\n{len(lines)} 行字幕：逐行分词 {legacy_elapsed:.2f}s，批量分词 {elapsed:.2f}s")
+    assert [[(v['start'], v['end'], v['lemma'], v['pos'], v['cefr']) for v in line['new_vocab']]
+            for line in result] == \
+           [[(v['start'], v['end'], v['lemma'], v['pos'], v['cefr']) for v in line['new_vocab']]
+            for line in legacy]
+    assert elapsed < legacy_elapsed
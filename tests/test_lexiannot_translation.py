@@ -0,0 +1,186 @@
+import importlib.util
+import json
+import sys
+import textwrap
+import threading
+import time
+from pathlib import Path
+
+import pytest
+
+for _module in ("spacy", "pysubs2", "pymediainfo", "langdetect"):
+    pytest.importorskip(_module)
+# 插件依赖MoviePilot主程序
+pytest.importorskip("app.plugins")
+
+_plugin_path = Path(__file__).resolve().parents[1] / "plugins.v2" / "lexiannot"
+
+
+def _load(name: str, path: Path):
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+# 插件以 app.plugins.lexiannot 包的形式导入 query_gemini
+query_gemini = _load("app.plugins.lexiannot.query_gemini", _plugin_path / "query_gemini.py")
+lexiannot = _load("lexiannot", _plugin_path / "__init__.py")
+LexiAnnot = lexiannot.LexiAnnot
+
+# 本地模拟Gemini接口：与 query_gemini.py 相同的输入输出格式，记录每次请求的任务数
+GEMINI_STUB = textwrap.dedent('''
+    import json, os, sys, time
+
+    request = json.load(sys.stdin)
+    tasks = request["tasks"]
+    for task in tasks:
+        if "vocabulary" in task:
+            for vocabulary in task["vocabulary"]:
+                vocabulary["Chinese"] = "译" + vocabulary["lemma"]
+        else:
+            task["Chinese"] = "译" + task["original_text"]
+    with open(os.environ["GEMINI_STUB_LOG"], "a") as f:
+        f.write(json.dumps({"schema": request["params"]["schema"], "count": len(tasks)}) + "\\n")
+    time.sleep(float(os.environ.get("GEMINI_STUB_DELAY", "0")))
+    print(json.dumps({"success": True, "data": {"tasks": tasks, "total_token_count": 0}}))
+''')
+
+
+class FakeToken:
+
+    def __init__(self, text: str):
+        self.text = text
+        self.lemma_ = text.lower()
+        self.pos_ = "NOUN" if text.isalpha() and len(text) > 3 else "X"
+
+
+class FakeNlp:
+    """
+    以空格分词的spaCy替身，长度大于3的单词视为名词
+    """
+
+    @staticmethod
+    def pipe(texts, batch_size=64, n_process=1):
+        for text in texts:
+            yield [FakeToken(word.strip(".,?!")) for word in text.split()]
+
+
+@pytest.fixture
+def gemini_stub(tmp_path, monkeypatch):
+    script = tmp_path / "gemini_stub.py"
+    script.write_text(GEMINI_STUB)
+    log = tmp_path / "requests.log"
+    log.touch()
+    monkeypatch.setenv("GEMINI_STUB_LOG", str(log))
+
+    def requests():
+        return [json.loads(line) for line in log.read_text().splitlines()]
+
+    return script, requests
+
+
+def _make_plugin(script: Path, cache_path: Path = None):
+    plugin = LexiAnnot.__new__(LexiAnnot)
+    plugin._nlp = FakeNlp()
+    plugin._shutdown_event = threading.Event()
+    plugin._annot_level = "B2"
+    plugin._gemini_available = True
+    plugin._gemini_model = "gemini-stub"
+    plugin._gemini_apikey = "key"
+    plugin._max_retries = 1
+    plugin._context_window = 2
+    plugin._request_interval = 0
+    plugin._query_workers = 4
+    plugin._sentence_translation = True
+    plugin._model_temperature = "0.3"
+    plugin._spacy_batch_size = 64
+    plugin._spacy_n_process = 1
+    plugin._venv_python = sys.executable
+    plugin._query_gemini_script = str(script)
+    plugin._translation_cache = lexiannot.TranslationCache(str(cache_path)) if cache_path else None
+    return plugin
+
+
+def _lines(texts):
+    return [{"index": i, "time_code": (i * 1000, i * 1000 + 900), "raw_subtitle": text, "new_vocab": [],
+             "Chinese": ""} for i, text in enumerate(texts)]
+
+
+def test_token_bucket_rate():
+    bucket = lexiannot.TokenBucket(rate=20, capacity=2)
+    stop_event = threading.Event()
+    start = time.monotonic()
+    assert all(bucket.acquire(stop_event) for _ in range(6))
+    # 突发2个，其余4个按每秒20个发放
+    assert time.monotonic() - start >= 0.15
+    stop_event.set()
+    assert not bucket.acquire(stop_event)
+
+
+def test_token_bucket_unlimited():
+    bucket = lexiannot.TokenBucket(rate=0, capacity=1)
+    stop_event = threading.Event()
+    assert all(bucket.acquire(stop_event) for _ in range(100))
+
+
+def test_translation_cache(tmp_path):
+    cache = lexiannot.TranslationCache(str(tmp_path / "translation.db"))
+    hashes = [lexiannot.TranslationCache.hash_context(f"line {i}") for i in range(1200)]
+    cache.put_many([("m", f"word{i}", context_hash, f"词{i}") for i, context_hash in enumerate(hashes)])
+    cache.put_many([("other", "word0", hashes[0], "其它模型")])
+    keys = {("m", f"word{i}", context_hash) for i, context_hash in enumerate(hashes)}
+    # 超过单条SQL参数上限时分批查询
+    result = cache.get_many(keys | {("m", "missing", hashes[0])})
+    assert len(result) == 1200
+    assert result[("m", "word7", hashes[7])] == "词7"
+    assert cache.get_many({("other", "word0", hashes[0])}) == {("other", "word0", hashes[0]): "其它模型"}
+    assert cache.get_many(set()) == {}
+
+
+def test_run_gemini_windows_concurrently(gemini_stub, monkeypatch):
+    script, requests = gemini_stub
+    monkeypatch.setenv("GEMINI_STUB_DELAY", "0.3")
+    plugin = _make_plugin(script)
+    lines = _lines([f"sentence {i}" for i in range(16)])
+    lines_by_index = {line["index"]: line for line in lines}
+    tasks = [query_gemini.DialogueTranslationTask(index=line["index"], original_text=line["raw_subtitle"],
+                                                  Chinese="") for line in lines]
+    windows = [(range(i, i + 2), tasks[i:i + 2]) for i in range(0, len(tasks), 2)]
+    merged = {}
+
+    def merge(accepted, answer):
+        for task in answer:
+            if task.index in accepted:
+                merged[task.index] = task.Chinese
+
+    start = time.monotonic()
+    plugin._LexiAnnot__run_gemini_windows(windows, query_gemini.DialogueTranslationTask, "instruction", 0.3,
+                                          lines_by_index, merge)
+    elapsed = time.monotonic() - start
+    assert merged == {line["index"]: "译" + line["raw_subtitle"] for line in lines}
+    assert len(requests()) == 8
+    # 8个窗口由4个线程并发处理，耗时明显少于逐个请求
+    assert elapsed < 8 * 0.3
+
+
+def test_process_by_ai_uses_translation_cache(gemini_stub, tmp_path):
+    script, requests = gemini_stub
+    texts = ["The detective examined the evidence.", "Nobody expected the confession.",
+             "The evidence was fabricated.", "Keep your voice down."]
+    words = {word.strip(".").lower() for text in texts for word in text.split()}
+    lexicon_index = lexiannot.LexiconIndex({word: [{"pos": "noun", "cefr": "C1"}] for word in words}, {}, "test")
+    cache_path = tmp_path / "translation.db"
+
+    lines = _make_plugin(script, cache_path)._LexiAnnot__process_by_ai(_lines(texts), lexicon_index, [])
+    assert lines[0]["Chinese"] == "译" + texts[0]
+    assert [v["Chinese"] for v in lines[0]["new_vocab"]] == ["译detective", "译examined", "译evidence"]
+    assert {request["schema"] for request in requests()} == {"VocabularyTranslationTask", "DialogueTranslationTask"}
+    first_requests = len(requests())
+
+    # 重新处理相同字幕时全部命中缓存，不再发送请求
+    lines = _make_plugin(script, cache_path)._LexiAnnot__process_by_ai(_lines(texts), lexicon_index, [])
+    assert len(requests()) == first_requests
+    assert lines[2]["Chinese"] == "译" + texts[2]
+    assert [v["Chinese"] for v in lines[2]["new_vocab"]] == ["译evidence", "译fabricated"]
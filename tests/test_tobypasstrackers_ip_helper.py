@@ -0,0 +1,111 @@
+import importlib.util
+import ipaddress
+import random
+import time
+from pathlib import Path
+
+import pytest
+
+_spec = importlib.util.spec_from_file_location(
+    "tobypasstrackers_ip_helper",
+    Path(__file__).resolve().parents[1] / "plugins.v2" / "tobypasstrackers" / "ip_helper.py")
+ip_helper = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(ip_helper)
+IpRangeIndex = ip_helper.IpRangeIndex
+
+
+def _exclude_baseline(ranges, ip):
+    """
+    原线性实现：在原始网段中查找并排除IPv4地址
+    """
+    ranges = list(ranges)
+    for index, ip_range in enumerate(ranges):
+        network = ipaddress.ip_network(ip_range, strict=False)
+        if ipaddress.ip_address(ip) in network:
+            ranges.pop(index)
+            if network.prefixlen < 12:
+                ranges.extend(str(net) for net in network.address_exclude(
+                    ipaddress.ip_network(f"{ip}/{network.prefixlen + 8}", strict=False)))
+            break
+    return ranges
+
+
+def _addresses(text):
+    return set(ipaddress.collapse_addresses(ipaddress.ip_network(line) for line in text.splitlines() if line))
+
+
+@pytest.mark.parametrize("ranges, ip", [
+    # 相邻的/16合并后为/12，排除时只能移除所属的原始/16
+    ([f"36.{i}.0.0/16" for i in range(96, 112)], "36.100.1.1"),
+    # 大网段只排除IP附近的子网段
+    (["10.0.0.0/8", "11.0.0.0/8"], "10.20.30.40"),
+    (["1.0.1.0/24", "1.0.2.0/23", "1.0.8.0/21"], "1.0.3.7"),
+    # 不在任何网段中
+    (["1.0.1.0/24"], "8.8.8.8"),
+])
+def test_exclude_matches_baseline(ranges, ip):
+    index = IpRangeIndex(ranges)
+    index.exclude(ip, max_prefixlen=12, max_exclude_prefixlen=32)
+    expected = "\n".join(_exclude_baseline(ranges, ip))
+    assert _addresses(index.to_text(4)) == _addresses(expected)
+    assert index.find(ip) is None
+
+
+def test_adjacent_block_regression():
+    index = IpRangeIndex([f"36.{i}.0.0/16" for i in range(96, 112)])
+    assert index.to_text(4) == "36.96.0.0/12"
+    index.exclude("36.100.1.1", max_prefixlen=12, max_exclude_prefixlen=32)
+    assert index.find("36.100.1.1") is None
+    assert str(index.find("36.101.0.1")) == "36.101.0.0/16"
+    assert index.to_text(4).splitlines() == ["36.96.0.0/14", "36.101.0.0/16", "36.102.0.0/15", "36.104.0.0/13"]
+
+
+def test_ipv6_exclude():
+    index = IpRangeIndex(["2001:db8::/32", "2400:cb00::/32", "1.0.1.0/24"])
+    index.exclude("2001:db8::1", max_prefixlen=32, max_exclude_prefixlen=32)
+    assert index.find("2001:db8::1") is None
+    assert str(index.find("2400:cb00::1")) == "2400:cb00::/32"
+    assert index.to_text(4) == "1.0.1.0/24"
+
+
+def test_duplicate_and_nested_ranges():
+    index = IpRangeIndex(["10.0.0.0/8", "10.1.0.0/16", "10.0.0.0/8", "bad-range", ""])
+    assert str(index.find("10.1.2.3")) == "10.0.0.0/8"
+    assert index.to_text(4) == "10.0.0.0/8"
+
+
+def test_lookup_benchmark():
+    rng = random.Random(0)
+    ranges = sorted({f"{rng.randint(1, 223)}.{rng.randint(0, 255)}.0.0/16" for _ in range(8000)})
+    ips = [f"{rng.randint(1, 223)}.{rng.randint(0, 255)}.{rng.randint(0, 255)}.1" for _ in range(10000)]
+
+    start = time.perf_counter()
+    index = IpRangeIndex(ranges)
+    hits = sum(1 for ip in ips if index.find(ip))
+    elapsed = time.perf_counter() - start
+
+    networks = [ipaddress.ip_network(r) for r in ranges]
+    sample = ips[:50]
+    assert sum(1 for ip in sample if index.find(ip)) == \
+        sum(1 for ip in sample if any(ipaddress.ip_address(ip) in net for net in networks))
+    assert hits > 0
+    assert elapsed < 5
+
+
+def test_covered_range_kept_after_exclude():
+    # 被chnroute网段包含的tracker网段，外层网段被移除后仍需保留
+    index = IpRangeIndex(["1.2.3.0/24", "1.2.3.4/32"])
+    index.exclude("1.2.3.9", max_prefixlen=12, max_exclude_prefixlen=32)
+    assert index.to_text(4) == "1.2.3.4/32"
+    # 被包含的网段本身包含排除的IP时一并移除
+    index = IpRangeIndex(["1.2.3.0/24", "1.2.3.4/32"])
+    index.exclude("1.2.3.4", max_prefixlen=12, max_exclude_prefixlen=32)
+    assert index.to_text(4) == ""
+    # 大网段拆分后，落在剩余子网段中的被包含网段不重复输出
+    index = IpRangeIndex(["10.0.0.0/8", "10.200.0.0/16", "10.20.1.0/24"])
+    index.exclude("10.20.30.40", max_prefixlen=12, max_exclude_prefixlen=32)
+    assert index.find("10.20.30.40") is None
+    assert str(index.find("10.20.1.1")) == "10.20.1.0/24"
+    assert _addresses(index.to_text(4)) == _addresses(
+        "\n".join(str(n) for n in ipaddress.ip_network("10.0.0.0/8").address_exclude(
+            ipaddress.ip_network("10.20.0.0/16"))) + "\n10.20.1.0/24")